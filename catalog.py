@@ -0,0 +1,859 @@
+"""
+Catalog Loading for Sofas & Stuff Pricing Platform
+
+The translation dictionaries (products, sizes, covers, fabrics) and every
+index built from them, held together in one Catalog object.
+
+Cold start used to parse all four JSON files and then build the indexes.
+sku_discovery_tool.py now also writes catalog.snapshot: a versioned binary
+(pickle) image of a fully built Catalog. main.py loads it in one step and
+falls back to the JSON files when the snapshot is missing, was written by an
+older index format, or doesn't match the JSON files next to it.
+
+Fabric records are most of the catalogue, but a request only needs one
+product's fabrics. fabrics.shards stores them per product (one JSON blob per
+product SKU behind an offset index); FabricShards memory-maps it and keeps
+only the recently used products' fabrics parsed (bounded LRU).
+
+The same fabric/colour is offered on most products, and fabrics.json repeats
+its full record (desc, image URLs...) under every product. In memory each
+distinct record exists once, as a slotted FabricRecord with interned strings,
+and a product's fabric map only points at the shared records. fabrics.shards
+stores them the same way: a record table (one blob per record behind an
+offset array) plus per-product keyword -> record id maps. Records are parsed
+when a product that uses them is, and freed with the last product holding
+them; the colour index keeps record ids, not records.
+
+Usage:
+    from catalog import load_catalog
+
+    catalog = load_catalog(os.path.dirname(__file__))
+    catalog.query_parser.parse("alwinton snuggler pacific")
+
+A running instance holds its catalog in a CatalogManager, which can load a
+fresh scrape (from a local folder or an object store) and swap it in without
+a restart: the new Catalog is built completely, then replaces the old one in
+a single reference assignment.
+
+The snapshot is only ever read from our own deploy directory (pickle must
+never be loaded from untrusted sources).
+"""
+
+import gc
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from matching import (register_indexes, forget_indexes, get_fuzzy_index,
+                      QueryParser, ColorIndex, ProductPriceIndex, ProductNameIndex)
+
+CATALOG_FILES = ("products.json", "sizes.json", "covers.json", "fabrics.json")
+SNAPSHOT_FILE = "catalog.snapshot"
+SNAPSHOT_MAGIC = b"SSCATALOG\n"
+# Bump whenever an index class in matching.py changes its attributes: older
+# snapshots are then ignored (rebuilt from JSON) instead of unpickled wrong
+SNAPSHOT_FORMAT = 8
+SHARDS_FILE = "fabrics.shards"
+SHARDS_MAGIC = b"SSFABRICS\n"
+SHARDS_FORMAT = 4
+# Record fields ColorIndex is built from, stored as columns so it never parses records
+COLOR_COLUMNS = ("fabric_sku", "color_sku", "fabric_name", "color_name", "tier", "color_families")
+
+# Keys of a fabric record, as written by sku_discovery_tool.discover_fabrics_via_api
+FABRIC_FIELDS = ("fabric_sku", "color_sku", "fabric_name", "color_name", "collection", "tier",
+                 "desc", "swatch_url", "full_image_url", "fabric_id", "color_id", "color_families")
+
+
+def file_digests(directory):
+    """
+    MD5 of each catalog JSON file present in directory.
+
+    Returns:
+        dict: filename -> hex digest (missing files are left out)
+    """
+    digests = {}
+    for filename in CATALOG_FILES:
+        path = os.path.join(directory, filename)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                digests[filename] = hashlib.md5(f.read()).hexdigest()
+    return digests
+
+
+def catalog_version(digests):
+    """Short content version for a set of catalog files (changes with any file)."""
+    joined = ";".join(f"{name}:{digests.get(name, '')}" for name in CATALOG_FILES)
+    return hashlib.md5(joined.encode()).hexdigest()[:12]
+
+
+class FabricRecord(Mapping):
+    """
+    One fabric/colour, shared by every product that offers it.
+
+    A read-only mapping with the same keys as the fabrics.json dict it came
+    from (fabric_record['tier'], .get('desc', ''), 'fabric_sku' in ...), so
+    handlers use it exactly like the dict. Keys the source dict didn't have
+    are absent here too. Strings are interned and color_families is a tuple.
+    Weak-referenceable, so FabricShards can share a record between resident
+    products without keeping it alive.
+
+    Args:
+        data (dict): Fabric data using only FABRIC_FIELDS keys
+    """
+    __slots__ = FABRIC_FIELDS + ("__weakref__",)
+
+    def __init__(self, data):
+        for field, value in data.items():
+            setattr(self, field, value)
+
+    def __getitem__(self, key):
+        if key in FABRIC_FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in FABRIC_FIELDS:
+            return getattr(self, key, default)
+        return default
+
+    def __iter__(self):
+        return (field for field in FABRIC_FIELDS if hasattr(self, field))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        return key in FABRIC_FIELDS and hasattr(self, key)
+
+    def __repr__(self):
+        return f"FabricRecord({dict(self)!r})"
+
+
+def _intern_value(value):
+    """Interned copy of a fabric field value (lists become tuples), or value unchanged."""
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        return tuple(sys.intern(item) for item in value)
+    return value
+
+
+class FabricTable:
+    """
+    Deduplicating table of FabricRecords.
+
+    Identical fabric dicts (same keys and values) map to one record id, so a
+    colour offered on 90 products is stored once.
+    """
+    def __init__(self):
+        self.records = []
+        self._ids = {}  # field values -> record id
+
+    def add(self, data):
+        """
+        Adds fabric data to the table.
+
+        Args:
+            data: A value from a product's fabric map
+
+        Returns:
+            int or None: Record id, or None if data can't be a FabricRecord
+            (mattress tension strings, dicts with other keys) - keep it as is
+        """
+        if not isinstance(data, dict) or not data.keys() <= set(FABRIC_FIELDS):
+            return None
+        values = {field: _intern_value(value) for field, value in data.items()}
+        key = tuple((field, values[field]) for field in FABRIC_FIELDS if field in values)
+        try:
+            record_id = self._ids.get(key)
+        except TypeError:
+            return None  # Unhashable value (nested dict)
+        if record_id is None:
+            record_id = len(self.records)
+            self.records.append(FabricRecord(values))
+            self._ids[key] = record_id
+        return record_id
+
+    def compact(self, fabric_map):
+        """
+        Returns fabric_map with interned keywords and shared records in place of dicts.
+
+        Args:
+            fabric_map (dict): keyword -> fabric data for one product
+        """
+        compacted = {}
+        for keyword, data in fabric_map.items():
+            record_id = self.add(data)
+            compacted[sys.intern(keyword)] = data if record_id is None else self.records[record_id]
+        return compacted
+
+
+def compact_fabrics(fabrics):
+    """
+    Deduplicates FABRIC_SKU_MAP as loaded from fabrics.json.
+
+    Args:
+        fabrics (dict): product SKU -> {keyword: fabric data}
+
+    Returns:
+        dict: Same shape, every fabric dict replaced by its shared FabricRecord
+    """
+    table = FabricTable()
+    return {product_sku: table.compact(fabric_map) for product_sku, fabric_map in fabrics.items()}
+
+
+def write_fabric_shards(fabrics, path, source_digest):
+    """
+    Writes FABRIC_SKU_MAP as per-product shards, atomically.
+
+    Layout: SHARDS_MAGIC, 8-byte little-endian header length, JSON header
+    ({"format", "source", "records": [offset, count], "keywords": [offset,
+    length], "colors": [offset, length], "shards": {sku: [offset, length]}}),
+    then the data (offsets from the end of the header):
+      - per product, a compact UTF-8 JSON {keyword: record id} map (values
+        that aren't fabric records, e.g. mattress tensions, are stored as
+        they are)
+      - one JSON blob per distinct fabric record
+      - the records' offset array: count + 1 little-endian uint64 (record i
+        spans offsets[i]:offsets[i + 1])
+      - a JSON list of every distinct fabric keyword
+      - a JSON object of colour columns: one list per COLOR_COLUMNS field
+        (indexed by record id, null where a record lacks the field) and
+        "products": {sku: [distinct record ids in mapping order]}
+
+    Args:
+        fabrics (dict): product SKU -> {keyword: fabric data}
+        path (str): Shards file path
+        source_digest (str): MD5 of the fabrics.json it was built from
+
+    Returns:
+        int: File size in bytes
+    """
+    table = FabricTable()
+    blobs = []
+    offsets = {}
+    product_records = {}
+    position = 0
+    for product_sku, fabric_map in fabrics.items():
+        shard = {}
+        for keyword, data in fabric_map.items():
+            record_id = table.add(data)
+            shard[keyword] = data if record_id is None else record_id
+        product_records[product_sku] = list(dict.fromkeys(value for value in shard.values() if type(value) is int))
+        blob = json.dumps(shard, separators=(',', ':')).encode('utf-8')
+        offsets[product_sku] = [position, len(blob)]
+        blobs.append(blob)
+        position += len(blob)
+    record_offsets = [position]
+    for record in table.records:
+        blob = json.dumps(dict(record), separators=(',', ':')).encode('utf-8')
+        blobs.append(blob)
+        position += len(blob)
+        record_offsets.append(position)
+    blobs.append(struct.pack(f'<{len(record_offsets)}Q', *record_offsets))
+    records_at = position
+    position += 8 * len(record_offsets)
+    keywords = list(dict.fromkeys(keyword for fabric_map in fabrics.values() for keyword in fabric_map))
+    keywords_blob = json.dumps(keywords, separators=(',', ':')).encode('utf-8')
+    blobs.append(keywords_blob)
+    keywords_at = position
+    position += len(keywords_blob)
+    colors = {field: [record.get(field) for record in table.records] for field in COLOR_COLUMNS}
+    colors["products"] = product_records
+    colors_blob = json.dumps(colors, separators=(',', ':')).encode('utf-8')
+    blobs.append(colors_blob)
+    header = json.dumps({
+        "format": SHARDS_FORMAT,
+        "source": source_digest,
+        "records": [records_at, len(table.records)],
+        "keywords": [keywords_at, len(keywords_blob)],
+        "colors": [position, len(colors_blob)],
+        "shards": offsets
+    }).encode('utf-8')
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(SHARDS_MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+class FabricShards(Mapping):
+    """
+    FABRIC_SKU_MAP backed by fabrics.shards: product SKU -> fabric map,
+    parsed on first access and kept in a bounded LRU.
+
+    A parsed shard maps its keywords to shared FabricRecords, read from the
+    file's record table on demand and kept only while some resident shard
+    (or caller) still uses them.
+
+    Behaves like the read-only dict it replaces (get, [], in, iteration over
+    product SKUs). A shard evicted from the LRU is parsed again from the
+    memory-mapped file on its next use; its cached matchers are dropped with
+    it (see matching.forget_indexes).
+
+    Pickles as just the file name and settings (the snapshot doesn't carry
+    fabric data); call open() with the deploy directory after unpickling.
+
+    Args:
+        path (str): fabrics.shards path
+        max_resident (int): Products whose fabrics stay parsed (default: 32)
+    """
+    def __init__(self, path, max_resident=32):
+        self.filename = os.path.basename(path)
+        self.max_resident = max_resident
+        self._reset()
+        self.open(os.path.dirname(path))
+
+    def _reset(self):
+        self.path = None
+        self.source = None
+        self._offsets = {}
+        self._records_at = 0
+        self._record_count = 0
+        self._keywords_at = (0, 0)
+        self._colors_at = (0, 0)
+        self._live = weakref.WeakValueDictionary()  # record id -> FabricRecord in use
+        self._data_start = 0
+        self._mm = None
+        self._resident = OrderedDict()  # product SKU -> fabric map (LRU order)
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def open(self, directory):
+        """
+        Maps the shards file and reads its offset index.
+
+        Raises:
+            ValueError: If the file isn't a shards file of SHARDS_FORMAT
+            OSError: If it can't be opened
+        """
+        path = os.path.join(directory, self.filename)
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mm[:len(SHARDS_MAGIC)] != SHARDS_MAGIC:
+            mm.close()
+            raise ValueError(f"{path} is not a fabric shards file")
+        header_start = len(SHARDS_MAGIC) + 8
+        (header_length,) = struct.unpack('<Q', mm[len(SHARDS_MAGIC):header_start])
+        header = json.loads(mm[header_start:header_start + header_length])
+        if header.get("format") != SHARDS_FORMAT:
+            mm.close()
+            raise ValueError(f"{path} has format {header.get('format')} (expected {SHARDS_FORMAT})")
+        data_start = header_start + header_length
+
+        with self._lock:
+            self.path = path
+            self.source = header.get("source")
+            self._offsets = header["shards"]
+            self._records_at, self._record_count = header["records"]
+            self._keywords_at = tuple(header["keywords"])
+            self._colors_at = tuple(header["colors"])
+            self._live = weakref.WeakValueDictionary()
+            self._data_start = data_start
+            self._mm = mm
+            self._resident.clear()
+
+    def __getstate__(self):
+        return {"filename": self.filename, "max_resident": self.max_resident}
+
+    def __setstate__(self, state):
+        self.filename = state["filename"]
+        self.max_resident = state["max_resident"]
+        self._reset()
+
+    def __getitem__(self, product_sku):
+        with self._lock:
+            fabric_map = self._resident.get(product_sku)
+            if fabric_map is not None:
+                self._resident.move_to_end(product_sku)
+                return fabric_map
+            fabric_map = {sys.intern(keyword): self._record(value) if type(value) is int else value
+                          for keyword, value in self._shard(product_sku).items()}
+            self.loads += 1
+            self._resident[product_sku] = fabric_map
+            evicted = []
+            while len(self._resident) > self.max_resident:
+                evicted.append(self._resident.popitem(last=False)[1])
+                self.evictions += 1
+        for old_map in evicted:
+            forget_indexes(old_map)
+        return fabric_map
+
+    def _shard(self, product_sku):
+        """Parsed {keyword: record id or raw value} blob of one product."""
+        offset, length = self._offsets[product_sku]  # KeyError for unknown SKUs, like a dict
+        start = self._data_start + offset
+        return json.loads(self._mm[start:start + length])
+
+    def _record(self, record_id):
+        """record() without the lock (caller holds it)."""
+        record = self._live.get(record_id)
+        if record is None:
+            if not 0 <= record_id < self._record_count:
+                raise KeyError(record_id)
+            start, end = struct.unpack_from('<QQ', self._mm, self._data_start + self._records_at + 8 * record_id)
+            data = json.loads(self._mm[self._data_start + start:self._data_start + end])
+            record = FabricRecord({field: _intern_value(value) for field, value in data.items()})
+            self._live[record_id] = record
+        return record
+
+    def record(self, record_id):
+        """
+        Returns one fabric record by id (the same object while it is in use).
+
+        Raises:
+            KeyError: For an id not in the file
+        """
+        with self._lock:
+            return self._record(record_id)
+
+    def keywords(self):
+        """Every distinct fabric keyword, over all products (read from the file, not kept)."""
+        offset, length = self._keywords_at
+        start = self._data_start + offset
+        return json.loads(self._mm[start:start + length])
+
+    def color_columns(self):
+        """
+        Colour fields of every record, as columns (read from the file, not kept).
+
+        Returns:
+            dict: COLOR_COLUMNS field -> list indexed by record id (None where
+                a record lacks the field), plus "products": {sku: [record ids]}
+        """
+        offset, length = self._colors_at
+        start = self._data_start + offset
+        return json.loads(self._mm[start:start + length])
+
+    def __iter__(self):
+        return iter(self._offsets)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def release(self):
+        """Drops every parsed shard and its cached matchers (e.g. once the catalog is replaced)."""
+        with self._lock:
+            released = list(self._resident.values())
+            self._resident.clear()
+        for fabric_map in released:
+            forget_indexes(fabric_map)
+
+    def __contains__(self, product_sku):
+        return product_sku in self._offsets
+
+    def stats(self):
+        """Returns shard residency statistics for /health."""
+        with self._lock:
+            return {
+                "products": len(self._offsets),
+                "records": self._record_count,
+                "records_in_use": len(self._live),
+                "resident": len(self._resident),
+                "max_resident": self.max_resident,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "file_bytes": len(self._mm) if self._mm is not None else 0
+            }
+
+
+def open_fabric_shards(directory, fabrics_digest=None, max_resident=32):
+    """
+    Opens fabrics.shards if it exists and was built from the current fabrics.json.
+
+    Args:
+        directory (str): Deploy folder
+        fabrics_digest (str): MD5 of fabrics.json, or None if it isn't deployed
+        max_resident (int): See FabricShards
+
+    Returns:
+        FabricShards or None
+    """
+    path = os.path.join(directory, SHARDS_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        shards = FabricShards(path, max_resident=max_resident)
+    except (OSError, ValueError) as e:
+        print(f"[WARNING] {SHARDS_FILE} not used: {e}")
+        return None
+    if fabrics_digest and shards.source != fabrics_digest:
+        print(f"[WARNING] {SHARDS_FILE} not used: stale (fabrics.json changed since it was built)")
+        return None
+    return shards
+
+
+class Catalog:
+    """
+    Translation dictionaries plus every index built from them.
+
+    Args:
+        products (dict): PRODUCT_SKU_MAP
+        sizes (dict): SIZE_SKU_MAP
+        covers (dict): COVERS_SKU_MAP
+        fabrics (dict or FabricShards): FABRIC_SKU_MAP (dict values should
+            already be compacted, see compact_fabrics)
+        version (str): Content version (see catalog_version)
+    """
+    def __init__(self, products, sizes, covers, fabrics, version=None):
+        self.products = products
+        self.sizes = sizes
+        self.covers = covers
+        self.fabrics = fabrics
+        self.version = version
+        self.source = "json"
+        self.built_at = time.time()
+
+        # Single-pass parser over all four dictionaries (see main.resolve_query).
+        # Per-mapping KeywordMatchers are only needed on its regex fallback
+        # path, so get_matcher compiles them on first use
+        self.query_parser = QueryParser(products, sizes, covers, fabrics)
+        self.fuzzy_indexes = [get_fuzzy_index(products)]
+
+        # Tool handler indexes (fabric colours, budget prices, product names)
+        self.color_index = ColorIndex(fabrics)
+        self.price_index = ProductPriceIndex(products)
+        self.product_names = ProductNameIndex(products)
+
+    def register(self):
+        """Makes this catalog's prebuilt fuzzy indexes the ones get_fuzzy_index returns."""
+        register_indexes(fuzzy_indexes=self.fuzzy_indexes)
+
+    def unregister(self):
+        """Drops this catalog's matchers from the matcher caches (after it has been replaced)."""
+        mappings = [self.products, *self.sizes.values(), *self.covers.values()]
+        if not isinstance(self.fabrics, FabricShards):
+            mappings += self.fabrics.values()
+        for mapping in mappings:
+            forget_indexes(mapping)
+        if isinstance(self.fabrics, FabricShards):
+            self.fabrics.release()
+
+    def stats(self):
+        """Returns catalog info for /health."""
+        return {
+            "version": self.version,
+            "source": self.source,
+            "products": len(self.products),
+            "fabric_colours": self.color_index.size,
+            "fabric_shards": self.fabrics.stats() if isinstance(self.fabrics, FabricShards) else {"enabled": False},
+            "built_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.built_at))
+        }
+
+
+def load_catalog_from_json(directory, json_loader=None, shards=True, max_resident=32):
+    """
+    Builds a Catalog from the four JSON files.
+
+    Args:
+        directory (str): Folder holding the JSON files
+        json_loader (callable): filename -> parsed data (default: json.load
+            from directory). main.py passes load_json_file for its error messages.
+        shards (bool): Read fabrics from an up-to-date fabrics.shards instead
+            of fabrics.json
+        max_resident (int): See FabricShards
+
+    Returns:
+        Catalog: Freshly built catalog (source "json")
+    """
+    if json_loader is None:
+        def json_loader(filename):
+            with open(os.path.join(directory, filename), 'r', encoding='utf-8') as f:
+                return json.load(f)
+    digests = file_digests(directory)
+    fabrics = None
+    if shards:
+        fabrics = open_fabric_shards(directory, digests.get("fabrics.json"), max_resident)
+    if fabrics is None:
+        fabrics = compact_fabrics(json_loader("fabrics.json"))
+    products, sizes, covers = (json_loader(filename) for filename in CATALOG_FILES[:3])
+    return Catalog(products, sizes, covers, fabrics, version=catalog_version(digests))
+
+
+def write_snapshot(catalog, path, digests):
+    """
+    Writes a catalog snapshot (header + pickled Catalog), atomically.
+
+    Args:
+        catalog (Catalog): Catalog to save
+        path (str): Snapshot file path
+        digests (dict): file_digests() of the JSON files it was built from
+
+    Returns:
+        int: Snapshot size in bytes
+    """
+    header = {
+        "format": SNAPSHOT_FORMAT,
+        "version": catalog.version,
+        "sources": digests,
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC)
+        pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(catalog, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def build_snapshot(directory, path=None):
+    """
+    Writes fabrics.shards and the catalog snapshot from the JSON files in directory.
+
+    Used by sku_discovery_tool.py right after it writes the JSON files.
+
+    Returns:
+        tuple: (Catalog, snapshot size in bytes)
+    """
+    digests = file_digests(directory)
+    with open(os.path.join(directory, "fabrics.json"), 'r', encoding='utf-8') as f:
+        write_fabric_shards(json.load(f), os.path.join(directory, SHARDS_FILE), digests["fabrics.json"])
+    catalog = load_catalog_from_json(directory)
+    size = write_snapshot(catalog, path or os.path.join(directory, SNAPSHOT_FILE), digests)
+    return catalog, size
+
+
+def read_snapshot(path, expected_digests=None):
+    """
+    Loads a catalog snapshot if it is usable.
+
+    Args:
+        path (str): Snapshot file path
+        expected_digests (dict): file_digests() of the JSON files deployed
+            with it. A snapshot built from different files is stale (files
+            not deployed, e.g. fabrics.json next to fabrics.shards, aren't
+            compared). None skips the check.
+
+    Returns:
+        tuple: (Catalog or None, reason) - reason says why it wasn't used
+    """
+    try:
+        with open(path, 'rb') as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                return None, "not a catalog snapshot"
+            header = pickle.load(f)
+            if header.get("format") != SNAPSHOT_FORMAT:
+                return None, f"format {header.get('format')} (expected {SNAPSHOT_FORMAT})"
+            sources = header.get("sources", {})
+            if expected_digests and any(sources.get(name) != digest for name, digest in expected_digests.items()):
+                return None, "stale (JSON files changed since it was built)"
+            # Unpickling allocates many small objects; pausing the cyclic GC
+            # stops it from rescanning the growing heap over and over
+            gc_was_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                catalog = pickle.load(f)
+            finally:
+                if gc_was_enabled:
+                    gc.enable()
+    except FileNotFoundError:
+        return None, "missing"
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+        return None, f"unreadable ({type(e).__name__}: {e})"
+
+    catalog.source = "snapshot"
+    if isinstance(catalog.fabrics, FabricShards):
+        # Fabric data lives next to the snapshot, not inside it
+        try:
+            catalog.fabrics.open(os.path.dirname(path))
+        except (OSError, ValueError) as e:
+            return None, f"fabric shards unusable ({e})"
+        if catalog.fabrics.source != sources.get("fabrics.json"):
+            return None, f"{SHARDS_FILE} doesn't match the snapshot"
+    return catalog, None
+
+
+def load_catalog(directory, json_loader=None, use_snapshot=True, verify_snapshot=True,
+                 shards=True, max_resident=32):
+    """
+    Loads the catalog: snapshot if usable, otherwise JSON files + index build.
+
+    Args:
+        directory (str): Deploy folder (JSON files, fabrics.shards, catalog.snapshot)
+        json_loader (callable): See load_catalog_from_json
+        use_snapshot (bool): Try catalog.snapshot first
+        verify_snapshot (bool): Check the snapshot against the JSON files'
+            digests (hashing is much cheaper than parsing)
+        shards (bool): Keep fabrics in fabrics.shards (lazy, per product)
+            rather than fully in memory
+        max_resident (int): Products whose fabrics stay parsed (see FabricShards)
+
+    Returns:
+        Catalog: Loaded catalog, registered with the matcher caches
+
+    Side effects:
+        Prints which source was used and how long loading took
+    """
+    started = time.time()
+    catalog = None
+    if use_snapshot:
+        digests = file_digests(directory) if verify_snapshot else None
+        catalog, reason = read_snapshot(os.path.join(directory, SNAPSHOT_FILE), digests)
+        if catalog is not None and isinstance(catalog.fabrics, FabricShards) != shards:
+            catalog, reason = None, "built with a different fabric storage setting"
+        if catalog is None:
+            print(f"[INFO] Catalog snapshot not used: {reason}. Loading JSON files.")
+        elif shards:
+            catalog.fabrics.max_resident = max_resident
+
+    if catalog is None:
+        catalog = load_catalog_from_json(directory, json_loader, shards=shards, max_resident=max_resident)
+
+    catalog.register()
+    print(f"Catalog {catalog.version} loaded from {catalog.source} in {(time.time() - started) * 1000:.0f}ms")
+    return catalog
+
+
+class CatalogManager:
+    """
+    Holds the live Catalog and replaces it with freshly loaded ones.
+
+    Readers take `manager.current` once per request and use that Catalog
+    throughout. reload() loads the new catalog completely (snapshot, or JSON
+    files plus every index) before swapping the reference, so requests never
+    see a half-built or mixed catalog and are never blocked by a reload.
+
+    Args:
+        directory (str): Deploy folder the first catalog is loaded from
+        json_loader (callable): See load_catalog_from_json (deploy folder only)
+        reload_directory (str): Local folder reload() reads (default: directory)
+        fetch (callable): staging folder -> None. Downloads the catalog files
+            into the folder (e.g. from an object store); when set, reload()
+            uses it instead of reload_directory. Fetched folders are always
+            loaded from JSON (+ fabrics.shards): a snapshot there is never
+            unpickled.
+        on_swap (callable): (old Catalog, new Catalog) -> None, called after
+            every swap (cache invalidation)
+        staging_root (str): Where fetch() staging folders are created
+            (default: the system temp folder)
+        force_interval (float): Minimum seconds between forced reloads
+            (each one swaps the catalog and so clears the price caches)
+        **load_options: Passed to load_catalog (use_snapshot, verify_snapshot,
+            shards, max_resident)
+    """
+    def __init__(self, directory, json_loader=None, reload_directory=None, fetch=None, on_swap=None,
+                 staging_root=None, force_interval=300, **load_options):
+        self.reload_directory = reload_directory or directory
+        self.fetch = fetch
+        self.on_swap = on_swap
+        self.staging_root = staging_root
+        self.load_options = load_options
+        self.force_interval = force_interval
+        self._last_forced = None  # time.time() of the last forced reload
+        self.reloads = 0
+        self.failures = 0
+        self.last_reload = {"status": "never_run"}
+        self._reload_lock = threading.Lock()
+        self._staging = None  # Staging folder the current catalog was loaded from
+        self.current = load_catalog(directory, json_loader=json_loader, **load_options)
+
+    @property
+    def version(self):
+        return self.current.version
+
+    def _load(self):
+        """Loads a catalog from the reload source. Returns (Catalog, staging folder or None)."""
+        if not self.fetch:
+            return load_catalog(self.reload_directory, **self.load_options), None
+        staging = tempfile.mkdtemp(prefix="catalog-", dir=self.staging_root)
+        try:
+            self.fetch(staging)
+            return load_catalog(staging, **{**self.load_options, "use_snapshot": False}), staging
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+    def reload(self, force=False):
+        """
+        Loads the catalog from the reload source and swaps it in.
+
+        Only one reload runs at a time. A catalog with the same version as the
+        live one is dropped unless force is set; forced reloads are limited
+        to one per force_interval. The replaced catalog stays usable for
+        requests still holding it.
+
+        Args:
+            force (bool): Swap even if the version hasn't changed
+
+        Returns:
+            dict: Summary (status: reloaded, unchanged, failed, rate_limited
+                (with retry_after seconds) or already_running; version,
+                previous_version, elapsed_ms, error); also stored in
+                last_reload except for rate_limited/already_running
+
+        Side effects:
+            Calls on_swap(old, new) after a swap; removes the previous
+            staging folder
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return {"status": "already_running", "version": self.version}
+        started = time.time()
+        if force:
+            wait = self.force_interval - (started - self._last_forced) if self._last_forced else 0
+            if wait > 0:
+                self._reload_lock.release()
+                return {"status": "rate_limited", "retry_after": int(wait) + 1, "version": self.version}
+            self._last_forced = started
+        previous = self.current
+        summary = {"previous_version": previous.version}
+        try:
+            try:
+                catalog, staging = self._load()
+            except Exception as e:
+                self.failures += 1
+                summary.update(status="failed", error=f"{type(e).__name__}: {e}")
+                print(f"[WARNING] Catalog reload failed, keeping {previous.version}: {summary['error']}")
+            else:
+                if catalog.version == previous.version and not force:
+                    catalog.unregister()
+                    if staging:
+                        shutil.rmtree(staging, ignore_errors=True)
+                    summary["status"] = "unchanged"
+                else:
+                    self.current = catalog  # The swap: one reference assignment
+                    previous.unregister()
+                    if self._staging:
+                        shutil.rmtree(self._staging, ignore_errors=True)
+                    self._staging = staging
+                    self.reloads += 1
+                    summary["status"] = "reloaded"
+                    print(f"Catalog {previous.version} replaced by {catalog.version}")
+                    if self.on_swap:
+                        self.on_swap(previous, catalog)
+            summary["version"] = self.version
+            summary["elapsed_ms"] = int((time.time() - started) * 1000)
+            self.last_reload = summary
+            return summary
+        finally:
+            self._reload_lock.release()
+
+    def stats(self):
+        """Returns the live catalog's info plus reload statistics for /health."""
+        return {
+            **self.current.stats(),
+            "reload_source": "object_store" if self.fetch else self.reload_directory,
+            "reloads": self.reloads,
+            "reload_failures": self.failures,
+            "last_reload": self.last_reload
+        }
@@ -73,6 +73,18 @@ ERROR_CODES = {
         "user_message": "You're making requests too quickly. Please slow down.",
         "suggested_action": "Wait a moment before trying again."
     },
+    "E1008": {
+        "name": "SOFA_API_CIRCUIT_OPEN",
+        "description": "S&S API circuit breaker is open (upstream failing); request failed fast",
+        "user_message": "The pricing service is having trouble right now. Please try again shortly.",
+        "suggested_action": "Wait 30 seconds before trying again."
+    },
+    "E1009": {
+        "name": "REQUEST_DEADLINE_EXCEEDED",
+        "description": "The request's time budget ran out before pricing finished",
+        "user_message": "The request took too long. Please try again.",
+        "suggested_action": "Try again, or ask about fewer products at once."
+    },
 
     # E2xxx: Validation & Data Errors
     "E2001": {
@@ -117,6 +129,12 @@ ERROR_CODES = {
         "user_message": "Missing required information.",
         "suggested_action": None  # Specific field mentioned in details
     },
+    "E2008": {
+        "name": "UNAUTHORIZED",
+        "description": "Admin endpoint called without a valid ADMIN_TOKEN",
+        "user_message": "Not authorized.",
+        "suggested_action": "Send 'Authorization: Bearer <ADMIN_TOKEN>'."
+    },
 
     # E3xxx: Internal System Errors
     "E3001": {
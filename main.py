@@ -1,62 +1,131 @@
 import functions_framework
 import requests
+import hmac
 import json
 import os
-import re
+import random
+import shutil
+import sqlite3
+import sys
 import time
+import threading
 from hashlib import md5
-from collections import OrderedDict  # For LRU cache implementation
+from collections import OrderedDict, deque  # For LRU cache implementation, latency windows
+from collections.abc import Mapping # Fabric records (catalog.FabricRecord) are read-only mappings
 from urllib3.util.retry import Retry  # (Critique #1) Corrected import
 from requests.adapters import HTTPAdapter
 from flask import jsonify # GCF's functions_framework includes Flask for helpers
-from fuzzywuzzy import process # For fuzzy matching
 from urllib.parse import quote # For URL encoding image paths
-from openai import OpenAI # For Grok LLM integration via OpenRouter
+from openai import OpenAI, APITimeoutError # For Grok LLM integration via OpenRouter
 from google.cloud import storage # For global query tracking
-from datetime import datetime # For timestamps in query logs
-from concurrent.futures import ThreadPoolExecutor # For async logging
+from datetime import datetime, timezone # For timestamps in query logs
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED # For async logging and concurrent price lookups
 
 # Import error code system (v2.5.0)
 from error_codes import create_error_response, ERROR_CODES
+from matching import color_family
+from catalog import CatalogManager, CATALOG_FILES, SHARDS_FILE
 
 # --- Setup: Session with Retries (Critique #6) ---
-# Create a reusable session to handle connections and retries
-session = requests.Session()
-retry_strategy = Retry(
-    total=3,                # Total retries
-    backoff_factor=1,       # Time to wait (1s, 2s, 4s)
-    status_forcelist=[429, 500, 502, 503, 504], # Statuses to retry on
-    allowed_methods=["POST", "GET"]
-)
-adapter = HTTPAdapter(max_retries=retry_strategy)
-session.mount("https://", adapter)
+# Create reusable sessions to handle connections and retries. There is one
+# session per retry budget (0..UPSTREAM_MAX_RETRIES) so a request close to its
+# deadline can make fewer attempts (see plan_upstream_call); `session` is the
+# default, full-retry session.
+UPSTREAM_MAX_RETRIES = 3
+UPSTREAM_BACKOFF_FACTOR = 1
+
+def build_upstream_session(total_retries):
+    """
+    Builds a requests.Session that retries transient failures.
+
+    Args:
+        total_retries (int): Retry attempts after the first call
+
+    Returns:
+        requests.Session: Session with an HTTPS retry adapter mounted
+    """
+    upstream_session = requests.Session()
+    retry_strategy = Retry(
+        total=total_retries,    # Total retries
+        backoff_factor=UPSTREAM_BACKOFF_FACTOR,  # Time to wait between retries (0s, 2s, 4s)
+        status_forcelist=[429, 500, 502, 503, 504], # Statuses to retry on
+        allowed_methods=["POST", "GET"]
+    )
+    adapter = HTTPAdapter(max_retries=retry_strategy)
+    upstream_session.mount("https://", adapter)
+    return upstream_session
+
+upstream_sessions = [build_upstream_session(n) for n in range(UPSTREAM_MAX_RETRIES + 1)]
+session = upstream_sessions[UPSTREAM_MAX_RETRIES]
 
 # --- Setup: In-Memory Cache (Critique #10) ---
-# LRU cache with size limit and TTL to prevent memory exhaustion
-# Max 1000 entries to prevent OOM on high-traffic instances
+# LRU cache with size limit and TTL to prevent memory exhaustion.
+# The price cache is sharded (one lock per shard) and bounded by bytes rather
+# than entry count, since one response can carry many image URLs and specs.
+
+def approx_size(value):
+    """
+    Rough deep memory footprint of a cached value in bytes.
+
+    Walks dicts, lists, tuples and sets and sums sys.getsizeof of every
+    container, key and leaf. Shared objects are counted once per reference,
+    which slightly over-counts - fine for enforcing a memory budget.
+
+    Args:
+        value (Any): Value to measure
+
+    Returns:
+        int: Approximate size in bytes
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += approx_size(k) + approx_size(v)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += approx_size(item)
+    return size
 
 class LRUCache:
     """
     Least Recently Used (LRU) cache with TTL and size limit.
 
     Prevents unbounded memory growth by evicting oldest entries when cache is full.
-    Also expires entries after TTL seconds.
+    Also expires entries after TTL seconds. All operations hold an internal
+    lock, so one instance can be shared by threaded workers.
 
     Args:
-        max_size (int): Maximum number of entries before eviction (default: 1000)
+        max_size (int): Maximum number of entries before eviction (default: 1000).
+            None means no entry limit (use max_bytes instead).
         ttl (int): Time-to-live in seconds before entries expire (default: 300)
+        hard_ttl (int): Optional stale-while-revalidate limit. Entries older than
+            ttl but younger than hard_ttl are "stale": get() treats them as a
+            miss, get_allow_stale() still returns them. Defaults to ttl (no
+            stale window).
+        max_bytes (int): Optional memory budget; least recently used entries
+            are evicted until the approx_size() total fits (default: None)
     """
-    def __init__(self, max_size=1000, ttl=300):
-        self.cache = OrderedDict()
+    def __init__(self, max_size=1000, ttl=300, hard_ttl=None, max_bytes=None):
+        self.cache = OrderedDict()  # key -> (timestamp, value, size_bytes)
         self.max_size = max_size
+        self.max_bytes = max_bytes
         self.ttl = ttl
+        self.hard_ttl = max(hard_ttl or ttl, ttl)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._lock = threading.Lock()
 
     def get(self, key):
         """
         Get value from cache if it exists and hasn't expired.
 
-        Automatically removes expired entries. Marks accessed entries as
-        recently used (LRU ordering).
+        Automatically removes entries past their hard TTL. Stale entries
+        (past ttl, within hard_ttl) count as a miss but are kept for
+        get_allow_stale(). Marks accessed entries as recently used (LRU ordering).
 
         Args:
             key (str): Cache key to retrieve
@@ -64,51 +133,1104 @@ class LRUCache:
         Returns:
             Any: Cached value if found and not expired, None otherwise
         """
-        if key not in self.cache:
-            return None
+        return self._lookup(key, allow_stale=False)[0]
 
-        timestamp, value = self.cache[key]
-        if time.time() - timestamp >= self.ttl:
-            # Expired - remove it
-            del self.cache[key]
-            return None
+    def get_allow_stale(self, key):
+        """
+        Get value from cache, also returning entries inside the stale window.
 
-        # Move to end (mark as recently used)
-        self.cache.move_to_end(key)
-        return value
+        Args:
+            key (str): Cache key to retrieve
 
-    def set(self, key, value):
+        Returns:
+            tuple: (value, is_stale) - (None, False) if missing or past hard_ttl
         """
-        Store value in cache, evicting oldest entry if at capacity.
+        return self._lookup(key, allow_stale=True)
+
+    def _lookup(self, key, allow_stale):
+        with self._lock:
+            entry = self.cache.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, False
+
+            timestamp, value, size = entry
+            age = time.time() - timestamp
+            if age >= self.hard_ttl:
+                # Expired - remove it
+                del self.cache[key]
+                self.bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None, False
+
+            if age >= self.ttl:
+                # Stale - keep it around for stale-while-revalidate readers
+                if not allow_stale:
+                    self.misses += 1
+                    return None, False
+                self.cache.move_to_end(key)
+                self.stale_hits += 1
+                return value, True
+
+            # Move to end (mark as recently used)
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return value, False
+
+    def set(self, key, value, timestamp=None):
+        """
+        Store value in cache, evicting oldest entries if at capacity.
 
         If key already exists, it's removed and re-added (updates timestamp).
-        If cache is full, evicts the least recently used entry.
+        If the cache is full (by entries or bytes), evicts least recently used
+        entries. A value larger than the whole byte budget is not stored.
 
         Args:
             key (str): Cache key to store
             value (Any): Value to cache
+            timestamp (float): When the value was produced (default: now).
+                Lets values loaded from the L2 store keep their real age.
 
         Side effects:
             Prints log message when evicting old entries
         """
-        # Remove if already exists (we'll re-add)
-        if key in self.cache:
-            del self.cache[key]
-
-        # Evict oldest if at max size
-        if len(self.cache) >= self.max_size:
-            oldest_key = next(iter(self.cache))
-            del self.cache[oldest_key]
-            print(f"  [Cache] Evicted oldest entry (cache size: {self.max_size})")
+        size = approx_size(value) if self.max_bytes else 0
+        with self._lock:
+            # Remove if already exists (we'll re-add)
+            old = self.cache.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+
+            if self.max_bytes and size > self.max_bytes:
+                print(f"  [Cache] Skipped oversized entry ({size} bytes > budget {self.max_bytes})")
+                return
+
+            # Evict oldest while at max size / over the byte budget
+            while self.cache and (
+                (self.max_size is not None and len(self.cache) >= self.max_size)
+                or (self.max_bytes and self.bytes + size > self.max_bytes)
+            ):
+                _, (_, _, evicted_size) = self.cache.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+                print(f"  [Cache] Evicted oldest entry (cache size: {len(self.cache) + 1}, bytes: {self.bytes + evicted_size})")
+
+            # Add new entry with current timestamp
+            self.cache[key] = (time.time() if timestamp is None else timestamp, value, size)
+            self.bytes += size
+
+    def delete(self, key):
+        """Removes one entry if present."""
+        with self._lock:
+            old = self.cache.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+
+    def clear(self):
+        """Drops every entry (hit/miss counters are kept)."""
+        with self._lock:
+            self.cache.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """
+        Returns cache statistics for the /health endpoint.
 
-        # Add new entry with current timestamp
-        self.cache[key] = (time.time(), value)
+        Returns:
+            dict: entries, max_size, bytes, max_bytes, ttl_seconds,
+                hard_ttl_seconds, hits, stale_hits, misses, evictions,
+                expirations, hit_rate_percent
+        """
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            served = self.hits + self.stale_hits
+            return {
+                "entries": len(self.cache),
+                "max_size": self.max_size,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hard_ttl_seconds": self.hard_ttl,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate_percent": round(served / lookups * 100, 1) if lookups else 0.0
+            }
 
     def __len__(self):
         return len(self.cache)
 
-response_cache = LRUCache(max_size=1000, ttl=300)
-CACHE_TTL = 300  # 5 minutes (kept for compatibility)
+class ShardedLRUCache:
+    """
+    LRUCache split into independently locked shards (lock striping).
+
+    Keys are spread over shards by hash, so concurrent requests for different
+    prices rarely contend on the same lock. Each shard gets an equal slice of
+    the entry and byte budgets and keeps its own metrics.
+
+    Args:
+        num_shards (int): Number of shards (default: 16)
+        max_size (int): Total entry limit across shards, or None (default: None)
+        ttl (int): Soft TTL in seconds (see LRUCache)
+        hard_ttl (int): Hard TTL in seconds (see LRUCache)
+        max_bytes (int): Total memory budget across shards, or None
+    """
+    def __init__(self, num_shards=16, max_size=None, ttl=300, hard_ttl=None, max_bytes=None):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.shards = [
+            LRUCache(
+                max_size=max(1, max_size // num_shards) if max_size else None,
+                ttl=ttl,
+                hard_ttl=hard_ttl,
+                max_bytes=max(1, max_bytes // num_shards) if max_bytes else None
+            )
+            for _ in range(num_shards)
+        ]
+        self.ttl = self.shards[0].ttl
+        self.hard_ttl = self.shards[0].hard_ttl
+
+    def _shard(self, key):
+        return self.shards[hash(key) % len(self.shards)]
+
+    def get(self, key):
+        """Same as LRUCache.get, on the key's shard."""
+        return self._shard(key).get(key)
+
+    def get_allow_stale(self, key):
+        """Same as LRUCache.get_allow_stale, on the key's shard."""
+        return self._shard(key).get_allow_stale(key)
+
+    def set(self, key, value, timestamp=None):
+        """Same as LRUCache.set, on the key's shard."""
+        self._shard(key).set(key, value, timestamp)
+
+    def clear(self):
+        """Drops every entry in every shard."""
+        for shard in self.shards:
+            shard.clear()
+
+    def stats(self):
+        """
+        Returns totals plus per-shard statistics for the /health endpoint.
+
+        Returns:
+            dict: Totals (entries, bytes, hits, stale_hits, misses, evictions,
+                expirations, hit_rate_percent, usage_percent) and a "shards" list
+                of per-shard LRUCache.stats()
+        """
+        shard_stats = [shard.stats() for shard in self.shards]
+        totals = {name: sum(st[name] for st in shard_stats)
+                  for name in ("entries", "bytes", "hits", "stale_hits", "misses", "evictions", "expirations")}
+        lookups = totals["hits"] + totals["stale_hits"] + totals["misses"]
+        served = totals["hits"] + totals["stale_hits"]
+        if self.max_bytes:
+            usage = totals["bytes"] / self.max_bytes * 100
+        elif self.max_size:
+            usage = totals["entries"] / self.max_size * 100
+        else:
+            usage = 0.0
+        return {
+            **totals,
+            "num_shards": len(self.shards),
+            "max_size": self.max_size,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hard_ttl_seconds": self.hard_ttl,
+            "hit_rate_percent": round(served / lookups * 100, 1) if lookups else 0.0,
+            "usage_percent": round(usage, 1),
+            "shards": [
+                {k: st[k] for k in ("entries", "bytes", "hits", "stale_hits", "misses", "evictions", "expirations")}
+                for st in shard_stats
+            ]
+        }
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+# Stale-while-revalidate: prices are fresh for 5 minutes; for up to an hour
+# after that a stale price is served instantly (flagged "stale": true) while a
+# background refresh fetches the new one. Also rides out short upstream outages.
+CACHE_TTL = 300  # 5 minutes (soft TTL)
+CACHE_HARD_TTL = 3600  # 1 hour (stale prices are never served past this)
+CACHE_MAX_BYTES = 32 * 1024 * 1024  # 32 MB memory budget for cached prices
+CACHE_SHARDS = 16
+response_cache = ShardedLRUCache(
+    num_shards=CACHE_SHARDS, ttl=CACHE_TTL, hard_ttl=CACHE_HARD_TTL, max_bytes=CACHE_MAX_BYTES
+)
+
+# --- Setup: Persistent L2 Price Cache ---
+class PriceStore:
+    """
+    SQLite-backed second cache tier that survives cold starts.
+
+    Sits behind response_cache: L1 misses fall through to this store, and
+    every price written to L1 is also written here. The file can be shipped
+    with a deploy (PRICE_CACHE_SEED) so new instances start warm.
+
+    Args:
+        path (str): SQLite database file (created if missing)
+        ttl (int): Seconds a stored price may be served (default: 3600)
+    """
+    def __init__(self, path, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS prices ("
+            "cache_key TEXT PRIMARY KEY, stored_at REAL NOT NULL, value TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        """
+        Looks up a stored price.
+
+        Args:
+            key (str): Price cache key
+
+        Returns:
+            tuple: (value, age_seconds), or (None, None) if missing or past ttl
+        """
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT stored_at, value FROM prices WHERE cache_key = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"  [WARNING] L2 cache read failed: {e}")
+            return None, None
+
+        if row is None:
+            self.misses += 1
+            return None, None
+        age = time.time() - row[0]
+        if age >= self.ttl:
+            self.misses += 1
+            return None, None
+        self.hits += 1
+        return json.loads(row[1]), age
+
+    def set(self, key, value):
+        """
+        Stores (or replaces) a price. Failures are logged, never raised.
+
+        Args:
+            key (str): Price cache key
+            value (dict): JSON-serializable price response
+        """
+        try:
+            encoded = json.dumps(value)
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO prices (cache_key, stored_at, value) VALUES (?, ?, ?)",
+                    (key, time.time(), encoded)
+                )
+                self._conn.commit()
+            self.writes += 1
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            self.errors += 1
+            print(f"  [WARNING] L2 cache write failed: {e}")
+
+    def clear(self):
+        """
+        Deletes every stored price (e.g. after a catalog reload).
+
+        Returns:
+            int: Number of rows deleted (0 on error)
+        """
+        try:
+            with self._lock:
+                cursor = self._conn.execute("DELETE FROM prices")
+                self._conn.commit()
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"  [WARNING] L2 cache clear failed: {e}")
+            return 0
+
+    def purge_expired(self):
+        """
+        Deletes entries past ttl.
+
+        Returns:
+            int: Number of rows deleted (0 on error)
+        """
+        try:
+            with self._lock:
+                cursor = self._conn.execute(
+                    "DELETE FROM prices WHERE stored_at <= ?", (time.time() - self.ttl,)
+                )
+                self._conn.commit()
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"  [WARNING] L2 cache purge failed: {e}")
+            return 0
+
+    def stats(self):
+        """
+        Returns store statistics for the /health endpoint.
+
+        Returns:
+            dict: path, entries, ttl_seconds, hits, misses, writes, errors
+        """
+        try:
+            with self._lock:
+                entries = self._conn.execute("SELECT COUNT(*) FROM prices").fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        return {
+            "path": self.path,
+            "entries": entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "errors": self.errors
+        }
+
+# L2 is opt-in: set PRICE_CACHE_DB to a writable path (on Cloud Functions,
+# somewhere under /tmp). PRICE_CACHE_SEED optionally names a prebuilt store
+# shipped with the deploy; it is copied to PRICE_CACHE_DB on first start.
+PRICE_CACHE_DB = os.getenv('PRICE_CACHE_DB')
+PRICE_CACHE_SEED = os.getenv('PRICE_CACHE_SEED')
+# Stored prices are never served past CACHE_HARD_TTL (same rule as L1), so
+# a longer PRICE_CACHE_DB_TTL only keeps dead rows around
+PRICE_CACHE_DB_TTL = int(os.getenv('PRICE_CACHE_DB_TTL', CACHE_HARD_TTL))
+price_store = None
+if PRICE_CACHE_DB:
+    try:
+        if PRICE_CACHE_SEED and not os.path.exists(PRICE_CACHE_DB) and os.path.exists(PRICE_CACHE_SEED):
+            shutil.copyfile(PRICE_CACHE_SEED, PRICE_CACHE_DB)
+            print(f"L2 price cache seeded from {PRICE_CACHE_SEED}")
+        price_store = PriceStore(PRICE_CACHE_DB, ttl=PRICE_CACHE_DB_TTL)
+        purged = price_store.purge_expired()
+        print(f"L2 price cache ready at {PRICE_CACHE_DB} ({purged} expired entries purged)")
+    except (sqlite3.Error, OSError) as e:
+        price_store = None
+        print(f"[WARNING] L2 price cache disabled: {e}")
+
+# --- Setup: Offline Price Table ---
+class PriceTable:
+    """
+    Read-only price matrix crawled by sku_discovery_tool.py (prices.json).
+
+    Prices depend on product, size, cover and fabric tier, not on the colour,
+    so the table holds one entry per (product, size, cover, tier). Lookups
+    are plain dict reads; misses fall through to the live S&S API.
+
+    Each entry carries the time it was crawled ("crawled_at"); a resumed
+    crawl keeps older entries, so age is checked per entry. generated_at is
+    the oldest crawl time in the file.
+    """
+
+    def __init__(self, path, max_age=None):
+        """
+        Args:
+            path (str): prices.json path. A missing file gives an empty table.
+            max_age (int): Skip entries crawled more than max_age seconds ago
+                (None = no limit)
+        """
+        self.path = path
+        self.prices = {}
+        self.generated_at = None
+        self.complete = False
+        self.hits = 0
+        self.misses = 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                table = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"[WARNING] Price table {path} not loaded: {e}")
+            return
+
+        self.generated_at = table.get("generated_at")
+        self.complete = table.get("complete", False)
+        prices = table.get("prices", {})
+        if max_age is not None:
+            # Entries from tables written before per-entry times fall back to generated_at
+            now = time.time()
+            prices = {
+                key: entry for key, entry in prices.items()
+                if (crawled := self.parse_timestamp(entry.get("crawled_at") or self.generated_at)) is not None
+                and now - crawled <= max_age
+            }
+            expired = len(table.get("prices", {})) - len(prices)
+            if expired:
+                print(f"[WARNING] Price table {path}: {expired} prices older than {max_age}s ignored")
+                self.complete = False
+        self.prices = prices
+
+    @staticmethod
+    def key(product_sku, size_sku, cover_sku, tier):
+        """Table key (same format as sku_discovery_tool.price_table_key)."""
+        return f"{product_sku}|{size_sku}|{cover_sku}|{tier}".lower()
+
+    @staticmethod
+    def parse_timestamp(value):
+        """Epoch seconds for a '%Y-%m-%dT%H:%M:%SZ' timestamp, or None."""
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc).timestamp()
+        except ValueError:
+            return None
+
+    def age(self):
+        """Seconds since the oldest entry in the file was crawled, or None if unknown."""
+        generated = self.parse_timestamp(self.generated_at)
+        if generated is None:
+            return None
+        return time.time() - generated
+
+    def get(self, product_sku, size_sku, cover_sku, tier):
+        """Returns the table entry for a configuration, or None."""
+        entry = self.prices.get(self.key(product_sku, size_sku, cover_sku, tier))
+        if entry:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return entry
+
+    def __len__(self):
+        return len(self.prices)
+
+    def stats(self):
+        """Returns table statistics for /health."""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": bool(self.prices),
+            "entries": len(self.prices),
+            "generated_at": self.generated_at,
+            "complete": self.complete,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": f"{self.hits / lookups * 100:.1f}%" if lookups else "0.0%"
+        }
+
+# Written by `python sku_discovery_tool.py` (Phase 4). Optional: without it
+# every cache miss goes to the live API. Prices crawled more than
+# PRICE_TABLE_MAX_AGE ago are ignored so a forgotten file (or the untouched
+# part of a resumed crawl) can't serve last season's prices.
+PRICE_TABLE_FILE = os.getenv('PRICE_TABLE_FILE', os.path.join(os.path.dirname(__file__), 'prices.json'))
+PRICE_TABLE_MAX_AGE = int(os.getenv('PRICE_TABLE_MAX_AGE', 7 * 86400))  # 7 days
+price_table = PriceTable(PRICE_TABLE_FILE, max_age=PRICE_TABLE_MAX_AGE)
+if price_table:
+    print(f"Price table loaded: {len(price_table)} prices (generated {price_table.generated_at})")
+
+# --- Setup: Tier Price Cache ---
+class TierPriceCache:
+    """
+    One verified price per (product, size, cover, fabric tier).
+
+    S&S prices by tier, not by colour, so any colour in a tier can be priced
+    from a single upstream answer. Entries use the price table's format
+    (price, old_price, product_name, size_name, specs) and the same keys.
+
+    When a live answer disagrees with the tier price, either the colour is
+    priced differently or the tier price moved. The tier entry is dropped,
+    the offline price table's entry for the tier is superseded, and the
+    colour is recorded as an exception (priced live) - all for exception_ttl.
+    The next live answer for another colour re-seeds the tier. A fraction of
+    tier answers (verify_rate) is re-checked in the background to find
+    mismatches.
+
+    Tier entries carry no images (S&S hero images show one colour), so image
+    URLs from live answers are kept per product, size and colour.
+
+    Args:
+        max_size (int): Maximum tier entries (default: 5000)
+        ttl (int): Seconds a tier price is served (default: 300)
+        verify_rate (float): Fraction of tier answers verified live (default: 0.05)
+        exception_ttl (int): Seconds a mismatch keeps a colour priced live and
+            the table entry superseded (default: 3600)
+        image_ttl (int): Seconds image URLs are kept (default: 86400)
+    """
+    def __init__(self, max_size=5000, ttl=300, verify_rate=0.05, exception_ttl=3600, image_ttl=86400):
+        self.prices = LRUCache(max_size=max_size, ttl=ttl)
+        self.verify_rate = verify_rate
+        self.exceptions = LRUCache(max_size=max_size, ttl=exception_ttl)  # "tier key#colour key" -> True
+        self.superseded = LRUCache(max_size=max_size, ttl=exception_ttl)  # tier key -> live price that disagreed
+        self.images = LRUCache(max_size=max_size * 4, ttl=image_ttl)  # image_key() -> image URLs
+        self.hits = 0
+        self.misses = 0
+        self.verifications = 0
+        self.mismatches = 0
+        self._lock = threading.Lock()
+
+    def is_exception(self, tier_key, colour_key):
+        """True if this colour recently didn't follow its tier's price."""
+        return self.exceptions.get(f"{tier_key}#{colour_key}") is not None
+
+    def is_superseded(self, tier_key):
+        """True if a live answer recently disagreed with this tier's price (don't serve the price table's entry)."""
+        return self.superseded.get(tier_key) is not None
+
+    def get(self, tier_key, colour_key):
+        """
+        Returns the tier price entry for a colour, or None.
+
+        Args:
+            tier_key (str): PriceTable.key() of the configuration
+            colour_key (str): fabric SKU + colour SKU
+
+        Returns:
+            dict or None: None if missing, expired or the colour is an exception
+        """
+        entry = None if self.is_exception(tier_key, colour_key) else self.prices.get(tier_key)
+        with self._lock:
+            if entry:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry
+
+    def learn(self, tier_key, colour_key, entry, reference=None):
+        """
+        Records a live price for a colour and checks it against its tier.
+
+        Args:
+            tier_key (str): PriceTable.key() of the configuration
+            colour_key (str): fabric SKU + colour SKU
+            entry (dict): Live price in price table format
+            reference (dict): Tier price to check against when this cache has
+                none (e.g. the offline price table's entry). Ignored while
+                the tier is superseded.
+
+        Returns:
+            bool: False if the live price disagreed with the tier price
+        """
+        if self.is_exception(tier_key, colour_key):
+            return True  # Recently mismatched; doesn't seed the tier until the exception expires
+        current = self.prices.get(tier_key)
+        if current is None and not self.is_superseded(tier_key):
+            current = reference
+        if current and current.get("price") != entry.get("price"):
+            # Either this colour is special or the tier price moved - stop
+            # serving both tier prices; the next live answer for another
+            # colour re-seeds the tier
+            with self._lock:
+                self.mismatches += 1
+            self.exceptions.set(f"{tier_key}#{colour_key}", True)
+            self.superseded.set(tier_key, entry)
+            self.prices.delete(tier_key)
+            return False
+        self.prices.set(tier_key, entry)
+        return True
+
+    @staticmethod
+    def image_key(product_sku, size_sku, colour_key):
+        """Key of the image URLs for one product, size and colour."""
+        return f"{product_sku}|{size_sku}|{colour_key}".lower()
+
+    def remember_images(self, image_key, image_urls):
+        """Keeps the hero image URLs of a live answer (empty lists aren't stored)."""
+        if image_urls:
+            self.images.set(image_key, list(image_urls))
+
+    def images_for(self, image_key):
+        """Returns known image URLs for a product, size and colour ([] if none)."""
+        return list(self.images.get(image_key) or [])
+
+    def should_verify(self):
+        """Samples verify_rate of tier answers for a background live check."""
+        if random.random() >= self.verify_rate:
+            return False
+        with self._lock:
+            self.verifications += 1
+        return True
+
+    def clear(self):
+        """Drops tier prices, exceptions and images (e.g. after a catalog reload)."""
+        self.prices.clear()
+        self.exceptions.clear()
+        self.superseded.clear()
+        self.images.clear()
+
+    def stats(self):
+        """Returns tier cache statistics for /health."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.prices),
+                "ttl_seconds": self.prices.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate_percent": round(self.hits / lookups * 100, 1) if lookups else 0.0,
+                "verify_rate": self.verify_rate,
+                "verifications": self.verifications,
+                "mismatches": self.mismatches,
+                "exceptions": len(self.exceptions),
+                "exception_ttl_seconds": self.exceptions.ttl,
+                "superseded_tiers": len(self.superseded),
+                "image_entries": len(self.images)
+            }
+
+TIER_CACHE_TTL = int(os.getenv('TIER_CACHE_TTL', CACHE_TTL))
+TIER_VERIFY_RATE = float(os.getenv('TIER_VERIFY_RATE', 0.05))
+TIER_EXCEPTION_TTL = int(os.getenv('TIER_EXCEPTION_TTL', 3600))
+tier_prices = TierPriceCache(max_size=5000, ttl=TIER_CACHE_TTL, verify_rate=TIER_VERIFY_RATE,
+                             exception_ttl=TIER_EXCEPTION_TTL)
+
+# Resolved-query memo: normalized query -> (QueryResolution, price cache key).
+# Popular queries skip matching entirely. Resolutions only change when the
+# catalog does, so entries live for an hour and are cleared on catalog reload.
+query_memo = LRUCache(max_size=500, ttl=3600)
+
+# --- Setup: Negative Cache (failed lookups) ---
+class NegativeCache:
+    """
+    Short-lived cache of failed lookups, with a TTL per entry.
+
+    Retries of unresolvable queries and of SKU combinations the S&S API
+    rejects are answered from here instead of redoing matching or waiting
+    on the upstream again. Backed by an LRUCache whose TTL is the longest
+    per-entry TTL; each entry also carries its own expiry time.
+
+    Args:
+        max_size (int): Maximum number of remembered failures (default: 2000)
+        max_ttl (int): Longest TTL any entry will be given
+    """
+    def __init__(self, max_size=2000, max_ttl=300):
+        self.entries = LRUCache(max_size=max_size, ttl=max_ttl)
+        self.hits = 0
+        self.stored = 0
+
+    def get(self, key):
+        """
+        Args:
+            key (str): Failure key (see negative_query_key / negative_sku_key)
+
+        Returns:
+            Any: Remembered failure, or None if absent or expired
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry[0] <= time.time():
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl):
+        """
+        Remembers a failure for ttl seconds (capped at max_ttl).
+
+        Args:
+            key (str): Failure key
+            value (Any): What to answer with on a hit
+            ttl (int): Seconds to remember the failure
+        """
+        self.entries.set(key, (time.time() + min(ttl, self.entries.ttl), value))
+        self.stored += 1
+
+    def clear(self):
+        """Forgets every failure."""
+        self.entries.clear()
+
+    def stats(self):
+        """
+        Returns:
+            dict: entries, hits, stored, client_error_ttl_seconds, upstream_error_ttl_seconds
+        """
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "stored": self.stored,
+            "client_error_ttl_seconds": NEGATIVE_CACHE_CLIENT_TTL,
+            "upstream_error_ttl_seconds": NEGATIVE_CACHE_UPSTREAM_TTL
+        }
+
+# Client errors (queries that don't resolve, SKU combinations the S&S API
+# rejects) are deterministic for a given catalog, so they are remembered for
+# minutes. Upstream errors (timeouts, 5xx, connection failures) are
+# transient and only remembered long enough to absorb a retry storm.
+NEGATIVE_CACHE_CLIENT_TTL = 300
+NEGATIVE_CACHE_UPSTREAM_TTL = 15
+negative_cache = NegativeCache(max_size=2000, max_ttl=NEGATIVE_CACHE_CLIENT_TTL)
+
+def negative_query_key(normalized_query):
+    """Negative cache key for a query that failed to resolve."""
+    return f"query:{normalized_query}"
+
+def negative_sku_key(cache_key):
+    """Negative cache key for a SKU combination the upstream failed on."""
+    return f"sku:{cache_key}"
+
+def invalidate_query_memo():
+    """
+    Drops every memoized resolution and remembered failure.
+
+    Must be called whenever the translation dictionaries change, since
+    memoized resolutions point at the old catalog's SKUs (and queries that
+    failed may now resolve).
+    """
+    query_memo.clear()
+    negative_cache.clear()
+    print("  [Memo] Resolved-query memo cleared")
+
+# --- Setup: Request Coalescing (single-flight) ---
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into a single execution.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is in flight wait for and share its result (or exception).
+    Used so a burst of identical price lookups costs one upstream request.
+
+    A result that only applies to the leader's own call (e.g. it ran out of
+    its request deadline) can be refused by a follower's `shareable` check:
+    the follower then runs the lookup again (or joins the next one in flight).
+    """
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+            self.waiters = 0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.refused = 0
+
+    def do(self, key, fn, *args, wait_timeout=None, shareable=None, **kwargs):
+        """
+        Runs fn(*args, **kwargs) once per key at a time.
+
+        Args:
+            key (str): Coalescing key (e.g. price cache key)
+            fn (callable): Function to run if no call for key is in flight
+            wait_timeout (float): Max seconds a follower waits in total
+                (None = wait until done). The leader is not bounded.
+            shareable (callable): result -> bool. A follower only reuses
+                results it accepts; otherwise it retries (default: reuse all)
+
+        Returns:
+            tuple: (result, shared) - shared is True if another caller's result was reused
+
+        Raises:
+            TimeoutError: A follower waited longer than wait_timeout
+            Exception: Whatever the leader's call raised
+        """
+        give_up_at = time.time() + wait_timeout if wait_timeout is not None else None
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is not None:
+                    call.waiters += 1
+                    self.coalesced += 1
+                    leader = False
+                else:
+                    call = self._calls[key] = self._Call()
+                    self.leaders += 1
+                    leader = True
+
+            if leader:
+                break
+            if not call.done.wait(None if give_up_at is None else max(0, give_up_at - time.time())):
+                raise TimeoutError(f"Gave up waiting for in-flight call {key}")
+            if call.error is not None:
+                raise call.error
+            if shareable is None or shareable(call.result):
+                return call.result, True
+            self.refused += 1
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        """Returns coalescing counters for the /health endpoint."""
+        with self._lock:
+            in_flight = len(self._calls)
+        return {"in_flight": in_flight, "leader_calls": self.leaders, "coalesced_calls": self.coalesced,
+                "refused_results": self.refused}
+
+upstream_flight = SingleFlight()
+
+# --- Setup: Circuit Breaker (S&S price API) ---
+class CircuitBreaker:
+    """
+    Circuit breaker with an adaptive timeout for one upstream endpoint.
+
+    closed:    calls pass; failure_threshold consecutive failures open it.
+    open:      calls fail fast (no network) for reset_timeout seconds.
+    half_open: one probe call at a time; success closes, failure re-opens.
+
+    timeout() follows the p95 of recent successful latencies (times
+    timeout_multiplier, clamped to [min_timeout, max_timeout]) so a slow
+    upstream can't hold worker threads for the full default timeout.
+
+    Args:
+        name (str): Endpoint label for logs and /health
+        failure_threshold (int): Consecutive failures before opening (default: 5)
+        reset_timeout (int): Seconds to stay open before probing (default: 30)
+        min_timeout (float): Lower bound for the adaptive timeout (default: 2)
+        max_timeout (float): Upper bound, used until enough samples exist (default: 10)
+        timeout_multiplier (float): Headroom over p95 (default: 2)
+        window (int): Number of recent latencies kept (default: 100)
+        min_samples (int): Samples needed before adapting (default: 20)
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30, min_timeout=2,
+                 max_timeout=10, timeout_multiplier=2, window=100, min_samples=20):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=window)
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0
+        self.probe_in_flight = False
+        self.trips = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Decides whether a call may go to the upstream now.
+
+        Every allowed call must be followed by record_success(),
+        record_failure() or record_abandoned() (a half-open probe holds the
+        only slot until then).
+
+        Returns:
+            bool: True to make the call, False to fail fast
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.time() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self.probe_in_flight = False
+                print(f"  [Circuit] {self.name}: half-open, probing upstream")
+            if self.probe_in_flight:
+                self.rejected += 1
+                return False
+            self.probe_in_flight = True
+            return True
+
+    def record_success(self, latency=None):
+        """
+        Records a call that reached a healthy upstream.
+
+        Args:
+            latency (float): Call duration in seconds (None to skip the sample,
+                e.g. for a fast 4xx rejection)
+        """
+        with self._lock:
+            if latency is not None:
+                self.latencies.append(latency)
+            self.consecutive_failures = 0
+            if self.state != self.CLOSED:
+                print(f"  [Circuit] {self.name}: closed (upstream recovered)")
+            self.state = self.CLOSED
+            self.probe_in_flight = False
+
+    def record_abandoned(self):
+        """
+        Records a call that says nothing about the upstream's health (the
+        caller's own deadline cut it short). Only frees a half-open probe slot.
+        """
+        with self._lock:
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        """Records a timeout, 5xx or connection failure; may open the circuit."""
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                    print(f"  [Circuit] {self.name}: OPEN after {self.consecutive_failures} consecutive failures")
+                self.state = self.OPEN
+                self.opened_at = time.time()
+                self.probe_in_flight = False
+
+    def latency_percentile(self, percentile):
+        """
+        Args:
+            percentile (float): 0-100
+
+        Returns:
+            float or None: Recent successful latency at that percentile, or
+                None until min_samples have been observed
+        """
+        with self._lock:
+            if len(self.latencies) < self.min_samples:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[int(percentile / 100 * (len(ordered) - 1))]
+
+    def timeout(self):
+        """
+        Returns:
+            float: Seconds to allow the next upstream call
+        """
+        p95 = self.latency_percentile(95)
+        if p95 is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, p95 * self.timeout_multiplier))
+
+    def retry_after(self):
+        """
+        Returns:
+            int: Seconds until the next probe is allowed (0 if not open)
+        """
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0
+            return max(0, int(self.reset_timeout - (time.time() - self.opened_at)))
+
+    def stats(self):
+        """
+        Returns:
+            dict: state, consecutive_failures, trips, rejected, timeout_seconds,
+                latency_samples, retry_after_seconds
+        """
+        timeout = self.timeout()
+        retry_after = self.retry_after()
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "trips": self.trips,
+                "rejected": self.rejected,
+                "timeout_seconds": round(timeout, 2),
+                "latency_samples": len(self.latencies),
+                "retry_after_seconds": retry_after
+            }
+
+# --- Setup: Hedged Upstream Requests (opt-in) ---
+class HedgeBudget:
+    """
+    Token bucket that caps hedged requests to a fraction of primary calls.
+
+    Every primary upstream call earns `ratio` tokens (up to max_tokens); a
+    hedge spends one. With ratio <= 1 hedging can never more than double
+    upstream load, and a slow upstream can't trigger a hedge storm.
+
+    Args:
+        ratio (float): Hedges allowed per primary call (clamped to 0-1)
+        max_tokens (float): Burst allowance (default: 10)
+    """
+    def __init__(self, ratio=0.1, max_tokens=10):
+        self.ratio = min(1.0, max(0.0, ratio))
+        self.max_tokens = max_tokens
+        self.tokens = 0.0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.denied = 0
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        """Earns tokens for one primary call."""
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_acquire(self):
+        """
+        Returns:
+            bool: True if a hedge may be sent (a token was spent)
+        """
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.hedges += 1
+                return True
+            self.denied += 1
+            return False
+
+    def refund(self):
+        """Returns the token of a hedge that couldn't be sent after all."""
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + 1)
+            self.hedges -= 1
+
+    def record_win(self):
+        """Counts a hedge that answered before its primary."""
+        with self._lock:
+            self.hedge_wins += 1
+
+    def stats(self):
+        """Returns hedging counters for the /health endpoint."""
+        with self._lock:
+            return {
+                "enabled": HEDGE_ENABLED,
+                "percentile": HEDGE_PERCENTILE,
+                "budget_ratio": self.ratio,
+                "tokens": round(self.tokens, 2),
+                "hedges_sent": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "denied_by_budget": self.denied,
+                "unhedged_pool_full": hedge_pool.saturated
+            }
+
+class HedgePool:
+    """
+    Thread pool for hedged calls that never queues work.
+
+    try_submit() only hands a call to the pool while a worker is free;
+    otherwise the caller makes the call itself, unhedged. A busy pool then
+    costs nothing instead of adding queueing delay to every upstream call.
+
+    Args:
+        max_workers (int): Concurrent hedged calls (primaries and hedges)
+    """
+    def __init__(self, max_workers=16):
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.saturated = 0
+        self._slots = threading.BoundedSemaphore(max_workers)
+
+    def try_submit(self, fn, *args):
+        """
+        Returns:
+            Future or None: None if every worker is busy (nothing was submitted)
+        """
+        if not self._slots.acquire(blocking=False):
+            self.saturated += 1
+            return None
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+# If the first POST hasn't answered by HEDGE_PERCENTILE of recent latency, a
+# duplicate is sent and whichever answers first wins (cuts the slow tail).
+HEDGE_ENABLED = os.getenv('HEDGE_UPSTREAM', '0') == '1'
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', 95))
+hedge_budget = HedgeBudget(ratio=float(os.getenv('HEDGE_BUDGET_RATIO', 0.1)))
+hedge_pool = HedgePool(max_workers=16)
 
 # --- Setup: Rate Limiting (v2.5.0 Phase 4) ---
 class RateLimiter:
@@ -134,12 +1256,14 @@ class RateLimiter:
         cutoff_time = current_time - self.window_seconds
         return [ts for ts in request_list if ts > cutoff_time]
 
-    def is_allowed(self, session_id):
+    def is_allowed(self, session_id, cost=1):
         """
         Check if request is allowed for this session.
 
         Args:
             session_id (str): Session identifier
+            cost (int): Requests to charge at once (a /getPrices batch
+                charges one per upstream lookup); all or nothing
 
         Returns:
             tuple: (allowed: bool, reason: str, retry_after: int)
@@ -153,7 +1277,7 @@ class RateLimiter:
         self.global_requests = self._clean_old_requests(self.global_requests, current_time)
 
         # Check global limit
-        if len(self.global_requests) >= self.global_limit:
+        if len(self.global_requests) + cost > self.global_limit:
             oldest_request = min(self.global_requests)
             retry_after = int(self.window_seconds - (current_time - oldest_request))
             return (False, "global", retry_after)
@@ -167,14 +1291,14 @@ class RateLimiter:
             self.session_requests[session_id] = []
 
         # Check session limit
-        if len(self.session_requests[session_id]) >= self.per_session_limit:
+        if len(self.session_requests[session_id]) + cost > self.per_session_limit:
             oldest_request = min(self.session_requests[session_id])
             retry_after = int(self.window_seconds - (current_time - oldest_request))
             return (False, "session", retry_after)
 
         # Allow request - record it
-        self.global_requests.append(current_time)
-        self.session_requests[session_id].append(current_time)
+        self.global_requests.extend([current_time] * cost)
+        self.session_requests[session_id].extend([current_time] * cost)
 
         return (True, None, 0)
 
@@ -184,6 +1308,31 @@ rate_limiter = RateLimiter(per_session_limit=30, global_limit=200, window_second
 # To enable, set this in your GCF Environment Variables
 # API_KEY = os.environ.get('YOUR_APP_API_KEY', 'default-key-change-me')
 
+# --- Setup: Admin Endpoints ---
+# Operational endpoints that do heavy work (POST /warmCache, POST
+# /reloadCatalog) are only served with "Authorization: Bearer <ADMIN_TOKEN>"
+# - e.g. from Cloud Scheduler or a deploy script.
+# Without ADMIN_TOKEN set they are disabled.
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+def check_admin_token(request):
+    """
+    Checks the bearer token on an admin request.
+
+    Args:
+        request: Flask/Functions Framework request object
+
+    Returns:
+        tuple or None: (error_response_dict, status_code) if the request is
+            not allowed, None if it is
+    """
+    if not ADMIN_TOKEN:
+        return create_error_response("E2008", details={"reason": "admin endpoints are disabled (ADMIN_TOKEN not set)"}), 403
+    auth_header = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(auth_header.encode(), f"Bearer {ADMIN_TOKEN}".encode()):
+        return create_error_response("E2008", details={"reason": "missing or invalid admin token"}), 401
+    return None
+
 # --- Request ID Tracing (v2.5.0 Phase 3) ---
 def get_request_id(request):
     """
@@ -201,6 +1350,103 @@ def get_request_id(request):
         return request_id[-8:]  # Last 8 chars for brevity
     return request_id
 
+# --- Request Deadlines ---
+# Every request gets a time budget so tail latency stays under the Cloud
+# Functions timeout (60s). Callers can shorten (never extend) it with the
+# X-Request-Deadline-Ms header. The budget is passed down the pricing pipeline
+# to shrink upstream timeouts and retries, and it stops the chat loop early.
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+DEFAULT_REQUEST_DEADLINE = 15
+REQUEST_DEADLINES = {
+    '/getPrice': 15,
+    '/getPrices': 25,
+    '/chat': 50,
+}
+MIN_UPSTREAM_BUDGET = 0.5  # Don't start an upstream call with less time than this
+CHAT_MIN_LLM_BUDGET = 5  # Don't start a Grok call with less time than this
+
+class Deadline:
+    """
+    Absolute time budget for one request.
+
+    Args:
+        seconds (float): Budget from now
+    """
+    def __init__(self, seconds):
+        self.budget = seconds
+        self.expires_at = time.time() + seconds
+
+    def remaining(self):
+        """Seconds left (never negative)."""
+        return max(0.0, self.expires_at - time.time())
+
+    def expired(self, margin=0):
+        """True once fewer than margin seconds are left."""
+        return self.remaining() <= margin
+
+    def __repr__(self):
+        return f"Deadline({self.remaining():.2f}s of {self.budget}s left)"
+
+def get_request_deadline(request):
+    """
+    Builds the deadline for a request from its endpoint default and the
+    optional X-Request-Deadline-Ms header.
+
+    Args:
+        request: Flask/Functions Framework request object
+
+    Returns:
+        Deadline: Budget of min(endpoint default, header value)
+    """
+    seconds = REQUEST_DEADLINES.get(request.path, DEFAULT_REQUEST_DEADLINE)
+    header_value = request.headers.get(DEADLINE_HEADER)
+    if header_value:
+        try:
+            seconds = min(seconds, max(0.1, float(header_value) / 1000))
+        except ValueError:
+            print(f"  [WARNING] Ignoring invalid {DEADLINE_HEADER} header: {header_value!r}")
+    return Deadline(seconds)
+
+def plan_upstream_call(deadline, timeout):
+    """
+    Fits an upstream call's timeout and retry count into the remaining budget.
+
+    Retries are only allowed while every attempt (plus urllib3's backoff
+    sleeps of 0s, 2s, 4s...) still fits before the deadline.
+
+    Args:
+        deadline (Deadline): Request deadline, or None for no limit
+        timeout (float): Preferred per-attempt timeout in seconds
+
+    Returns:
+        tuple: (timeout, retries)
+    """
+    if deadline is None:
+        return timeout, UPSTREAM_MAX_RETRIES
+    remaining = deadline.remaining()
+    timeout = min(timeout, remaining)
+
+    def backoff_total(retries):
+        return sum(UPSTREAM_BACKOFF_FACTOR * 2 ** (n - 1) for n in range(2, retries + 1))
+
+    retries = 0
+    while retries < UPSTREAM_MAX_RETRIES and (retries + 2) * timeout + backoff_total(retries + 1) <= remaining:
+        retries += 1
+    return timeout, retries
+
+def deadline_exceeded_response(stage):
+    """
+    Builds the E1009 response for a request that ran out of time.
+
+    Args:
+        stage (str): Where the deadline hit (for debugging)
+
+    Returns:
+        tuple: (response_dict, 504)
+    """
+    print(f"  [Deadline] Request deadline exceeded at stage: {stage}")
+    return create_error_response("E1009", details={"stage": stage}), 504
+
 # --- Helper Function to Load Dictionaries ---
 def load_json_file(filename):
     """
@@ -320,19 +1566,98 @@ def get_queries_from_gcs(limit=100, session_id=None):
         return []
 
 # --- Load our "Translation Dictionaries" ---
-# This happens once when the function instance starts.
+# Loaded when the function instance starts. catalog.snapshot (written by
+# sku_discovery_tool.py) holds the dictionaries and every index prebuilt; if
+# it's missing or stale we parse the JSON files and build the indexes here.
+#
+# The live catalog is catalog_manager.current (a catalog.Catalog):
+#   .products / .sizes / .covers / .fabrics - the four translation dictionaries
+#   .query_parser   - single-pass query parser (see resolve_query)
+#   .color_index    - colour-token index for search_fabrics_by_color
+#   .price_index    - price-sorted product index for search_by_budget
+#   .product_names  - product-name prefix index for the chat tools' product_name
+# Handlers read it once per request: POST /reloadCatalog can swap in a fresh
+# scrape at any time (from CATALOG_BUCKET/CATALOG_PREFIX on GCS, or the local
+# CATALOG_RELOAD_DIR) without restarting the instance.
+CATALOG_BUCKET = os.getenv('CATALOG_BUCKET')
+CATALOG_PREFIX = os.getenv('CATALOG_PREFIX', '')
+CATALOG_RELOAD_DIR = os.getenv('CATALOG_RELOAD_DIR')  # Defaults to the deploy folder
+
+def download_catalog_files(staging_dir):
+    """
+    Downloads the catalog files from CATALOG_BUCKET/CATALOG_PREFIX.
+
+    Copies whichever of the four JSON files and fabrics.shards exist under
+    the prefix. catalog.snapshot is deliberately not fetched: it is a pickle,
+    and unpickling a file from the bucket would run code for anyone who can
+    write to it. The new catalog is built from the JSON files instead.
+
+    Args:
+        staging_dir (str): Empty folder to download into
+
+    Raises:
+        RuntimeError: If the GCS client is unavailable or nothing was found
+    """
+    if not storage_client:
+        raise RuntimeError("GCS client unavailable")
+    bucket = storage_client.bucket(CATALOG_BUCKET)
+    found = []
+    for filename in (*CATALOG_FILES, SHARDS_FILE):
+        blob = bucket.blob(f"{CATALOG_PREFIX}{filename}")
+        if blob.exists():
+            blob.download_to_filename(os.path.join(staging_dir, filename))
+            found.append(filename)
+    if not found:
+        raise RuntimeError(f"No catalog files under gs://{CATALOG_BUCKET}/{CATALOG_PREFIX}")
+    print(f"  [Catalog] Downloaded {', '.join(found)} from gs://{CATALOG_BUCKET}/{CATALOG_PREFIX}")
+
+def invalidate_catalog_caches(old_catalog, new_catalog):
+    """
+    Drops everything derived from the previous catalog version.
+
+    Memoized resolutions and remembered failures point at the old SKUs, and
+    cached prices (L1, L2, tier cache) carry the old fabric names, tiers and
+    descriptions. The offline price table is left alone (it is keyed by
+    product/size/cover/tier and has its own max age).
+
+    Args:
+        old_catalog (Catalog): Catalog that was replaced
+        new_catalog (Catalog): Catalog now live
+    """
+    invalidate_query_memo()
+    tier_prices.clear()
+    response_cache.clear()
+    purged = price_store.clear() if price_store else 0
+    print(f"  [Catalog] Price caches cleared for {old_catalog.version} -> {new_catalog.version} "
+          f"({purged} L2 entries purged)")
+
 print("Loading translation dictionaries...")
-PRODUCT_SKU_MAP = load_json_file("products.json") 
-SIZE_SKU_MAP = load_json_file("sizes.json")
-COVERS_SKU_MAP = load_json_file("covers.json")
-FABRIC_SKU_MAP = load_json_file("fabrics.json")
+catalog_manager = CatalogManager(
+    os.path.dirname(__file__),
+    json_loader=load_json_file,
+    reload_directory=CATALOG_RELOAD_DIR,
+    fetch=download_catalog_files if CATALOG_BUCKET else None,
+    on_swap=invalidate_catalog_caches,
+    force_interval=int(os.getenv('CATALOG_FORCE_RELOAD_INTERVAL', 300)),
+    use_snapshot=os.getenv('CATALOG_SNAPSHOT', '1') != '0',
+    verify_snapshot=os.getenv('CATALOG_SNAPSHOT_VERIFY', '1') != '0',
+    shards=os.getenv('FABRIC_SHARDS', '1') != '0',  # Uses fabrics.shards when deployed
+    max_resident=int(os.getenv('FABRIC_SHARD_CACHE', 32))
+)
 print("Dictionaries loaded successfully.")
+print(f"Indexed {catalog_manager.current.color_index.size} unique fabric colours.")
 
 
 # --- The Sofas & Stuff API Endpoints we found (FINAL) ---
 SOFA_API_URL = "https://sofasandstuff.com/ProductExtend/ChangeProductSize"
 BED_API_URL = "https://sofasandstuff.com/Category/ProductPrice"
 
+# One circuit breaker per endpoint: a failing bed API doesn't block sofas
+upstream_breakers = {
+    SOFA_API_URL: CircuitBreaker("sofa_api"),
+    BED_API_URL: CircuitBreaker("bed_api"),
+}
+
 # --- xAI/Grok Configuration ---
 # Environment variables for xAI API integration (direct, not via OpenRouter)
 XAI_API_KEY = os.getenv('XAI_API_KEY')
@@ -363,6 +1688,15 @@ except Exception as e:
 # Thread pool for async query logging (non-blocking)
 query_log_executor = ThreadPoolExecutor(max_workers=2)
 
+# Thread pool for concurrent S&S price lookups (batch pricing, size discovery,
+# stale-while-revalidate refreshes)
+price_fetch_executor = ThreadPoolExecutor(max_workers=8)
+_refreshing_keys = set()  # Cache keys with a background refresh queued or running
+_refresh_lock = threading.Lock()
+MAX_BATCH_QUERIES = 50  # Max queries per /getPrices request
+BATCH_MAX_CONCURRENCY = 4  # Max upstream lookups one /getPrices batch runs at once (leaves price_fetch_executor room for others)
+SIZE_DISCOVERY_DEADLINE = 8  # Seconds search_by_budget waits for size prices before returning partial results
+
 # --- System Prompt for Grok (Phase 1C) - LEAN VERSION FOR SPEED ---
 SYSTEM_PROMPT = """You are an elite sales assistant for Sofas & Stuff. Your mission: Find what the customer wants WITHOUT making them work for it.
 
@@ -675,7 +2009,7 @@ TOOLS = [
         "type": "function",
         "function": {
             "name": "search_fabrics_by_color",
-            "description": "Search for fabric options by color. Returns fabrics matching the specified color across all products (or a specific product if provided). Use this when customer asks 'show me blue fabrics' or 'what fabrics do you have in grey'. Returns fabric names, colors, tiers, and swatch images.",
+            "description": "Search for fabric options by color. Returns fabrics matching the specified color across all products (or a specific product if provided). Use this when customer asks 'show me blue fabrics' or 'what fabrics do you have in grey'. A color family covers all its shades in one call ('blue' also returns navy, teal, indigo, denim...), so don't search each shade separately. Returns fabric names, colors, tiers, and swatch images.",
             "parameters": {
                 "type": "object",
                 "properties": {
@@ -694,34 +2028,28 @@ TOOLS = [
     }
 ]
 
-def get_price_tool_handler(query):
+def get_price_tool_handler(query, deadline=None):
     """
     Tool handler wrapper for get_price.
 
-    Takes query string directly (not Flask request) and calls existing get_price_logic.
+    Takes query string directly (not Flask request) and calls get_price_for_query.
+    deadline (optional) is the calling chat request's Deadline.
     Returns: (result_dict, status_code)
 
     This wrapper allows Grok to call get_price as a tool without needing Flask request object.
+    An empty query gets the same E2007 validation error as /getPrice.
     """
-    # Create a mock request object with the query
-    class MockRequest:
-        def __init__(self, query):
-            self._json = {"query": query}
-            self.headers = {"User-Agent": "Grok-LLM-Tool"}
-
-        def get_json(self):
-            return self._json
-
-    mock_request = MockRequest(query)
-
-    # Call existing get_price_logic
-    result, status_code = get_price_logic(mock_request)
+    query = (query or '').lower()
+    if not query.strip():
+        result, status_code = create_error_response("E2007", details={"field": "query"}), 400
+    else:
+        result, status_code = get_price_for_query(query, user_agent="Grok-LLM-Tool", deadline=deadline)
 
     print(f"  [Tool:get_price] Query: '{query}' -> Status: {status_code}")
 
     return result, status_code
 
-def search_by_budget_handler(max_price, product_name=None, product_type="all"):
+def search_by_budget_handler(max_price, product_name=None, product_type="all", deadline=None):
     """
     Tool handler for search_by_budget.
 
@@ -730,14 +2058,19 @@ def search_by_budget_handler(max_price, product_name=None, product_type="all"):
 
     When product_name is provided, this function will:
     1. Find the matching product and its SKU
-    2. Look up all available sizes in SIZE_SKU_MAP
-    3. Dynamically fetch pricing for each size using get_price
-    4. Return all size variations (e.g., "Sudbury 2.5 Seater", "Sudbury 3 Seater")
+    2. Look up all available sizes in the catalog's size map
+    3. Fetch pricing for every size concurrently using get_price (bounded pool,
+       SIZE_DISCOVERY_DEADLINE seconds overall)
+    4. Return all size variations (e.g., "Sudbury 2.5 Seater", "Sudbury 3 Seater");
+       sizes still pending at the deadline are listed in "timed_out_sizes"
 
     Args:
         max_price (int/float): Maximum budget in GBP
-        product_name (str): Optional filter - product name to search for (case-insensitive, partial match)
+        product_name (str): Optional filter - product name (case-insensitive, word
+            prefixes of the keyword or full name, typo-tolerant; see ProductNameIndex)
         product_type (str): Optional filter - 'sofa', 'bed', 'chair', 'footstool', 'dog_bed', or 'all'
+        deadline (Deadline): Optional request deadline; size discovery waits at
+            most until then (if sooner than SIZE_DISCOVERY_DEADLINE)
 
     Returns:
         (result_dict, status_code)
@@ -749,32 +2082,21 @@ def search_by_budget_handler(max_price, product_name=None, product_type="all"):
         max_price = float(max_price)
         if max_price <= 0:
             return {"error": "Budget must be greater than £0"}, 400
+        catalog = catalog_manager.current
 
         # ==== SIZE VARIATION DISCOVERY MODE ====
         # If product_name is provided, try to find all size variations dynamically
         if product_name:
-            product_name_lower = product_name.lower().strip()
-
-            # Find the matching product in PRODUCT_SKU_MAP
-            matched_product = None
-            matched_keyword = None
-
-            for keyword, product_data in PRODUCT_SKU_MAP.items():
-                keyword_lower = keyword.lower()
-                full_name_lower = product_data.get("full_name", "").lower()
-
-                if product_name_lower in keyword_lower or product_name_lower in full_name_lower:
-                    matched_product = product_data
-                    matched_keyword = keyword
-                    break
+            # Find the best matching product in the catalog
+            matched_keyword, matched_product = catalog.product_names.best(product_name)
 
             if matched_product:
                 product_sku = matched_product.get("sku")
                 print(f"  [Size Discovery] Found product: {matched_keyword}, SKU: {product_sku}")
 
-                # Check if this product has multiple sizes in SIZE_SKU_MAP
-                if product_sku and product_sku in SIZE_SKU_MAP:
-                    sizes_map = SIZE_SKU_MAP[product_sku]
+                # Check if this product has multiple sizes
+                if product_sku and product_sku in catalog.sizes:
+                    sizes_map = catalog.sizes[product_sku]
                     print(f"  [Size Discovery] Found {len(sizes_map)} size entries for SKU {product_sku}")
 
                     # Extract unique size names (filter out SKU-only entries like '3se': '3se')
@@ -786,16 +2108,35 @@ def search_by_budget_handler(max_price, product_name=None, product_type="all"):
 
                     print(f"  [Size Discovery] Unique sizes found: {unique_sizes}")
 
-                    # For each size, fetch actual pricing using get_price
-                    matching_products = []
+                    # Fetch actual pricing for every size concurrently (bounded pool),
+                    # waiting at most SIZE_DISCOVERY_DEADLINE seconds overall
+                    futures = {}
                     for size_name in unique_sizes:
                         # Construct query: "product_keyword size pacific" (use default fabric)
                         # Use a common default fabric for base pricing
                         query = f"{matched_keyword} {size_name} pacific"
                         print(f"  [Size Discovery] Fetching price for: {query}")
+                        futures[price_fetch_executor.submit(get_price_tool_handler, query, deadline)] = (size_name, query)
+
+                    discovery_timeout = SIZE_DISCOVERY_DEADLINE
+                    if deadline:
+                        discovery_timeout = min(discovery_timeout, deadline.remaining())
+                    done, not_done = wait(futures, timeout=discovery_timeout)
+                    timed_out_sizes = []
+                    for future in not_done:
+                        future.cancel()  # Drops it if still queued; running lookups finish and fill the cache
+                        timed_out_sizes.append(futures[future][0])
+                        print(f"  [Size Discovery] ✗ Deadline reached before price for {futures[future][1]}")
 
-                        # Call get_price to get actual pricing for this size
-                        result, status_code = get_price_tool_handler(query)
+                    matching_products = []
+                    for future, (size_name, query) in futures.items():
+                        if future not in done:
+                            continue
+                        try:
+                            result, status_code = future.result()
+                        except Exception as e:
+                            print(f"  [Size Discovery] ✗ Price lookup raised for {query}: {e}")
+                            continue
 
                         if status_code == 200:
                             # Successfully got pricing for this size
@@ -832,6 +2173,8 @@ def search_by_budget_handler(max_price, product_name=None, product_type="all"):
                             "count": len(matching_products),
                             "products": matching_products,
                             "truncated": False,
+                            "partial": bool(timed_out_sizes),
+                            "timed_out_sizes": timed_out_sizes,
                             "discovery_mode": "size_variations",
                             "base_product": matched_keyword,
                             "fabric_tier_guidance": {
@@ -841,44 +2184,14 @@ def search_by_budget_handler(max_price, product_name=None, product_type="all"):
                         }, 200
 
         # ==== STANDARD BUDGET SEARCH MODE ====
-        # If we didn't find size variations, fall back to standard product search
-        matching_products = []
-
-        for keyword, product_data in PRODUCT_SKU_MAP.items():
-            # Skip if product doesn't match name filter (if provided)
-            if product_name:
-                product_name_lower = product_name.lower().strip()
-                keyword_lower = keyword.lower()
-                full_name_lower = product_data.get("full_name", "").lower()
-
-                # Check if search term appears in either keyword or full_name
-                if product_name_lower not in keyword_lower and product_name_lower not in full_name_lower:
-                    continue
-
-            # Skip if product doesn't match type filter
-            if product_type != "all" and product_data.get("type") != product_type:
-                continue
-
-            # Check if base price is within budget
-            base_price = int(product_data.get("price", 999999))
-            if base_price <= max_price:
-                matching_products.append({
-                    "name": product_data.get("full_name", keyword),
-                    "base_price": base_price,
-                    "price_display": product_data.get("price_display", f"£{base_price:,}"),
-                    "type": product_data.get("type", "unknown"),
-                    "sku": product_data.get("sku")
-                })
-
-        # Sort by price (ascending)
-        matching_products.sort(key=lambda x: x["base_price"])
-
-        # Limit results to top 20 to avoid overwhelming response
-        if len(matching_products) > 20:
-            matching_products = matching_products[:20]
-            truncated = True
-        else:
-            truncated = False
+        # If we didn't find size variations, fall back to standard product search.
+        # Cheapest 20 within budget, filtered by type and name (keyword or full_name)
+        matching_products, truncated = catalog.price_index.search(
+            max_price,
+            product_type=product_type,
+            keywords=catalog.product_names.keywords(product_name) if product_name else None,
+            limit=20
+        )
 
         print(f"  [Tool:search_by_budget] Found {len(matching_products)} products under £{max_price}")
 
@@ -930,17 +2243,15 @@ def search_fabrics_by_color_handler(color, product_name=None):
         color_lower = color.lower().strip()
         if not color_lower:
             return {"error": "Color cannot be empty"}, 400
+        catalog = catalog_manager.current
 
         # If product_name provided, find its SKU
         target_product_sku = None
         if product_name:
-            product_name_lower = product_name.lower().strip()
-            # Find matching product
-            for keyword, product_data in PRODUCT_SKU_MAP.items():
-                if keyword == product_name_lower or product_data.get("full_name", "").lower().find(product_name_lower) >= 0:
-                    target_product_sku = product_data.get("sku")
-                    print(f"  [Tool:search_fabrics_by_color] Limiting to product SKU: {target_product_sku}")
-                    break
+            _, product_data = catalog.product_names.best(product_name)
+            if product_data:
+                target_product_sku = product_data.get("sku")
+                print(f"  [Tool:search_fabrics_by_color] Limiting to product SKU: {target_product_sku}")
 
             if not target_product_sku:
                 return {
@@ -948,43 +2259,11 @@ def search_fabrics_by_color_handler(color, product_name=None):
                     "suggestion": "Try searching without specifying a product, or check the product name"
                 }, 404
 
-        # Search for matching fabrics
-        matching_fabrics = []
-        seen_fabrics = set()  # Track unique fabric+color combinations
-
-        # Determine which products to search
-        products_to_search = {}
-        if target_product_sku:
-            products_to_search = {target_product_sku: FABRIC_SKU_MAP.get(target_product_sku, {})}
-        else:
-            products_to_search = FABRIC_SKU_MAP
-
-        # Search through fabrics
-        for product_sku, fabric_map in products_to_search.items():
-            for fabric_keyword, fabric_data in fabric_map.items():
-                color_name = fabric_data.get("color_name", "")
-
-                # Check if color matches
-                if color_lower in color_name.lower():
-                    # Create unique key to avoid duplicates
-                    unique_key = f"{fabric_data.get('fabric_sku')}-{fabric_data.get('color_sku')}"
-
-                    if unique_key not in seen_fabrics:
-                        seen_fabrics.add(unique_key)
-                        matching_fabrics.append({
-                            "fabric_name": fabric_data.get("fabric_name", "Unknown"),
-                            "color_name": color_name,
-                            "tier": fabric_data.get("tier", "Unknown"),
-                            "collection": fabric_data.get("collection", ""),
-                            "description": fabric_data.get("desc", "")[:200] + "..." if len(fabric_data.get("desc", "")) > 200 else fabric_data.get("desc", ""),
-                            "swatch_url": fabric_data.get("swatch_url", ""),
-                            "fabric_sku": fabric_data.get("fabric_sku"),
-                            "color_sku": fabric_data.get("color_sku")
-                        })
-
-        # Sort by tier (Essentials first, then Premium, then Luxury) and then by fabric name
-        tier_order = {"Essentials": 1, "Premium": 2, "Luxury": 3}
-        matching_fabrics.sort(key=lambda x: (tier_order.get(x["tier"], 99), x["fabric_name"], x["color_name"]))
+        # Index lookup: unique fabric/colour records, already sorted by tier
+        # (Essentials first, then Premium, then Luxury), fabric and colour name.
+        # A family name ("blue") also returns its shades (navy, teal, denim...)
+        matching_fabrics = catalog.color_index.search(color_lower, product_sku=target_product_sku)
+        family = color_family(color_lower)
 
         # Limit results to 30 to avoid overwhelming response
         if len(matching_fabrics) > 30:
@@ -1015,7 +2294,8 @@ def search_fabrics_by_color_handler(color, product_name=None):
             "fabrics": matching_fabrics,
             "grouped_by_tier": by_tier,
             "truncated": truncated,
-            "context": f"Showing {color} fabrics" + (f" for {product_name}" if product_name else " across all products"),
+            "color_family": family,
+            "context": f"Showing {color} fabrics" + (" (all shades)" if family else "") + (f" for {product_name}" if product_name else " across all products"),
             "next_steps": "Show customer the options by tier. When they choose a fabric, use get_price to calculate exact pricing with their product and size."
         }, 200
 
@@ -1056,54 +2336,6 @@ def _add_cors_headers(response):
     response.headers.add("Access-Control-Allow-Origin", "*")
     return response
 
-# --- Search Helper (Critique #5) ---
-def find_best_matches(query, mapping, fuzziness=85):
-    """
-    Finds matching keywords from a mapping using regex and fuzzy matching.
-
-    First attempts exact regex word-boundary matching for speed. If no exact
-    matches, falls back to fuzzy string matching with configurable threshold.
-
-    Args:
-        query (str): Search query to match against (case-insensitive)
-        mapping (dict): Dictionary mapping keywords to values
-        fuzziness (int): Minimum fuzzy match score (0-100, default: 85)
-
-    Returns:
-        list: Tuples of (keyword, value, confidence_score) sorted by confidence desc.
-              Empty list if no matches found.
-
-    Side effects:
-        Prints fuzzy match info when fuzzy matching is used
-    """
-    matches = []
-    if not mapping:
-        return matches
-    
-    # 1. Try exact and prefix matching (fast and precise)
-    for keyword, value in mapping.items():
-        # Exact match with word boundaries
-        if re.search(r'\b' + re.escape(keyword) + r'\b', query, re.IGNORECASE):
-            confidence = 100 + len(keyword)
-            matches.append((keyword, value, confidence))
-        # Prefix match: query contains start of keyword (e.g., "3 seater" matches "3 seater sofa")
-        # This allows "3 seater" to match "3 seater sofa" without fuzzy matching
-        elif re.search(r'\b' + re.escape(keyword), query, re.IGNORECASE):
-            # Lower confidence for prefix matches
-            confidence = 90 + len(keyword)
-            matches.append((keyword, value, confidence))
-
-    if matches:
-        matches.sort(key=lambda x: x[2], reverse=True)
-        return matches
-
-    # 2. NO FUZZY MATCHING - Causes dangerous errors like 3-seater→4-seater
-    # Grok handles typo correction at the LLM layer
-    # If no exact match, return empty list and let Grok try alternative queries
-    print(f"  [No Exact Match] Query '{query}' found no exact matches in mapping")
-    return matches
-
-
 # --- Cache Helpers (Critique #10) ---
 def get_cache_key(product_sku, size_sku, cover_sku, fabric_sku, color_sku):
     """
@@ -1125,21 +2357,46 @@ def get_cache_key(product_sku, size_sku, cover_sku, fabric_sku, color_sku):
     """
     return md5(f"{product_sku}{size_sku}{cover_sku}{fabric_sku}{color_sku}".encode()).hexdigest()
 
-def get_from_cache(cache_key):
+def get_from_cache(cache_key, allow_stale=False):
     """
     Retrieves cached pricing response if available and not expired.
 
+    Checks the in-memory cache first, then the persistent L2 store (if
+    enabled). A fresh L2 hit is copied into L1 with its original age.
+
     Args:
         cache_key (str): MD5 hash cache key from get_cache_key()
+        allow_stale (bool): Also return entries past CACHE_TTL (up to
+            CACHE_HARD_TTL, in both L1 and L2). These come back as a copy
+            with "stale": True.
 
     Returns:
         dict or None: Cached response data if found and not expired, None otherwise
 
     Side effects:
-        Prints cache HIT or MISS log message
+        Prints cache HIT, STALE or MISS log message
     """
-    cached_data = response_cache.get(cache_key)
+    if allow_stale:
+        cached_data, is_stale = response_cache.get_allow_stale(cache_key)
+    else:
+        cached_data, is_stale = response_cache.get(cache_key), False
+
+    if not cached_data and price_store:
+        stored_data, age = price_store.get(cache_key)
+        if stored_data:
+            if age < CACHE_TTL:
+                response_cache.set(cache_key, stored_data, timestamp=time.time() - age)
+                cached_data, is_stale = stored_data, False
+                print(f"  [L2 HIT] Loaded {cache_key} into memory cache")
+            elif allow_stale and age < CACHE_HARD_TTL:
+                # Not copied into L1 - the background refresh fills both tiers
+                cached_data, is_stale = stored_data, True
+                print(f"  [L2 HIT] Stored entry {cache_key} is {int(age)}s old")
+
     if cached_data:
+        if is_stale:
+            print(f"  [Cache STALE] Serving stale response for {cache_key}")
+            return {**cached_data, "stale": True}
         print(f"  [Cache HIT] Returning cached response for {cache_key}")
         return cached_data
     print(f"  [Cache MISS] for {cache_key}")
@@ -1158,7 +2415,8 @@ def set_to_cache(cache_key, data):
 
     Side effects:
         Prints cache storage log or warning on failure
-        May evict old entries if cache is full (see LRUCache.set)
+        May evict old entries if the shard is full (see LRUCache.set)
+        Writes through to the L2 store when PRICE_CACHE_DB is set
     """
     try:
         response_cache.set(cache_key, data)
@@ -1166,6 +2424,8 @@ def set_to_cache(cache_key, data):
     except Exception as e:
         # Non-fatal - log warning but don't crash if cache fails
         print(f"  [WARNING] Cache write failed: {e}")
+    if price_store:
+        price_store.set(cache_key, data)
 
 # --- Main Logic Function ---
 def get_price_logic(request):
@@ -1197,6 +2457,7 @@ def get_price_logic(request):
         E2002: Ambiguous product match
         E2003: Fabric not found
         E2004: Size not valid
+        E1009: Request deadline exceeded (see X-Request-Deadline-Ms)
     """
     
     # --- (Critique #7: Authentication - COMMENTED OUT) ---
@@ -1218,111 +2479,466 @@ def get_price_logic(request):
     query = data.get('query', '').lower()
     user_agent = request.headers.get('User-Agent', 'Mozilla/5.0')
     request_id = get_request_id(request)
+    deadline = get_request_deadline(request)
 
     if not query:
         return create_error_response("E2007", details={"field": "query"}), 400
 
+    return get_price_for_query(query, user_agent=user_agent, request_id=request_id, deadline=deadline)
+
+def resolve_query(query, catalog=None):
+    """
+    Resolves a natural language query to SKUs in a single pass.
+
+    Pure function (no I/O): product, size, cover and fabric are all resolved
+    from one scan of the query by the catalog's QueryParser.
+
+    Args:
+        query (str): Natural language pricing query (any case)
+        catalog (Catalog): Catalog to resolve against (default: the live one)
+
+    Returns:
+        QueryResolution: Resolved SKUs, confidence and ambiguity info, or an
+                         error_code/status_code if the query can't be resolved
+    """
+    if catalog is None:
+        catalog = catalog_manager.current
+    return catalog.query_parser.parse(query.lower())
+
+def get_price_for_query(query, user_agent='Mozilla/5.0', request_id='unknown', deadline=None):
+    """
+    Prices a natural language query (everything after request parsing).
+
+    Shared by the /getPrice endpoint and the get_price chat tool, so tool calls
+    don't need a mock Flask request.
+
+    Args:
+        query (str): Lowercased natural language pricing query
+        user_agent (str): User-Agent forwarded to the S&S API
+        request_id (str): Request ID for log correlation
+        deadline (Deadline): Request deadline, or None for no limit
+
+    Returns:
+        tuple: (response_dict, status_code) - same contract as get_price_logic
+    """
     print(f"[{request_id}] --- New Query: '{query}' ---")
 
-    # --- 2. Translation Logic (Ambiguity Check - Critique #5) ---
-    
-    product_sku = None
-    product_name = None
-    product_type = None 
-    size_sku = None
-    cover_sku = None
-    fabric_match_data = None
-    
-    # Find Product (and its SKU and TYPE)
-    product_matches = find_best_matches(query, PRODUCT_SKU_MAP)
-    if not product_matches:
-        print(f"[{request_id}]  [Error] No product match found for query: {query}")
-        return create_error_response("E2001"), 400
-
-    # Check for ambiguity
-    if len(product_matches) > 1 and product_matches[0][2] == product_matches[1][2]:
-         suggestions = [m[1]["full_name"] for m in product_matches[:3]]
-         print(f"[{request_id}]  [Error] Ambiguous product: {suggestions}")
-         return create_error_response(
-             "E2002",
-             custom_user_message=f"Multiple products match. Did you mean: {', '.join(suggestions)}?",
-             details={"options": suggestions}
-         ), 400
-
-    product_name_keyword, product_data = product_matches[0][0], product_matches[0][1]
-    product_sku = product_data["sku"]
-    product_type = product_data["type"] # This is "sofa", "bed", "chair", etc.
-    print(f"[{request_id}]  [Match] Product: '{product_name_keyword}' -> SKU: '{product_sku}', Type: '{product_type}'")
-
-    # Find Size (based on the product_sku)
-    product_size_map = SIZE_SKU_MAP.get(product_sku, {})
-    size_matches = find_best_matches(query, product_size_map)
-    if not size_matches:
-         # For products like footstools, they might not say a size.
-         if product_type in ["footstool", "dog_bed"] and product_size_map:
-             size_sku = list(product_size_map.values())[0] # Default to first size
-             print(f"  [Info] No size specified, defaulting to first available: '{size_sku}'")
-         else:
-            print(f"  [Error] No size match for {product_sku}. Map: {product_size_map}")
-            return create_error_response("E2003"), 400
+    resolution, cache_key = resolve_for_pricing(query, request_id=request_id)
+    if not resolution.ok:
+        return resolution_error_response(resolution), resolution.status_code
+
+    if deadline and deadline.expired():
+        return deadline_exceeded_response("resolve")
+
+    return fetch_price(resolution, cache_key, query, user_agent=user_agent, deadline=deadline)
+
+def resolve_for_pricing(query, request_id='unknown'):
+    """
+    Translation step of pricing: memo and negative cache lookup, then
+    single-pass resolution.
+
+    Args:
+        query (str): Lowercased natural language pricing query
+        request_id (str): Request ID for log correlation
+
+    Returns:
+        tuple: (QueryResolution, cache_key) - cache_key is None if unresolved
+    """
+    # --- 2. Translation Logic (single pass, Ambiguity Check - Critique #5) ---
+    # Popular queries are answered from the resolved-query memo without matching.
+    # Memo and negative entries are per catalog version, so a request that
+    # straddles a reload can't store an old resolution under the new catalog
+    catalog = catalog_manager.current
+    normalized_query = catalog.query_parser.normalize(query)
+    memo_key = f"{catalog.version}:{normalized_query}"
+    memo_entry = query_memo.get(memo_key)
+    if memo_entry:
+        resolution, cache_key = memo_entry
+        print(f"[{request_id}]  [Memo HIT] '{normalized_query}' -> {resolution.sku_tuple()}")
+        return resolution, cache_key
+
+    failed_resolution = negative_cache.get(negative_query_key(memo_key))
+    if failed_resolution:
+        print(f"[{request_id}]  [Negative HIT] {failed_resolution.error_code} for query: {query}")
+        return failed_resolution, None
+
+    resolution = resolve_query(normalized_query, catalog)
+    if not resolution.ok:
+        print(f"[{request_id}]  [Error] {resolution.error_code} for query: {query} {resolution.options or ''}")
+        negative_cache.set(negative_query_key(memo_key), resolution, NEGATIVE_CACHE_CLIENT_TTL)
+        return resolution, None
+
+    cache_key = get_cache_key(*resolution.sku_tuple())
+    query_memo.set(memo_key, (resolution, cache_key))
+
+    print(f"[{request_id}]  [Match] Product: '{resolution.product_keyword}' -> SKU: '{resolution.product_sku}', Type: '{resolution.product_type}'")
+    if "size" in resolution.defaults:
+        print(f"  [Info] No size specified, defaulting to first available: '{resolution.size_sku}'")
     else:
-        size_sku = size_matches[0][1] # [1] is the SKU
-        print(f"  [Match] Size: '{size_matches[0][0]}' -> SKU: '{size_sku}'")
-
-    # Find Cover (based on the product_sku)
-    product_cover_map = COVERS_SKU_MAP.get(product_sku, {})
-    cover_matches = find_best_matches(query, product_cover_map)
-    if cover_matches:
-        cover_sku = cover_matches[0][1]
-        print(f"  [Match] Cover: '{cover_matches[0][0]}' -> SKU: '{cover_sku}'")
+        print(f"  [Match] Size: '{resolution.size_keyword}' -> SKU: '{resolution.size_sku}'")
+    if "cover" in resolution.defaults:
+        print(f"  [Info] No cover specified, defaulting to: '{resolution.cover_sku}'")
     else:
-        # (Critique #11) Smart Default
-        cover_sku = "fit" # Default to 'fit'
-        if product_cover_map and "fit" not in product_cover_map.values():
-             # If 'fit' isn't valid, just grab the first available one
-             cover_sku = list(product_cover_map.values())[0]
-        print(f"  [Info] No cover specified, defaulting to: '{cover_sku}'")
-        
-    # Find Fabric (Search *only* within the product's available fabrics)
-    product_fabric_map = FABRIC_SKU_MAP.get(product_sku, {})
-    if not product_fabric_map:
-        print(f"  [Error] No fabric dictionary found for product SKU: {product_sku}")
-        return create_error_response(
-            "E2004",
-            custom_user_message=f"No fabrics available for '{product_data['full_name']}'."
-        ), 404
-
-    fabric_matches = find_best_matches(query, product_fabric_map)
-    if not fabric_matches:
-         print(f"  [Error] No fabric match for query: {query}")
-         return create_error_response("E2004"), 400
-
-    # Ambiguity check for fabrics (e.g., "blue" matching "light blue" and "dark blue")
-    if len(fabric_matches) > 1 and fabric_matches[0][2] < 100: # Check if it wasn't an exact match
-        # Check if top matches are too close to call
-        if fabric_matches[0][2] - fabric_matches[1][2] < 10: # If scores are very close
-            suggestions = [m[0] for m in fabric_matches[:3]]
-            print(f"  [Error] Ambiguous fabric: {suggestions}")
-            return create_error_response(
-                "E2005",
-                custom_user_message=f"Multiple fabrics match. Did you mean: {', '.join(suggestions)}?",
-                details={"options": suggestions}
-            ), 400
-        
-    fabric_match_data = fabric_matches[0][1] # [1] is the fabric data dict
-    print(f"  [Match] Fabric: '{fabric_matches[0][0]}' -> SKU: '{fabric_match_data['fabric_sku']}', Color: '{fabric_match_data['color_sku']}'")
+        print(f"  [Match] Cover: '{resolution.cover_keyword}' -> SKU: '{resolution.cover_sku}'")
+    if resolution.fuzzy:
+        print(f"  [Fuzzy Match] Typo-corrected dimensions: {resolution.fuzzy}")
+    print(f"  [Match] Fabric: '{resolution.fabric_keyword}' -> SKU: '{resolution.fabric_sku}', Color: '{resolution.color_sku}'")
+
+    return resolution, cache_key
+
+def resolution_error_response(resolution):
+    """Builds the standard error response for an unresolved query."""
+    return create_error_response(
+        resolution.error_code,
+        custom_user_message=resolution.error_message,
+        details=resolution.error_details
+    )
 
-    # (Critique #13) Validate fabric_match_data
-    if not fabric_match_data or 'fabric_sku' not in fabric_match_data or 'color_sku' not in fabric_match_data:
-        print(f"  [Error] Invalid fabric data found: {fabric_match_data}")
-        return create_error_response("E3004", details={"product": product_data['full_name']}), 500
-        
+def tier_price_keys(resolution):
+    """
+    Tier cache / price table keys for a resolved query.
+
+    Returns:
+        tuple: (tier_key, colour_key), or (None, None) when price can't be
+               inferred from the tier (mattress tensions, unknown tier)
+    """
+    fabric_match_data = resolution.fabric
+    if resolution.product_type == "mattress" or not isinstance(fabric_match_data, Mapping):
+        return None, None
+    tier = fabric_match_data.get('tier')
+    if not tier or tier == 'Unknown':
+        return None, None
+    tier_key = PriceTable.key(resolution.product_sku, resolution.size_sku, resolution.cover_sku, tier)
+    return tier_key, f"{fabric_match_data.get('fabric_sku', '')}{fabric_match_data.get('color_sku', '')}"
+
+def build_tier_response(resolution, entry, source):
+    """
+    Builds a price response from a tier-level entry (price table or tier cache).
+
+    Same shape as fetch_price_from_upstream's response. Hero images come
+    from an earlier live answer for the same product, size and colour (empty
+    if there was none), and the fabric is named from our own catalog data
+    rather than the S&S response.
+
+    Args:
+        resolution (QueryResolution): Successfully resolved query
+        entry (dict): Tier price (price, old_price, product_name, size_name, specs)
+        source (str): "price_table" or "tier_cache"
+
+    Returns:
+        dict: Price response
+    """
+    fabric_match_data = resolution.fabric
+    _, colour_key = tier_price_keys(resolution)
+    image_key = TierPriceCache.image_key(resolution.product_sku, resolution.size_sku, colour_key)
+    return {
+        "productName": f"{entry.get('product_name', '')} {entry.get('size_name', '')}",
+        "fabricName": f"{fabric_match_data.get('fabric_name', '')} - {fabric_match_data.get('color_name', '')}",
+        "price": entry.get('price', 'N/A'),
+        "oldPrice": entry.get('old_price'),
+        "imageUrls": tier_prices.images_for(image_key),
+        "specs": entry.get('specs', []),
+        "fabricDetails": {
+            "tier": fabric_match_data.get('tier', 'Unknown'),
+            "description": fabric_match_data.get('desc', ''),
+            "swatchUrl": fabric_match_data.get('swatch_url', '')
+        },
+        "stale": False,
+        "priceSource": source
+    }
+
+def price_from_tier(resolution):
+    """
+    Answers a resolved query from its fabric tier's price, if known.
+
+    Checks the tier cache, then the offline price table. Colours recorded as
+    tier exceptions always miss, and the table isn't used for a tier a live
+    answer recently disagreed with.
+
+    Args:
+        resolution (QueryResolution): Successfully resolved query
+
+    Returns:
+        dict or None: Price response, None if the tier price isn't known
+    """
+    tier_key, colour_key = tier_price_keys(resolution)
+    if not tier_key:
+        return None
+    entry = tier_prices.get(tier_key, colour_key)
+    if entry:
+        print(f"  [Tier HIT] {tier_key} (colour {colour_key})")
+        return build_tier_response(resolution, entry, "tier_cache")
+    if price_table and not tier_prices.is_exception(tier_key, colour_key) and not tier_prices.is_superseded(tier_key):
+        entry = price_table.get(resolution.product_sku, resolution.size_sku, resolution.cover_sku,
+                                resolution.fabric.get('tier'))
+        if entry:
+            print(f"  [Price Table HIT] {tier_key} (colour {colour_key})")
+            return build_tier_response(resolution, entry, "price_table")
+    return None
+
+def remember_tier_price(resolution, record, image_urls=None):
+    """
+    Feeds a live S&S record into the tier cache (and checks it against the
+    tier price we'd otherwise have served).
+
+    Args:
+        resolution (QueryResolution): Resolved query that was priced live
+        record (dict): ProductSkuRecord (or bed API response) from S&S
+        image_urls (list): Hero image URLs of the live answer, reused by
+            tier answers for the same product, size and colour
+    """
+    tier_key, colour_key = tier_price_keys(resolution)
+    if not tier_key:
+        return
+    tier_prices.remember_images(
+        TierPriceCache.image_key(resolution.product_sku, resolution.size_sku, colour_key), image_urls
+    )
+    entry = {
+        "price": record.get('PriceText'),
+        "old_price": record.get('OldPriceText'),
+        "product_name": record.get('ProductName', ''),
+        "size_name": record.get('SizeName', ''),
+        "specs": record.get('ProductSizeAttributes', [])
+    }
+    reference = price_table.prices.get(tier_key) if price_table else None
+    if not tier_prices.learn(tier_key, colour_key, entry, reference=reference):
+        print(f"  [Tier MISMATCH] {colour_key} is {entry['price']}, not its tier price - tier re-seeded from live answers")
+
+def is_shareable_price_result(result):
+    """False for a deadline-exceeded (E1009) result - it only applies to the caller that ran out of time."""
+    response_data, _ = result
+    return not (isinstance(response_data, dict) and response_data.get('error_code') == 'E1009')
+
+def price_locally(resolution, cache_key, query, user_agent='Mozilla/5.0'):
+    """
+    Answers a resolved query without an upstream call, if possible: price
+    cache, then the fabric tier's price (tier cache or offline price table).
+
+    Args:
+        resolution (QueryResolution): Successfully resolved query
+        cache_key (str): Price cache key for the resolution's SKUs
+        query (str): Original query (for error messages)
+        user_agent (str): User-Agent forwarded to the S&S API by background refreshes
+
+    Returns:
+        dict or None: Price response, None if only the S&S API can answer
+    """
     # --- 3. Check Cache (Critique #10) ---
-    cache_key = get_cache_key(product_sku, size_sku, cover_sku, fabric_match_data['fabric_sku'], fabric_match_data['color_sku'])
-    cached_response = get_from_cache(cache_key)
+    cached_response = get_from_cache(cache_key, allow_stale=True)
+    if cached_response:
+        if cached_response.get("stale"):
+            schedule_background_refresh(resolution, cache_key, query, user_agent)
+        return cached_response
+
+    # Any colour in the same fabric tier has the same price - no upstream call.
+    # Not stored under cache_key: one tier entry serves every colour. A sample
+    # of these answers is re-checked live to catch colours priced differently.
+    tier_response = price_from_tier(resolution)
+    if tier_response:
+        if tier_prices.should_verify():
+            schedule_background_refresh(resolution, cache_key, query, user_agent)
+        return tier_response
+    return None
+
+def fetch_price(resolution, cache_key, query, user_agent='Mozilla/5.0', deadline=None, local=True):
+    """
+    Pricing step: price_locally, then the S&S price API.
+
+    Args:
+        resolution (QueryResolution): Successfully resolved query
+        cache_key (str): Price cache key for the resolution's SKUs
+        query (str): Original query (for error messages)
+        user_agent (str): User-Agent forwarded to the S&S API
+        deadline (Deadline): Request deadline, or None for no limit. Also
+            bounds how long we wait on another caller's in-flight lookup.
+        local (bool): False if the caller already tried price_locally
+
+    Returns:
+        tuple: (response_dict, status_code)
+    """
+    local_response = price_locally(resolution, cache_key, query, user_agent) if local else None
+    if local_response:
+        return local_response, 200
+
+    # Concurrent misses for the same SKUs share one upstream call. A leader
+    # that ran out of its own (shorter) deadline isn't an answer for callers
+    # that still have time: they retry the lookup themselves
+    try:
+        (response_data, status_code), shared = upstream_flight.do(
+            cache_key, fetch_price_from_upstream, resolution, cache_key, query, user_agent, deadline,
+            wait_timeout=deadline.remaining() if deadline else None,
+            shareable=is_shareable_price_result
+        )
+    except TimeoutError:
+        return deadline_exceeded_response("upstream (shared lookup)")
+    if shared:
+        print(f"  [Single-flight] Shared in-flight lookup for {cache_key}")
+    return response_data, status_code
+
+def schedule_background_refresh(resolution, cache_key, query, user_agent='Mozilla/5.0'):
+    """
+    Refreshes a stale price off the request path (stale-while-revalidate).
+
+    Also used to verify sampled tier answers: the live result goes through
+    remember_tier_price, which flags colours that don't match their tier.
+    At most one refresh per cache key is queued at a time; the refresh itself
+    goes through upstream_flight so it also coalesces with foreground misses.
+    A failed refresh leaves the stale entry in place until CACHE_HARD_TTL.
+
+    Args:
+        resolution (QueryResolution): Successfully resolved query
+        cache_key (str): Price cache key for the resolution's SKUs
+        query (str): Original query (for error messages)
+        user_agent (str): User-Agent forwarded to the S&S API
+
+    Returns:
+        bool: True if a refresh was queued, False if one is already pending
+    """
+    with _refresh_lock:
+        if cache_key in _refreshing_keys:
+            return False
+        _refreshing_keys.add(cache_key)
+
+    def refresh():
+        try:
+            (_, status_code), _ = upstream_flight.do(
+                cache_key, fetch_price_from_upstream, resolution, cache_key, query, user_agent
+            )
+            if status_code == 200:
+                print(f"  [Cache REFRESH] Refreshed {cache_key} in the background")
+            else:
+                print(f"  [WARNING] Background refresh failed for {cache_key} (status {status_code}); keeping stale entry")
+        except Exception as e:
+            print(f"  [WARNING] Background refresh failed for {cache_key}: {e}")
+        finally:
+            with _refresh_lock:
+                _refreshing_keys.discard(cache_key)
+
+    try:
+        price_fetch_executor.submit(refresh)
+    except RuntimeError:
+        # Executor shut down (instance stopping) - the stale entry still serves
+        with _refresh_lock:
+            _refreshing_keys.discard(cache_key)
+        return False
+    return True
+
+def post_upstream(api_url, payload, headers, timeout, retries, breaker):
+    """
+    POSTs to the S&S price API, hedging slow calls when HEDGE_UPSTREAM=1.
+
+    Without hedging (or before the breaker has latency samples) this is a
+    plain session POST. With hedging, if the first POST hasn't answered after
+    the HEDGE_PERCENTILE latency and hedge_budget allows it, a duplicate is
+    sent (no retries, same overall finish time) and the first response wins.
+    The loser is left to finish in the background. When hedge_pool has no
+    free worker the call is made directly on this thread, unhedged.
+
+    Args:
+        api_url (str): SOFA_API_URL or BED_API_URL
+        payload (dict): Form payload
+        headers (dict): Request headers
+        timeout (float): Per-attempt timeout in seconds
+        retries (int): Retry budget for the primary call (see plan_upstream_call)
+        breaker (CircuitBreaker): Endpoint breaker (source of latency percentiles)
+
+    Returns:
+        requests.Response: First response received
+
+    Raises:
+        requests.exceptions.RequestException: If every sent request failed
+    """
+    def send(attempt_retries, attempt_timeout):
+        return upstream_sessions[attempt_retries].post(
+            api_url, data=payload, headers=headers, timeout=attempt_timeout
+        )
+
+    hedge_delay = breaker.latency_percentile(HEDGE_PERCENTILE) if HEDGE_ENABLED else None
+    if hedge_delay is None or hedge_delay >= timeout:
+        return send(retries, timeout)
+
+    primary = hedge_pool.try_submit(send, retries, timeout)
+    if primary is None:
+        return send(retries, timeout)
+    hedge_budget.record_request()
+    done, _ = wait([primary], timeout=hedge_delay)
+    if done or not hedge_budget.try_acquire():
+        return primary.result()
+
+    hedge = hedge_pool.try_submit(send, 0, max(0.1, timeout - hedge_delay))
+    if hedge is None:
+        hedge_budget.refund()
+        return primary.result()
+    print(f"  [Hedge] No answer after {hedge_delay:.2f}s (p{HEDGE_PERCENTILE:g}) - sending hedge to {api_url}")
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                response = future.result()
+            except requests.exceptions.RequestException as e:
+                error = e  # The other request may still succeed
+                continue
+            if future is hedge:
+                hedge_budget.record_win()
+            return response
+    raise error
+
+def remember_upstream_failure(cache_key, response_data, status_code, ttl):
+    """
+    Records a failed upstream lookup in the negative cache and returns it.
+
+    Args:
+        cache_key (str): Price cache key of the failed SKU combination
+        response_data (dict): Error response to return
+        status_code (int): HTTP status to return
+        ttl (int): NEGATIVE_CACHE_CLIENT_TTL for rejected SKU combinations,
+            NEGATIVE_CACHE_UPSTREAM_TTL for transient failures
+
+    Returns:
+        tuple: (response_data, status_code)
+    """
+    negative_cache.set(negative_sku_key(cache_key), (response_data, status_code), ttl)
+    return response_data, status_code
+
+def fetch_price_from_upstream(resolution, cache_key, query, user_agent='Mozilla/5.0', deadline=None):
+    """
+    Calls the S&S price API for a resolved query and caches the result.
+
+    Runs as the single-flight leader for its cache key. Re-checks the cache
+    first: a caller that missed just before the previous leader stored its
+    result becomes a new leader and must not fetch again. Failures are
+    remembered in negative_cache (see remember_upstream_failure).
+
+    Args:
+        resolution (QueryResolution): Successfully resolved query
+        cache_key (str): Price cache key for the resolution's SKUs
+        query (str): Original query (for error messages)
+        user_agent (str): User-Agent forwarded to the S&S API
+        deadline (Deadline): Request deadline, or None for no limit. Shrinks
+            the timeout and retry count to fit (see plan_upstream_call).
+
+    Returns:
+        tuple: (response_dict, status_code)
+    """
+    cached_response = response_cache.get(cache_key)
     if cached_response:
         return cached_response, 200
 
+    # Recent failure for these SKUs - answer without another upstream call
+    failure = negative_cache.get(negative_sku_key(cache_key))
+    if failure:
+        print(f"  [Negative HIT] Upstream recently failed for {cache_key} (status {failure[1]})")
+        return failure
+
+    product_data = resolution.product
+    product_sku = resolution.product_sku
+    product_type = resolution.product_type  # This is "sofa", "bed", "chair", etc.
+    size_sku = resolution.size_sku
+    cover_sku = resolution.cover_sku
+    fabric_match_data = resolution.fabric
+
     # --- 4. Build the API Payload (ROUTING LOGIC) ---
     headers = {
         'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
@@ -1366,12 +2982,35 @@ def get_price_logic(request):
         print(f"  [Error] Unknown product type: {product_type}")
         return {"error": f"Unknown product type: {product_type}"}, 500
 
+    # Not enough time left for a useful upstream call
+    if deadline and deadline.expired(MIN_UPSTREAM_BUDGET):
+        return deadline_exceeded_response("upstream")
+
+    # Fail fast while the endpoint's circuit is open (callers still get stale/cached data)
+    breaker = upstream_breakers[api_url]
+    if not breaker.allow():
+        print(f"  [Circuit] {breaker.name} is open - failing fast for {cache_key}")
+        return create_error_response(
+            "E1008", details={"endpoint": breaker.name, "retry_after": breaker.retry_after()}
+        ), 503
+
+    outcome_recorded = False
+    cut_by_deadline = False
+    call_started = time.time()
     try:
         # --- 5. Call the S&S Price API (Critique #6) ---
-        print(f"  [API Call] Calling: {api_url} with payload: {payload}")
-        response = session.post(api_url, data=payload, headers=headers, timeout=10) # 10-second timeout
+        # Timeout adapts to recent p95 latency (max 10s); both it and the retry
+        # count shrink to fit the request deadline
+        full_timeout = breaker.timeout()
+        timeout, retries = plan_upstream_call(deadline, full_timeout)
+        # A call the client's deadline cut short can't blame S&S for being slow
+        cut_by_deadline = timeout < full_timeout
+        print(f"  [API Call] Calling: {api_url} with payload: {payload} (timeout {timeout:.1f}s, retries {retries})")
+        response = post_upstream(api_url, payload, headers, timeout, retries, breaker)
         response.raise_for_status() 
         price_data = response.json()
+        breaker.record_success(time.time() - call_started)
+        outcome_recorded = True
         
         # --- 6. Parse and Simplify the Response ---
         record = {}
@@ -1408,7 +3047,10 @@ def get_price_logic(request):
                                 image_urls.append("https://sofasandstuff.com/" + encoded_path)
             
         if not record:
-             return {"error": "S&S API returned empty response."}, 500
+             # No record for this SKU combination - deterministic, like a 4xx
+             return remember_upstream_failure(
+                 cache_key, {"error": "S&S API returned empty response."}, 500, NEGATIVE_CACHE_CLIENT_TTL
+             )
 
         full_name = f"{record.get('ProductName', '')} {record.get('SizeName', '')}"
         fabric_name = f"{record.get('FabricName', '')} - {record.get('ColourName', '')}"
@@ -1424,24 +3066,369 @@ def get_price_logic(request):
                 "tier": fabric_match_data.get('tier', 'Unknown'),
                 "description": fabric_match_data.get('desc', ''),
                 "swatchUrl": fabric_match_data.get('swatch_url', '')
-            }
+            },
+            "stale": False
         }
         
         # 9. Set to Cache and Return
         set_to_cache(cache_key, simplified_response)
+        remember_tier_price(resolution, record, image_urls)
         return simplified_response, 200
 
     except requests.exceptions.Timeout:
         print(f"[ERROR] API Request Timed Out. URL: {api_url}")
-        return {"error": "Request timed out. The S&S server may be slow."}, 504
+        if cut_by_deadline:
+            # Not a verdict on the upstream: no breaker failure, nothing
+            # negative-cached for other callers of these SKUs
+            breaker.record_abandoned()
+            return deadline_exceeded_response("upstream")
+        breaker.record_failure()
+        return remember_upstream_failure(
+            cache_key, {"error": "Request timed out. The S&S server may be slow."}, 504, NEGATIVE_CACHE_UPSTREAM_TTL
+        )
     except requests.exceptions.RequestException as e:
         print(f"[ERROR] API Request Failed. URL: {api_url}, Payload: {payload}, Error: {e}")
-        return {"error": f"API request failed. Built an invalid SKU? (Query: {query})"}, 502
+        # A 4xx means S&S rejected the SKU combination; anything else is transient
+        rejected = (isinstance(e, requests.exceptions.HTTPError) and e.response is not None
+                    and 400 <= e.response.status_code < 500)
+        if rejected:
+            breaker.record_success()  # Upstream is healthy, it just said no
+        else:
+            breaker.record_failure()
+        return remember_upstream_failure(
+            cache_key, {"error": f"API request failed. Built an invalid SKU? (Query: {query})"}, 502,
+            NEGATIVE_CACHE_CLIENT_TTL if rejected else NEGATIVE_CACHE_UPSTREAM_TTL
+        )
     except Exception as e:
         print(f"[ERROR] Unexpected error: {e}")
-        return {"error": f"An unexpected error occurred: {str(e)}"}, 500
+        if not outcome_recorded:
+            breaker.record_failure()
+        return remember_upstream_failure(
+            cache_key, {"error": f"An unexpected error occurred: {str(e)}"}, 500, NEGATIVE_CACHE_UPSTREAM_TTL
+        )
+
+# --- Batch Pricing (/getPrices) ---
+def get_prices_logic(request):
+    """
+    Core logic for the /getPrices batch endpoint.
+
+    Resolves every query in the batch, then prices each distinct SKU
+    combination once and fans the results back out in input order. Cached
+    and tier-priced combinations are answered inline; the rest run on
+    price_fetch_executor, at most BATCH_MAX_CONCURRENCY at a time. Comparison
+    pages and size discovery price many configurations at once; this
+    replaces N sequential round trips.
+
+    Each upstream lookup counts against the session's rate limit (the
+    request itself already paid for one), so a batch can't buy 50 upstream
+    calls for the price of one request.
+
+    Args:
+        request (Flask Request): Request object with JSON body containing:
+            - queries (list): Natural language pricing queries (max MAX_BATCH_QUERIES)
+
+    Returns:
+        tuple: (response_dict, status_code)
+            - response_dict: {"results": [...], "count", "unique_configurations"}
+              Each result: {"query", "status", "error_code", "data"} where data is
+              exactly what /getPrice would have returned for that query
+            - status_code (int): 200 if the batch was processed (per-item
+              statuses may still be errors), 400 for an invalid batch,
+              429 if its upstream lookups exceed the remaining rate limit
+
+    Error codes:
+        E2006: Invalid JSON format
+        E2007: Missing required field (queries)
+        E1007: Batch needs more upstream lookups than the rate limit has left
+        E1009: Per item, if the batch deadline ran out before it was priced
+    """
+    try:
+        data = request.get_json()
+    except (ValueError, TypeError) as e:
+        print(f"  [ERROR] Invalid JSON in batch request: {e}")
+        return create_error_response("E2006"), 400
+
+    if not data:
+        return create_error_response("E2007", details={"field": "JSON body"}), 400
+
+    queries = data.get('queries')
+    if not queries:
+        return create_error_response("E2007", details={"field": "queries array"}), 400
+
+    if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+        return {"error": "'queries' must be an array of strings"}, 400
+
+    if len(queries) > MAX_BATCH_QUERIES:
+        return {"error": f"Too many queries in one batch (max {MAX_BATCH_QUERIES})"}, 400
+
+    user_agent = request.headers.get('User-Agent', 'Mozilla/5.0')
+    request_id = get_request_id(request)
+    deadline = get_request_deadline(request)
+    print(f"[{request_id}] --- Batch of {len(queries)} queries ---")
+
+    # 1. Resolve every query (pure, in-process)
+    results = [None] * len(queries)
+    pending = {}  # cache_key -> (resolution, query, [result indexes])
+    for i, raw_query in enumerate(queries):
+        query = raw_query.lower()
+        if not query.strip():
+            results[i] = (create_error_response("E2007", details={"field": "query"}), 400)
+            continue
+
+        resolution, cache_key = resolve_for_pricing(query, request_id=request_id)
+        if not resolution.ok:
+            results[i] = (resolution_error_response(resolution), resolution.status_code)
+        elif cache_key in pending:
+            pending[cache_key][2].append(i)
+        else:
+            pending[cache_key] = (resolution, query, [i])
+
+    # 2. Answer what we can without the S&S API
+    outcomes = {}
+    upstream = []
+    for cache_key, (resolution, query, _) in pending.items():
+        local_response = price_locally(resolution, cache_key, query, user_agent)
+        if local_response:
+            outcomes[cache_key] = (local_response, 200)
+        else:
+            upstream.append(cache_key)
+
+    # 3. Charge the rate limit for the upstream lookups (the request paid for one)
+    if len(upstream) > 1:
+        session_id = data.get('session_id', 'no-session')
+        allowed, reason, retry_after = rate_limiter.is_allowed(session_id, cost=len(upstream) - 1)
+        if not allowed:
+            print(f"[{request_id}] [Rate Limit] Batch needs {len(upstream)} upstream lookups ({reason} limit)")
+            return create_error_response(
+                "E1007",
+                details={
+                    "limit_type": reason,
+                    "retry_after_seconds": retry_after,
+                    "session_id": session_id,
+                    "upstream_lookups": len(upstream)
+                }
+            ), 429
+
+    # 4. Price the rest concurrently, BATCH_MAX_CONCURRENCY at a time
+    slots = threading.BoundedSemaphore(BATCH_MAX_CONCURRENCY)
+    futures = {}
+    for cache_key in upstream:
+        if not slots.acquire(timeout=deadline.remaining()):
+            break  # Unsubmitted lookups report E1009 below
+        resolution, query, _ = pending[cache_key]
+        future = price_fetch_executor.submit(fetch_price, resolution, cache_key, query, user_agent, deadline, False)
+        future.add_done_callback(lambda _: slots.release())
+        futures[cache_key] = future
+    wait(futures.values(), timeout=deadline.remaining())
+    for cache_key in upstream:
+        future = futures.get(cache_key)
+        try:
+            if future is None or not future.done():
+                if future is not None:
+                    future.cancel()  # Running lookups finish in the background and fill the cache
+                raise TimeoutError
+            outcome = future.result()
+        except TimeoutError:
+            outcome = deadline_exceeded_response("batch")
+        except Exception as e:
+            print(f"[{request_id}] [ERROR] Batch price lookup failed: {e}")
+            outcome = ({"error": f"An unexpected error occurred: {str(e)}"}, 500)
+        outcomes[cache_key] = outcome
+    for cache_key, outcome in outcomes.items():
+        for i in pending[cache_key][2]:
+            results[i] = outcome
+
+    print(f"[{request_id}] [Batch] {len(queries)} queries -> {len(pending)} unique configurations priced "
+          f"({len(upstream)} upstream)")
+
+    # 5. Fan results back out in input order
+    return {
+        "results": [
+            {
+                "query": queries[i],
+                "status": status_code,
+                "error_code": response_data.get("error_code") if status_code != 200 else None,
+                "data": response_data
+            }
+            for i, (response_data, status_code) in enumerate(results)
+        ],
+        "count": len(queries),
+        "unique_configurations": len(pending)
+    }, 200
+
+# --- Cache Warm-up (query-log driven) ---
+# Fresh instances pay full upstream latency for their first requests. The
+# warm-up replays the most frequent logged queries through the pricing
+# pipeline so popular prices (and their resolutions) are already cached.
+# Runs via POST /warmCache (admin token; for a scheduler) and, if
+# CACHE_WARMUP_ON_START=1, in the background at instance start - off by
+# default so every cold start doesn't fire upstream calls. Never blocks
+# readiness: bounded by WARMUP_TIME_BUDGET seconds and WARMUP_CONCURRENCY
+# parallel upstream calls.
+WARMUP_ON_START = os.getenv('CACHE_WARMUP_ON_START', '0') == '1'
+WARMUP_TOP_N = int(os.getenv('CACHE_WARMUP_TOP_N', 100))
+WARMUP_CONCURRENCY = int(os.getenv('CACHE_WARMUP_CONCURRENCY', 4))
+WARMUP_TIME_BUDGET = float(os.getenv('CACHE_WARMUP_TIME_BUDGET', 20))
+WARMUP_QUERY_LOG_FILE = os.getenv('CACHE_WARMUP_QUERY_LOG')  # Local stand-in for queries.json
+WARMUP_ENDPOINTS = ('/getPrice', '/chat')
+warmup_lock = threading.Lock()
+last_warmup = {"status": "never_run"}
+
+def load_warmup_query_log():
+    """
+    Loads the logged queries used to pick warm-up candidates.
+
+    Reads CACHE_WARMUP_QUERY_LOG (a local file in the queries.json format
+    written by log_query_to_gcs) when set, otherwise queries.json from GCS.
+
+    Returns:
+        list: Query log entries (empty if no log is available)
+    """
+    try:
+        if WARMUP_QUERY_LOG_FILE:
+            with open(WARMUP_QUERY_LOG_FILE, 'r') as f:
+                return json.load(f)
+        if analytics_bucket:
+            return json.loads(analytics_bucket.blob('queries.json').download_as_text())
+    except Exception as e:
+        print(f"[WARNING] Warm-up could not read the query log: {e}")
+    return []
+
+def select_warmup_queries(entries, top_n=WARMUP_TOP_N):
+    """
+    Picks the most frequent successful pricing queries from the query log.
+
+    Queries are grouped by their normalized form (so casing and filler
+    words don't split counts); the most recent spelling of each is kept.
+
+    Args:
+        entries (list): Query log entries (see log_query_to_gcs)
+        top_n (int): Maximum number of queries to return
+
+    Returns:
+        list: Up to top_n query strings, most frequent first
+    """
+    counts = {}
+    latest = {}
+    query_parser = catalog_manager.current.query_parser
+    for entry in entries:
+        if not isinstance(entry, dict) or entry.get('endpoint') not in WARMUP_ENDPOINTS:
+            continue
+        if entry.get('status') != 200:
+            continue
+        query = str(entry.get('query') or '').strip().lower()
+        if not query:
+            continue
+        normalized = query_parser.normalize(query)
+        counts[normalized] = counts.get(normalized, 0) + 1
+        latest[normalized] = query
+    ranked = sorted(counts, key=lambda q: counts[q], reverse=True)
+    return [latest[q] for q in ranked[:top_n]]
+
+def warm_price_cache(top_n=WARMUP_TOP_N, max_workers=WARMUP_CONCURRENCY, time_budget=WARMUP_TIME_BUDGET):
+    """
+    Fills the price cache with the top logged queries.
+
+    Each query goes through resolve_for_pricing (filling query_memo), and
+    every distinct uncached SKU combination is fetched through upstream_flight
+    with at most max_workers calls in flight. Work still pending when the
+    time budget runs out is cancelled. Only one warm-up runs at a time.
+
+    Args:
+        top_n (int): Number of logged queries to replay
+        max_workers (int): Concurrent upstream calls
+        time_budget (float): Seconds before remaining work is abandoned
+
+    Returns:
+        dict: Summary (status, queries, resolved, already_cached, fetched,
+            failed, timed_out, elapsed_ms); also stored in last_warmup
+    """
+    global last_warmup
+    if not warmup_lock.acquire(blocking=False):
+        return {"status": "already_running"}
+
+    start = time.time()
+    deadline = start + time_budget
+    summary = {"status": "completed", "queries": 0, "resolved": 0, "already_cached": 0,
+               "fetched": 0, "failed": 0, "timed_out": 0}
+    try:
+        queries = select_warmup_queries(load_warmup_query_log(), top_n)
+        summary["queries"] = len(queries)
+
+        pending = {}  # cache_key -> (resolution, query)
+        for query in queries:
+            if time.time() >= deadline:
+                break
+            resolution, cache_key = resolve_for_pricing(query, request_id='warmup')
+            if not resolution.ok or cache_key in pending:
+                continue
+            summary["resolved"] += 1
+            if get_from_cache(cache_key):
+                summary["already_cached"] += 1
+                continue
+            pending[cache_key] = (resolution, query)
+
+        if pending:
+            # Upstream calls also get timeouts/retries that fit the budget
+            warmup_deadline = Deadline(max(0, deadline - time.time()))
+            warmup_executor = ThreadPoolExecutor(max_workers=max_workers)
+            futures = [
+                warmup_executor.submit(upstream_flight.do, cache_key, fetch_price_from_upstream,
+                                       resolution, cache_key, query, 'Cache-Warmup', warmup_deadline)
+                for cache_key, (resolution, query) in pending.items()
+            ]
+            done, not_done = wait(futures, timeout=max(0, deadline - time.time()))
+            # Don't wait for in-flight calls past the budget; they still fill the cache
+            warmup_executor.shutdown(wait=False, cancel_futures=True)
+            for future in done:
+                try:
+                    (_, status_code), _ = future.result()
+                except Exception:
+                    status_code = 500
+                summary["fetched" if status_code == 200 else "failed"] += 1
+            summary["timed_out"] = len(not_done)
+            if not_done:
+                summary["status"] = "partial"
+    except Exception as e:
+        print(f"[WARNING] Cache warm-up failed: {e}")
+        summary["status"] = "failed"
+    finally:
+        summary["elapsed_ms"] = int((time.time() - start) * 1000)
+        summary["finished_at"] = int(time.time())
+        last_warmup = summary
+        warmup_lock.release()
+
+    print(f"[Warm-up] {summary}")
+    return summary
+
+if WARMUP_ON_START:
+    # Daemon thread: instance readiness never waits on the warm-up
+    threading.Thread(target=warm_price_cache, name="cache-warmup", daemon=True).start()
 
 # --- Chat Handler for Grok LLM (Phase 1C: Piece 3.2) ---
+def build_partial_chat_answer(last_assistant_text, priced_results):
+    """
+    Builds a chat answer from what was gathered before the deadline hit.
+
+    Args:
+        last_assistant_text (str): Most recent non-empty Grok message content
+        priced_results (list): Successful get_price tool results
+
+    Returns:
+        str or None: Answer text, or None if nothing useful was gathered
+    """
+    lines = []
+    for result in priced_results:
+        name = " ".join(result.get("productName", "").split())
+        fabric = result.get("fabricName", "").strip(" -")
+        lines.append(f"- {name}{f' in {fabric}' if fabric else ''}: {result.get('price', 'N/A')}")
+
+    if not lines:
+        return last_assistant_text or None
+
+    prices = "Here's what I found before running out of time:\n" + "\n".join(dict.fromkeys(lines))
+    return f"{last_assistant_text}\n\n{prices}" if last_assistant_text else prices
+
 def chat_handler(request):
     """
     Handles conversational pricing queries via Grok LLM with tool calling.
@@ -1468,9 +3455,16 @@ def chat_handler(request):
 
     Error codes:
         E1006: OpenRouter/Grok unavailable
+        E1009: Request deadline reached before any answer was available
         E2006: Invalid JSON format
         E2007: Missing required field (messages)
 
+    Deadline:
+        The loop stops early when the request deadline (see get_request_deadline)
+        no longer leaves CHAT_MIN_LLM_BUDGET seconds for another Grok call, and
+        tools are skipped once it is nearly spent. Whatever was found so far is
+        returned with metadata.partial = True (see build_partial_chat_answer).
+
     Example request body:
         {"messages": [{"role": "user", "content": "How much is alwinton?"}],
          "session_id": "abc123"}
@@ -1501,6 +3495,7 @@ def chat_handler(request):
         messages = data.get('messages', [])
         session_id = data.get('session_id', 'no-session')
         request_id = get_request_id(request)
+        deadline = get_request_deadline(request)
 
         if not messages:
             return create_error_response("E2007", details={"field": "messages array"}), 400
@@ -1524,25 +3519,42 @@ def chat_handler(request):
         total_tokens = 0
         max_iterations = 5  # Prevent infinite loops
         iteration = 0
+        stopped_early = False
+        last_assistant_text = ""
+        priced_results = []  # Successful get_price results, for a partial answer
 
         # Tool calling loop: Keep calling Grok until no more tool calls
         while iteration < max_iterations:
+            # Stop before a Grok call that can't finish inside the request deadline
+            if deadline.expired(CHAT_MIN_LLM_BUDGET):
+                print(f"[Chat] Deadline: {deadline.remaining():.1f}s left, stopping before iteration {iteration + 1}")
+                stopped_early = True
+                break
+
             iteration += 1
             print(f"[Chat] Iteration {iteration}: Calling Grok...")
 
             # Call Grok with tools
-            response = openrouter_client.chat.completions.create(
-                model=GROK_MODEL,
-                messages=conversation,
-                tools=TOOLS,
-                temperature=0.1  # Low temperature for precise, deterministic responses
-            )
+            try:
+                response = openrouter_client.chat.completions.create(
+                    model=GROK_MODEL,
+                    messages=conversation,
+                    tools=TOOLS,
+                    temperature=0.1,  # Low temperature for precise, deterministic responses
+                    timeout=deadline.remaining()
+                )
+            except APITimeoutError:
+                print(f"[Chat] Grok call timed out against the request deadline")
+                stopped_early = True
+                break
 
             # Track tokens
             if response.usage:
                 total_tokens += response.usage.total_tokens
 
             assistant_message = response.choices[0].message
+            if assistant_message.content:
+                last_assistant_text = assistant_message.content
 
             # Check if Grok wants to call tools
             if assistant_message.tool_calls:
@@ -1582,14 +3594,22 @@ def chat_handler(request):
                         tool_status = 400
                     else:
                         # Route to correct tool handler
-                        if tool_name == "get_price":
+                        if deadline.expired(MIN_UPSTREAM_BUDGET):
+                            print(f"  [Tool] Skipped {tool_name}: request deadline reached")
+                            tool_result = {"error": "Skipped: the request ran out of time"}
+                            tool_status = 504
+                        elif tool_name == "get_price":
                             query = tool_args.get("query", "")
-                            tool_result, tool_status = get_price_tool_handler(query)
+                            tool_result, tool_status = get_price_tool_handler(query, deadline)
+                            if tool_status == 200:
+                                priced_results.append(tool_result)
                         elif tool_name == "search_by_budget":
                             max_price = tool_args.get("max_price", 0)
                             product_name = tool_args.get("product_name")
                             product_type = tool_args.get("product_type", "all")
-                            tool_result, tool_status = search_by_budget_handler(max_price, product_name, product_type)
+                            tool_result, tool_status = search_by_budget_handler(
+                                max_price, product_name, product_type, deadline=deadline
+                            )
                         elif tool_name == "search_fabrics_by_color":
                             color = tool_args.get("color", "")
                             product_name = tool_args.get("product_name")
@@ -1645,6 +3665,25 @@ def chat_handler(request):
                     }
                 }, 200
 
+        # Deadline reached - answer with whatever we have
+        if stopped_early:
+            partial_answer = build_partial_chat_answer(last_assistant_text, priced_results)
+            if not partial_answer:
+                response_data, status_code = deadline_exceeded_response("chat")
+                response_data["metadata"] = {"tokens": total_tokens, "session_id": session_id}
+                return response_data, status_code
+            print(f"[Chat] Returning partial answer ({len(priced_results)} price(s)) for session: {session_id}")
+            return {
+                "response": partial_answer,
+                "metadata": {
+                    "tokens": total_tokens,
+                    "session_id": session_id,
+                    "model": GROK_MODEL,
+                    "iterations": iteration,
+                    "partial": True
+                }
+            }, 200
+
         # Max iterations reached
         print(f"[WARNING] Max iterations ({max_iterations}) reached for session: {session_id}")
         return {
@@ -1679,6 +3718,9 @@ def main(request):
         - GET / : Health check
         - POST /chat : Grok LLM conversational interface
         - POST /getPrice : Direct keyword-based pricing
+        - POST /getPrices : Batch pricing (array of queries, results in input order)
+        - POST /warmCache : Warm the price cache from the most frequent logged queries
+        - POST /reloadCatalog : Load a fresh catalog and swap it in (body: {"force": true} to swap an unchanged version)
         - GET /queries : Retrieve global query analytics (for telemetry dashboard)
 
     Args:
@@ -1787,6 +3829,72 @@ def main(request):
         response.status_code = status_code
         return _add_cors_headers(response)
 
+    # Handle the /getPrices batch endpoint (many configurations in one round trip)
+    if request.path == '/getPrices' and request.method == 'POST':
+        response_data, status_code = get_prices_logic(request)
+
+        # Log query to GCS (async, non-blocking) - one entry per batch
+        try:
+            data = request.get_json(silent=True)
+            batch = data.get('queries', []) if data else []
+            batch = batch if isinstance(batch, list) else []
+            query_text = f"[batch x{len(batch)}] " + ' | '.join(str(q) for q in batch[:5])
+
+            query_log_data = {
+                'timestamp': datetime.utcnow().isoformat() + 'Z',
+                'session_id': session_id,
+                'query': query_text[:200],  # Truncate to 200 chars
+                'endpoint': '/getPrices',
+                'response_time_ms': int((time.time() - request_start_time) * 1000),
+                'status': status_code,
+                'error_code': response_data.get('error_code')
+            }
+
+            query_log_executor.submit(log_query_to_gcs, query_log_data)
+        except Exception as e:
+            print(f"[WARNING] Failed to prepare query log: {e}")
+
+        response = jsonify(response_data)
+        response.status_code = status_code
+        if status_code == 429:
+            response.headers['Retry-After'] = str(response_data['details']['retry_after_seconds'])
+        return _add_cors_headers(response)
+
+    # Handle the /warmCache endpoint (scheduled cache warm-up from the query log)
+    # Admin only, and no CORS headers: it is not meant to be called from a browser
+    if request.path == '/warmCache' and request.method == 'POST':
+        denied = check_admin_token(request)
+        if denied:
+            return jsonify(denied[0]), denied[1]
+        data = request.get_json(silent=True) or {}
+        try:
+            top_n = min(int(data.get('top_n', WARMUP_TOP_N)), 1000)
+            time_budget = min(float(data.get('time_budget', WARMUP_TIME_BUDGET)), 50)
+            if top_n < 1 or not time_budget > 0:  # ranked[:-5] would replay almost the whole log
+                raise ValueError("top_n and time_budget must be positive")
+        except (TypeError, ValueError):
+            return jsonify(create_error_response("E2006")), 400
+        summary = warm_price_cache(top_n=top_n, time_budget=time_budget)
+        status_code = 409 if summary.get("status") == "already_running" else 200
+        response = jsonify(summary)
+        response.status_code = status_code
+        return response
+
+    # Handle the /reloadCatalog endpoint (swap in a fresh scrape without a restart).
+    # Admin only, no CORS headers (like /warmCache)
+    if request.path == '/reloadCatalog' and request.method == 'POST':
+        denied = check_admin_token(request)
+        if denied:
+            return jsonify(denied[0]), denied[1]
+        data = request.get_json(silent=True) or {}
+        summary = catalog_manager.reload(force=bool(data.get('force')))
+        status_code = {"already_running": 409, "rate_limited": 429, "failed": 500}.get(summary["status"], 200)
+        response = jsonify(summary)
+        response.status_code = status_code
+        if status_code == 429:
+            response.headers['Retry-After'] = str(summary["retry_after"])
+        return response
+
     # Handle the /queries endpoint for telemetry dashboard (v2.5.0 Phase 5)
     if request.path == '/queries' and request.method == 'GET':
         try:
@@ -1831,11 +3939,19 @@ def main(request):
 
             # Cache status
             "cache": {
-                "entries": len(response_cache),
-                "max_size": response_cache.max_size,
-                "ttl_seconds": response_cache.ttl,
-                "usage_percent": round((len(response_cache) / response_cache.max_size) * 100, 1)
+                **response_cache.stats(),
+                "refreshes_in_flight": len(_refreshing_keys)
             },
+            "l2_cache": price_store.stats() if price_store else {"enabled": False},
+            "catalog": catalog_manager.stats(),
+            "price_table": price_table.stats(),
+            "tier_cache": tier_prices.stats(),
+            "query_memo": query_memo.stats(),
+            "negative_cache": negative_cache.stats(),
+            "cache_warmup": last_warmup,
+            "upstream_single_flight": upstream_flight.stats(),
+            "upstream_circuits": {breaker.name: breaker.stats() for breaker in upstream_breakers.values()},
+            "upstream_hedging": hedge_budget.stats(),
 
             # Rate limiter status
             "rate_limiter": {
@@ -1849,13 +3965,18 @@ def main(request):
             # Service availability
             "services": {
                 "openrouter_llm": "available" if openrouter_client else "unavailable",
-                "price_api": "available"  # Always available (direct S&S API)
+                "price_api": "available" if all(
+                    breaker.state == CircuitBreaker.CLOSED for breaker in upstream_breakers.values()
+                ) else "degraded"
             },
 
             # Endpoints
             "endpoints": {
                 "chat": "/chat",
                 "price": "/getPrice",
+                "batch_price": "/getPrices",
+                "warm_cache": "/warmCache",
+                "reload_catalog": "/reloadCatalog",
                 "health": "/health"
             }
         }
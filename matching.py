@@ -0,0 +1,1187 @@
+"""
+Keyword Matching for Sofas & Stuff Pricing Platform
+
+Compiled matchers for the translation dictionaries (products, sizes, covers,
+fabrics). Each mapping is compiled once at load time into a word-boundary
+anchored lookup table, so a query is resolved with a handful of dict lookups
+instead of one or two regex scans per keyword.
+
+Scoring is identical to the original regex implementation:
+- Whole-word match  (r'\\bkeyword\\b')  -> 100 + len(keyword)
+- Word-prefix match (r'\\bkeyword')     ->  90 + len(keyword)
+
+Usage:
+    from matching import get_matcher
+
+    matcher = get_matcher(PRODUCT_SKU_MAP)   # compiled once, then reused
+    matches = matcher.match("alwinton snuggler pacific")
+    # [('alwinton snuggler', {...}, 117), ('alwinton', {...}, 108)]
+"""
+
+import re
+import sys
+from array import array
+from bisect import bisect_right
+from collections import Counter
+from collections.abc import Mapping
+from itertools import chain
+from fuzzywuzzy import fuzz  # Levenshtein ratio (fast with python-Levenshtein)
+
+
+def _is_word_char(ch):
+    """Mirrors the regex engine's definition of \\w for str patterns."""
+    return ch.isalnum() or ch == '_'
+
+
+def _is_boundary(text, pos):
+    """True if a regex \\b would match at position pos of text."""
+    before = pos > 0 and _is_word_char(text[pos - 1])
+    after = pos < len(text) and _is_word_char(text[pos])
+    return before != after
+
+
+def regex_find_matches(query, mapping):
+    """
+    Reference implementation: one or two regex scans per keyword.
+
+    Kept as the fallback for the rare query/keyword whose lowercase form has
+    a different length (e.g. 'İ'), where positions can't be compared safely.
+
+    Returns:
+        list: Unsorted (keyword, value, confidence) tuples in mapping order
+    """
+    matches = []
+    for keyword, value in mapping.items():
+        # Exact match with word boundaries
+        if re.search(r'\b' + re.escape(keyword) + r'\b', query, re.IGNORECASE):
+            matches.append((keyword, value, 100 + len(keyword)))
+        # Prefix match: "3 seater" matches "3 seater sofa"
+        elif re.search(r'\b' + re.escape(keyword), query, re.IGNORECASE):
+            matches.append((keyword, value, 90 + len(keyword)))
+    return matches
+
+
+class KeywordMatcher:
+    """
+    Word-boundary anchored matcher compiled from a keyword mapping.
+
+    Every match (whole-word or prefix) has to start on a word boundary, so
+    instead of scanning the query once per keyword we only look at the
+    boundary positions of the query and, for each distinct keyword length,
+    check whether the slice starting there is a known keyword.
+
+    Cost per query is O(boundaries x distinct keyword lengths) dict lookups,
+    independent of how many keywords the mapping holds.
+
+    Args:
+        mapping (dict): Keyword -> value mapping (treated as read-only)
+    """
+    def __init__(self, mapping):
+        self.mapping = mapping
+        self.size = len(mapping)
+        self._keywords = list(mapping)
+        self._by_text = {}   # lowercase keyword -> [keyword index, ...]
+        self._fallback = []  # keyword indices that need the regex path
+
+        for index, keyword in enumerate(self._keywords):
+            lowered = keyword.lower()
+            if len(lowered) != len(keyword):
+                self._fallback.append(index)
+                continue
+            self._by_text.setdefault(lowered, []).append(index)
+
+        self._lengths = sorted({len(text) for text in self._by_text})
+
+    def match(self, query):
+        """
+        Find every keyword that matches the query.
+
+        Args:
+            query (str): Search query (case-insensitive)
+
+        Returns:
+            list: Tuples of (keyword, value, confidence_score) sorted by
+                  confidence desc, ties kept in mapping order.
+        """
+        lowered = query.lower()
+        if len(lowered) != len(query):
+            matches = regex_find_matches(query, self.mapping)
+            matches.sort(key=lambda x: x[2], reverse=True)
+            return matches
+
+        exact = set()
+        prefix = set()
+        query_len = len(lowered)
+        by_text = self._by_text
+
+        for start in range(query_len + 1):
+            if not _is_boundary(lowered, start):
+                continue
+            for length in self._lengths:
+                end = start + length
+                if end > query_len:
+                    break
+                indexes = by_text.get(lowered[start:end])
+                if indexes is None:
+                    continue
+                if _is_boundary(lowered, end):
+                    exact.update(indexes)
+                else:
+                    prefix.update(indexes)
+
+        if self._fallback:
+            for index in self._fallback:
+                keyword = self._keywords[index]
+                if re.search(r'\b' + re.escape(keyword) + r'\b', query, re.IGNORECASE):
+                    exact.add(index)
+                elif re.search(r'\b' + re.escape(keyword), query, re.IGNORECASE):
+                    prefix.add(index)
+
+        matches = []
+        for index in sorted(exact | prefix):
+            keyword = self._keywords[index]
+            base = 100 if index in exact else 90
+            matches.append((keyword, self.mapping[keyword], base + len(keyword)))
+
+        matches.sort(key=lambda x: x[2], reverse=True)
+        return matches
+
+
+# Compiled matchers keyed by id(mapping). The mapping itself is stored next to
+# the matcher so a recycled id can never return another mapping's matcher.
+_MATCHER_CACHE = {}
+
+
+def get_matcher(mapping):
+    """
+    Returns the compiled KeywordMatcher for a mapping, compiling it on first use.
+
+    Mappings are treated as immutable once loaded; a change in size triggers
+    a recompile as a safety net.
+
+    Args:
+        mapping (dict): Keyword -> value mapping
+
+    Returns:
+        KeywordMatcher: Compiled matcher for this mapping
+    """
+    cached = _MATCHER_CACHE.get(id(mapping))
+    if cached is not None:
+        cached_mapping, matcher = cached
+        if cached_mapping is mapping and matcher.size == len(mapping):
+            return matcher
+
+    matcher = KeywordMatcher(mapping)
+    _MATCHER_CACHE[id(mapping)] = (mapping, matcher)
+    return matcher
+
+
+# ============================================================================
+# FUZZY FALLBACK (TRIGRAM CANDIDATE INDEX)
+# ============================================================================
+
+def _trigrams(text):
+    """Character trigrams of text, padded with one space on each side."""
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _digits(text):
+    return ''.join(ch for ch in text if ch.isdigit())
+
+
+class FuzzyIndex:
+    """
+    Typo-tolerant fallback matcher backed by a character-trigram inverted index.
+
+    Only keywords sharing enough trigrams with a query window are scored with
+    Levenshtein ratio, so a lookup scores a handful of candidates instead of
+    every keyword in the mapping.
+
+    With leading_words=True, multi-word keywords are also indexed by their
+    leading words, so "3 seater" (or "3 seeter") finds "3 seater sofa". A
+    leading-words entry is skipped when another keyword has exactly that text.
+    Off by default: for products it would let a bare "sofa" match "sofa bed".
+
+    Matching rules (fuzzy matching used to turn "3 seater" into "4 seater"):
+    - Digits must match exactly ("3 seater" can never match "4 seater sofa")
+    - Keywords and query windows shorter than MIN_LENGTH are never fuzzy matched
+    - A keyword must share trigrams with the window (Dice >= MIN_OVERLAP);
+      of those, the max_candidates closest distinct texts are scored
+
+    Args:
+        mapping (dict): Keyword -> value mapping (treated as read-only)
+        leading_words (bool): Also index the leading words of multi-word keywords
+        max_candidates (int): Distinct keyword texts scored per query window (default: 8)
+    """
+    MIN_LENGTH = 4
+    MIN_OVERLAP = 0.5  # Dice coefficient on trigrams needed to become a candidate
+
+    def __init__(self, mapping, leading_words=False, max_candidates=8):
+        self.mapping = mapping
+        self.size = len(mapping)
+        self.leading_words = leading_words
+        self.max_candidates = max_candidates
+        self._entries = []    # (indexed text, digits, trigram count, [keyword order, ...])
+        self._entry_ids = {}  # indexed text -> entry index (shared by keywords with the same text)
+        self._keywords = list(mapping)
+        self._postings = {}   # trigram -> [entry index, ...]
+        self._word_counts = set()
+
+        full_texts = {keyword.lower() for keyword in mapping}
+        for order, keyword in enumerate(self._keywords):
+            lowered = keyword.lower()
+            words = lowered.split()
+            texts = [lowered]
+            if leading_words:
+                texts += [
+                    ' '.join(words[:count]) for count in range(1, len(words))
+                    if ' '.join(words[:count]) not in full_texts
+                ]
+            for text in texts:
+                if len(text) >= self.MIN_LENGTH:
+                    self._add_entry(order, text)
+
+    def _add_entry(self, order, text):
+        index = self._entry_ids.get(text)
+        if index is not None:
+            self._entries[index][3].append(order)
+            return
+        grams = _trigrams(text)
+        index = len(self._entries)
+        self._entry_ids[text] = index
+        self._entries.append((text, _digits(text), len(grams), [order]))
+        for gram in grams:
+            self._postings.setdefault(gram, []).append(index)
+        self._word_counts.add(len(text.split()))
+
+    def _windows(self, query):
+        """Runs of consecutive query words with the word counts keywords have."""
+        words = query.lower().split()
+        for count in sorted(self._word_counts):
+            for start in range(len(words) - count + 1):
+                window = ' '.join(words[start:start + count])
+                if len(window) >= self.MIN_LENGTH:
+                    yield window
+
+    def match(self, query, fuzziness=85):
+        """
+        Find keywords within `fuzziness` Levenshtein ratio of a query window.
+
+        Args:
+            query (str): Search query (case-insensitive)
+            fuzziness (int): Minimum ratio score (0-100)
+
+        Returns:
+            list: Tuples of (keyword, value, score) sorted by score desc, ties in
+                  mapping order. Scores are the ratio, so they sit below the
+                  exact/prefix scores of KeywordMatcher.
+        """
+        best = {}  # keyword order -> best score
+        postings = self._postings
+        entries = self._entries
+
+        for window in self._windows(query):
+            all_grams = _trigrams(window)
+            grams = [gram for gram in all_grams if gram in postings]
+            if not grams:
+                continue
+            window_grams = len(all_grams)
+
+            # Shared-trigram counts for every entry in one pass over the posting
+            # lists (Counter counts in C). An entry sharing `count` trigrams has
+            # at least that many, so counts below `needed` can't reach
+            # MIN_OVERLAP; the rest get the exact Dice check. Digits are checked
+            # before the candidate cut, so keywords that only differ in their
+            # digits ("model 3" ... "model 30") can't crowd out the one that can
+            # actually match.
+            shared = Counter(chain.from_iterable(postings[gram] for gram in grams))
+            needed = self.MIN_OVERLAP * window_grams / (2 - self.MIN_OVERLAP)
+            window_digits = _digits(window)
+            candidates = []
+            for index in [index for index, count in shared.items() if count >= needed]:
+                _, digits, entry_grams, _ = entries[index]
+                dice = 2.0 * shared[index] / (window_grams + entry_grams)
+                if dice >= self.MIN_OVERLAP and digits == window_digits:
+                    candidates.append((dice, index))
+            if not candidates:
+                continue
+            candidates.sort(key=lambda x: (-x[0], x[1]))
+
+            for _, index in candidates[:self.max_candidates]:
+                text, _, _, orders = entries[index]
+                score = fuzz.ratio(window, text)
+                if score < fuzziness:
+                    continue
+                for order in orders:
+                    if score > best.get(order, -1):
+                        best[order] = score
+
+        matches = []
+        for order in sorted(best):
+            keyword = self._keywords[order]
+            matches.append((keyword, self.mapping[keyword], best[order]))
+        matches.sort(key=lambda x: x[2], reverse=True)
+        return matches
+
+
+_FUZZY_CACHE = {}
+
+
+def get_fuzzy_index(mapping, leading_words=False):
+    """
+    Returns the FuzzyIndex for a mapping, building it on first use.
+
+    Fuzzy matching is the rare path, so indexes are built lazily (same caching
+    rules as get_matcher).
+
+    Args:
+        mapping (dict): Keyword -> value mapping
+        leading_words (bool): Also match the leading words of multi-word keywords
+
+    Returns:
+        FuzzyIndex: Trigram index for this mapping
+    """
+    cache_key = (id(mapping), leading_words)
+    cached = _FUZZY_CACHE.get(cache_key)
+    if cached is not None:
+        cached_mapping, index = cached
+        if cached_mapping is mapping and index.size == len(mapping):
+            return index
+
+    index = FuzzyIndex(mapping, leading_words=leading_words)
+    _FUZZY_CACHE[cache_key] = (mapping, index)
+    return index
+
+
+def register_indexes(matchers=(), fuzzy_indexes=()):
+    """
+    Installs prebuilt matchers/fuzzy indexes (e.g. unpickled from a catalog
+    snapshot) so get_matcher/get_fuzzy_index return them instead of rebuilding.
+
+    Each index keeps a reference to its own mapping, so the cache entries
+    point at the mappings that came out of the same snapshot.
+
+    Args:
+        matchers (iterable): KeywordMatcher instances
+        fuzzy_indexes (iterable): FuzzyIndex instances
+    """
+    for matcher in matchers:
+        _MATCHER_CACHE[id(matcher.mapping)] = (matcher.mapping, matcher)
+    for index in fuzzy_indexes:
+        _FUZZY_CACHE[(id(index.mapping), index.leading_words)] = (index.mapping, index)
+
+
+def forget_indexes(mapping):
+    """
+    Drops the cached matcher and fuzzy indexes of a mapping (e.g. a fabric
+    shard evicted from memory), so the caches don't keep it alive.
+    """
+    cached = _MATCHER_CACHE.get(id(mapping))
+    if cached is not None and cached[0] is mapping:
+        del _MATCHER_CACHE[id(mapping)]
+    for leading_words in (False, True):
+        cached = _FUZZY_CACHE.get((id(mapping), leading_words))
+        if cached is not None and cached[0] is mapping:
+            del _FUZZY_CACHE[(id(mapping), leading_words)]
+
+
+# ============================================================================
+# SINGLE-PASS QUERY PARSER
+# ============================================================================
+
+# Filler words stripped by QueryParser.normalize (minus any word used in a keyword)
+STOP_WORDS = frozenset([
+    "a", "an", "the", "in", "with", "for", "of", "on", "and", "please",
+    "how", "much", "is", "what", "whats", "what's", "price", "cost", "costs",
+    "show", "me", "i", "want", "would", "like", "quote", "get",
+])
+
+
+class QueryResolution:
+    """
+    Structured result of resolving one query against the catalog.
+
+    Holds the matched keyword, data and SKU for each dimension (product, size,
+    cover, fabric/colour), the confidence score per dimension and, when the
+    query could not be resolved, the error code and HTTP status the pricing
+    endpoint should return.
+
+    Attributes:
+        confidence (dict): Dimension name -> confidence score of the chosen match
+        options (list): Competing candidates when the query was ambiguous
+        defaults (list): Dimensions filled with a default (e.g. ['cover'])
+        fuzzy (list): Dimensions resolved by the typo-tolerant fallback
+        error_code (str): Error code from error_codes.py, None if resolved
+    """
+    def __init__(self, query):
+        self.query = query
+        self.product_keyword = None
+        self.product = None
+        self.product_sku = None
+        self.product_type = None
+        self.size_keyword = None
+        self.size_sku = None
+        self.cover_keyword = None
+        self.cover_sku = None
+        self.fabric_keyword = None
+        self.fabric = None
+        self.confidence = {}
+        self.options = []
+        self.defaults = []
+        self.fuzzy = []
+        self.error_code = None
+        self.error_message = None
+        self.error_details = None
+        self.status_code = 200
+
+    @property
+    def ok(self):
+        """True if every dimension was resolved."""
+        return self.error_code is None
+
+    @property
+    def fabric_sku(self):
+        return self.fabric.get('fabric_sku') if isinstance(self.fabric, Mapping) else None
+
+    @property
+    def color_sku(self):
+        return self.fabric.get('color_sku') if isinstance(self.fabric, Mapping) else None
+
+    @property
+    def ambiguous(self):
+        return self.error_code in ("E2002", "E2005")
+
+    def sku_tuple(self):
+        """Returns (product_sku, size_sku, cover_sku, fabric_sku, color_sku)."""
+        return (self.product_sku, self.size_sku, self.cover_sku, self.fabric_sku, self.color_sku)
+
+    def fail(self, error_code, status_code=400, message=None, details=None):
+        """Marks the resolution as failed and returns it (for early returns)."""
+        self.error_code = error_code
+        self.status_code = status_code
+        self.error_message = message
+        self.error_details = details
+        return self
+
+    def to_dict(self):
+        """JSON-serialisable summary (used in logs and tool responses)."""
+        return {
+            "query": self.query,
+            "product_sku": self.product_sku,
+            "product_type": self.product_type,
+            "size_sku": self.size_sku,
+            "cover_sku": self.cover_sku,
+            "fabric_sku": self.fabric_sku,
+            "color_sku": self.color_sku,
+            "confidence": dict(self.confidence),
+            "defaults": list(self.defaults),
+            "fuzzy": list(self.fuzzy),
+            "options": list(self.options),
+            "error_code": self.error_code
+        }
+
+
+class QueryParser:
+    """
+    Resolves product, size, cover and fabric from a query in one pass.
+
+    Products, sizes and covers are folded into a single index of lowercase
+    keyword -> {(dimension, product_sku): [keyword index, ...]}. The query's
+    word-boundary slices are looked up once; the hits are then split per
+    dimension, and only the chosen product's size/cover entries are read.
+    Fabrics are most of the vocabulary and may live in catalog.FabricShards
+    (loaded per product), so they aren't folded in: only the chosen
+    product's fabric map is read, through its cached KeywordMatcher.
+    Scoring and tie-breaking match KeywordMatcher (the original regex scan).
+
+    Product, size and fabric fall back to FuzzyIndex when nothing matches
+    exactly; covers don't (they have a safe default). Sizes and fabrics also
+    match on leading words ("3 seater" -> "3 seater sofa").
+
+    Args:
+        products (dict): PRODUCT_SKU_MAP
+        sizes (dict): SIZE_SKU_MAP (product SKU -> size keyword map)
+        covers (dict): COVERS_SKU_MAP (product SKU -> cover keyword map)
+        fabrics (dict or FabricShards): FABRIC_SKU_MAP (product SKU -> fabric keyword map)
+        fuzziness (int): Minimum fuzzy score (0-100, default: 85)
+    """
+    FUZZY_DIMENSIONS = ("product", "size", "fabric")
+    LEADING_WORD_DIMENSIONS = ("size", "fabric")
+
+    def __init__(self, products, sizes, covers, fabrics, fuzziness=85):
+        self.fuzziness = fuzziness
+        self.products = products
+        self.sizes = sizes
+        self.covers = covers
+        self.fabrics = fabrics
+        self._postings = {}        # lowercase keyword -> {(dimension, scope): [index, ...]}
+        self._keywords = {}        # (dimension, scope) -> [keyword, ...] in mapping order
+        self._fallback = set()     # (dimension, scope) with keywords needing the regex path
+
+        self._add("product", None, products)
+        for dimension, per_product in (("size", sizes), ("cover", covers)):
+            for product_sku, mapping in per_product.items():
+                self._add(dimension, product_sku, mapping)
+
+        self._lengths = sorted({len(text) for text in self._postings})
+        get_fuzzy_index(products)  # Product typos are the common case - build up front
+
+        # Filler words are only dropped if no catalog keyword uses them.
+        # FabricShards lists its keywords without loading any product
+        if hasattr(fabrics, "keywords"):
+            fabric_keywords = fabrics.keywords()
+        else:
+            fabric_keywords = {keyword for fabric_map in fabrics.values() for keyword in fabric_map}
+        catalog_words = set()
+        for text in chain(self._postings, (keyword.lower() for keyword in fabric_keywords)):
+            catalog_words.update(text.split())
+        self.stop_words = frozenset(STOP_WORDS - catalog_words)
+
+    def normalize(self, query):
+        """
+        Canonical form of a query, used as the memo cache key.
+
+        Lowercases, collapses whitespace and drops filler words ("how much is
+        the ... in ..."). Callers resolve the normalized text itself, so every
+        query sharing a key is guaranteed to share a resolution.
+
+        Args:
+            query (str): Raw query
+
+        Returns:
+            str: Normalized query
+        """
+        return ' '.join(word for word in query.lower().split() if word not in self.stop_words)
+
+    def _add(self, dimension, scope, mapping):
+        key = (dimension, scope)
+        keywords = list(mapping)
+        self._keywords[key] = keywords
+        for index, keyword in enumerate(keywords):
+            lowered = keyword.lower()
+            if len(lowered) != len(keyword):
+                self._fallback.add(key)
+                continue
+            self._postings.setdefault(lowered, {}).setdefault(key, []).append(index)
+
+    def _scan(self, lowered):
+        """
+        The single pass: every keyword occurrence starting on a word boundary.
+
+        Returns:
+            dict: lowercase keyword -> True if any occurrence was a whole word
+        """
+        hits = {}
+        query_len = len(lowered)
+        postings = self._postings
+        for start in range(query_len + 1):
+            if not _is_boundary(lowered, start):
+                continue
+            for length in self._lengths:
+                end = start + length
+                if end > query_len:
+                    break
+                text = lowered[start:end]
+                if text in postings:
+                    hits[text] = hits.get(text, False) or _is_boundary(lowered, end)
+        return hits
+
+    def _matches(self, hits, query, dimension, scope, mapping, resolution=None):
+        """
+        Builds (keyword, value, score) tuples for one dimension from the scan hits.
+
+        Falls back to the dimension's FuzzyIndex when nothing matches exactly,
+        recording the dimension in resolution.fuzzy when that happens.
+        """
+        key = (dimension, scope)
+        if key in self._fallback or hits is None or key not in self._keywords:
+            # Fabrics (not in the shared index) and keywords the scan can't handle
+            matches = get_matcher(mapping).match(query)
+        else:
+            exact = {}
+            for text, whole_word in hits.items():
+                for index in self._postings[text].get(key, ()):
+                    exact[index] = exact.get(index, False) or whole_word
+
+            keywords = self._keywords[key]
+            matches = []
+            for index in sorted(exact):
+                keyword = keywords[index]
+                base = 100 if exact[index] else 90
+                matches.append((keyword, mapping[keyword], base + len(keyword)))
+            matches.sort(key=lambda x: x[2], reverse=True)
+
+        if not matches and dimension in self.FUZZY_DIMENSIONS and self.fuzziness:
+            leading_words = dimension in self.LEADING_WORD_DIMENSIONS
+            matches = get_fuzzy_index(mapping, leading_words).match(query, self.fuzziness)
+            if matches and resolution is not None:
+                resolution.fuzzy.append(dimension)
+        return matches
+
+    def match_dimension(self, query, dimension, product_sku=None):
+        """
+        Matches a single dimension (e.g. just the product) without resolving the rest.
+
+        Returns:
+            list: (keyword, value, confidence) tuples sorted by confidence desc
+        """
+        mapping = self._mapping(dimension, product_sku)
+        if not mapping:
+            return []
+        lowered = query.lower()
+        hits = self._scan(lowered) if len(lowered) == len(query) else None
+        return self._matches(hits, query, dimension, product_sku, mapping)
+
+    def _mapping(self, dimension, product_sku):
+        if dimension == "product":
+            return self.products
+        per_product = {"size": self.sizes, "cover": self.covers, "fabric": self.fabrics}[dimension]
+        return per_product.get(product_sku, {})
+
+    def parse(self, query):
+        """
+        Resolves every dimension of a query.
+
+        Mirrors the translation rules of get_price_logic: ambiguous products
+        (tied top score) fail with E2002, footstools/dog beds default to their
+        first size, covers default to 'fit' (or the first available cover),
+        and close non-exact fabric scores fail with E2005.
+
+        Args:
+            query (str): Lowercased natural language query
+
+        Returns:
+            QueryResolution: Resolved SKUs, or an error code and status
+        """
+        resolution = QueryResolution(query)
+        lowered = query.lower()
+        hits = self._scan(lowered) if len(lowered) == len(query) else None
+
+        # Product
+        product_matches = self._matches(hits, query, "product", None, self.products, resolution)
+        if not product_matches:
+            return resolution.fail("E2001")
+
+        if len(product_matches) > 1 and product_matches[0][2] == product_matches[1][2]:
+            suggestions = [m[1]["full_name"] for m in product_matches[:3]]
+            resolution.options = suggestions
+            return resolution.fail(
+                "E2002",
+                message=f"Multiple products match. Did you mean: {', '.join(suggestions)}?",
+                details={"options": suggestions}
+            )
+
+        resolution.product_keyword, resolution.product, score = product_matches[0]
+        resolution.product_sku = resolution.product["sku"]
+        resolution.product_type = resolution.product["type"]
+        resolution.confidence["product"] = score
+        product_sku = resolution.product_sku
+
+        # Size
+        size_map = self.sizes.get(product_sku, {})
+        size_matches = self._matches(hits, query, "size", product_sku, size_map, resolution) if size_map else []
+        if size_matches and "size" in resolution.fuzzy and len(size_matches) > 1 \
+                and size_matches[0][2] == size_matches[1][2] and size_matches[0][1] != size_matches[1][1]:
+            # A typo'd or partial size ("chaise") that fits several sizes equally well
+            suggestions = [m[0] for m in size_matches[:3]]
+            resolution.options = suggestions
+            return resolution.fail(
+                "E2003",
+                message=f"Multiple sizes match. Did you mean: {', '.join(suggestions)}?",
+                details={"options": suggestions}
+            )
+        if size_matches:
+            resolution.size_keyword, resolution.size_sku, score = size_matches[0]
+            resolution.confidence["size"] = score
+        elif resolution.product_type in ["footstool", "dog_bed"] and size_map:
+            # Footstools and dog beds are usually asked for without a size
+            resolution.size_sku = list(size_map.values())[0]
+            resolution.defaults.append("size")
+        else:
+            return resolution.fail("E2003")
+
+        # Cover
+        cover_map = self.covers.get(product_sku, {})
+        cover_matches = self._matches(hits, query, "cover", product_sku, cover_map) if cover_map else []
+        if cover_matches:
+            resolution.cover_keyword, resolution.cover_sku, score = cover_matches[0]
+            resolution.confidence["cover"] = score
+        else:
+            resolution.cover_sku = "fit"
+            if cover_map and "fit" not in cover_map.values():
+                resolution.cover_sku = list(cover_map.values())[0]
+            resolution.defaults.append("cover")
+
+        # Fabric (only within the product's available fabrics)
+        fabric_map = self.fabrics.get(product_sku, {})
+        if not fabric_map:
+            return resolution.fail(
+                "E2004",
+                status_code=404,
+                message=f"No fabrics available for '{resolution.product['full_name']}'."
+            )
+
+        fabric_matches = self._matches(hits, query, "fabric", product_sku, fabric_map, resolution)
+        if not fabric_matches:
+            return resolution.fail("E2004")
+
+        # Ambiguity check for fabrics (e.g. "blue" matching "light blue" and "dark blue")
+        if len(fabric_matches) > 1 and fabric_matches[0][2] < 100:
+            if fabric_matches[0][2] - fabric_matches[1][2] < 10:
+                suggestions = [m[0] for m in fabric_matches[:3]]
+                resolution.options = suggestions
+                return resolution.fail(
+                    "E2005",
+                    message=f"Multiple fabrics match. Did you mean: {', '.join(suggestions)}?",
+                    details={"options": suggestions}
+                )
+
+        resolution.fabric_keyword, resolution.fabric, score = fabric_matches[0]
+        resolution.confidence["fabric"] = score
+
+        fabric = resolution.fabric
+        if not isinstance(fabric, Mapping) or 'fabric_sku' not in fabric or 'color_sku' not in fabric:
+            return resolution.fail(
+                "E3004",
+                status_code=500,
+                details={"product": resolution.product['full_name']}
+            )
+
+        return resolution
+
+
+# ============================================================================
+# COLOUR INDEX (FABRIC SEARCH)
+# ============================================================================
+
+# Fabric tiers in display order (cheapest first)
+TIER_ORDER = {"Essentials": 1, "Premium": 2, "Luxury": 3}
+
+_WORD_RUN = re.compile(r'[^\W_]+')
+
+# Colour families: a search for the family name also returns every colour
+# named with one of its words ("blue" -> Navy, Teal, Indigo, Denim...). A
+# colour can sit in several families (Teal is blue and green).
+COLOR_FAMILIES = {
+    "blue": ["blue", "navy", "teal", "indigo", "denim", "sky", "pacific", "cobalt", "azure",
+             "sapphire", "ocean", "marine", "midnight", "petrol", "duck egg", "cornflower",
+             "aqua", "turquoise", "powder"],
+    "green": ["green", "olive", "sage", "moss", "forest", "emerald", "jade", "lime", "mint",
+              "fern", "pistachio", "khaki", "teal", "celadon", "leaf", "grass", "bottle"],
+    "grey": ["grey", "gray", "charcoal", "slate", "graphite", "pewter", "silver", "ash",
+             "smoke", "flint", "steel", "dove", "marl", "anthracite", "stone", "pebble"],
+    "red": ["red", "rust", "burgundy", "claret", "crimson", "scarlet", "cherry", "ruby",
+            "wine", "berry", "brick", "raspberry", "oxblood", "terracotta", "poppy"],
+    "pink": ["pink", "blush", "rose", "coral", "fuchsia", "magenta", "salmon", "dusky pink",
+             "raspberry", "peony"],
+    "orange": ["orange", "rust", "terracotta", "tangerine", "copper", "pumpkin", "apricot",
+               "peach", "amber", "burnt"],
+    "yellow": ["yellow", "mustard", "ochre", "gold", "lemon", "saffron", "honey", "amber",
+               "sunflower", "primrose", "straw", "butter"],
+    "purple": ["purple", "violet", "plum", "aubergine", "lilac", "lavender", "mauve",
+               "heather", "damson", "grape", "amethyst", "mulberry"],
+    "brown": ["brown", "chocolate", "mink", "coffee", "mocha", "tan", "tobacco", "walnut",
+              "chestnut", "cocoa", "espresso", "cinnamon", "bronze", "caramel", "toffee",
+              "umber", "taupe", "conker"],
+    "beige": ["beige", "biscuit", "oatmeal", "oat", "sand", "stone", "linen", "natural",
+              "ecru", "cream", "fawn", "camel", "mushroom", "putty", "parchment", "taupe",
+              "flax", "hessian", "jute", "wheat", "buff", "latte", "neutral"],
+    "white": ["white", "ivory", "cream", "bianco", "chalk", "snow", "pearl", "alabaster",
+              "ecru", "off white", "milk", "cotton"],
+    "black": ["black", "ebony", "jet", "onyx", "noir", "ink", "coal", "liquorice", "nero"],
+}
+
+# Other ways customers name a family
+COLOR_FAMILY_ALIASES = {
+    "gray": "grey", "blues": "blue", "greens": "green", "greys": "grey", "grays": "grey",
+    "reds": "red", "pinks": "pink", "neutral": "beige", "neutrals": "beige",
+    "off white": "white", "off-white": "white",
+}
+
+_FAMILY_PATTERNS = {
+    family: re.compile(r'\b(?:' + '|'.join(re.escape(word) for word in sorted(words, key=len, reverse=True)) + r')s?\b')
+    for family, words in COLOR_FAMILIES.items()
+}
+
+
+def color_families(color_name):
+    """
+    Colour families a colour name belongs to (e.g. 'Duck Egg Blue' -> ['blue']).
+
+    Used by sku_discovery_tool.py to tag fabrics when the catalogue is built,
+    and by ColorIndex for records scraped before the tag existed.
+
+    Args:
+        color_name (str): Colour name as scraped
+
+    Returns:
+        list: Family names in COLOR_FAMILIES order (empty if none match)
+    """
+    name = (color_name or "").lower()
+    return [family for family, pattern in _FAMILY_PATTERNS.items() if pattern.search(name)]
+
+
+def color_family(color):
+    """
+    The family a search term names, if any ('blue', 'Gray', 'neutrals').
+
+    Only whole family names (or aliases) expand; 'navy' or 'dark blue' stay
+    literal searches.
+
+    Returns:
+        str or None: Family name
+    """
+    term = " ".join(color.lower().split())
+    if term in COLOR_FAMILY_ALIASES:
+        return COLOR_FAMILY_ALIASES[term]
+    return term if term in COLOR_FAMILIES else None
+
+
+class ColorIndex:
+    """
+    Inverted index from colour-name tokens to unique fabric/colour records.
+
+    Built once from FABRIC_SKU_MAP. Fabrics shared by many products are indexed
+    once (deduplicated by fabric SKU + colour SKU, first product wins) and
+    numbered in result order: tier (Essentials, Premium, Luxury), then fabric
+    name, then colour name. Posting lists and the per-product filter hold
+    those numbers, so a search is a lookup, an intersection and a sort of
+    small integers. Only the matched records are turned into results.
+
+    The index keeps a reference to each record, not a copy. Given a
+    catalog.FabricShards it is built from the file's colour columns without
+    parsing any record, keeps just the record ids (and lowercase colour
+    names) and reads the matched records from the shards file per search.
+
+    Matching is the same substring test the handler always used
+    ("blu" finds "Navy Blue"): every alphanumeric run of the query must sit
+    inside one token of the colour name, so only the posting lists of tokens
+    containing the query's longest run are checked. Which tokens contain a
+    given substring is precomputed at build time (colour tokens are short),
+    so finding them is one dict lookup, not a scan of the vocabulary. A query naming a colour
+    family ("blue") also returns the family's records (Navy, Teal, ...), from
+    the record's color_families tag or, if untagged, its colour name.
+
+    Args:
+        fabric_map_by_product (dict or FabricShards): product SKU -> {keyword: fabric data}
+    """
+    def __init__(self, fabric_map_by_product):
+        # FabricShards (duck-typed: catalog imports this module) hands out record ids
+        self._shards = fabric_map_by_product if hasattr(fabric_map_by_product, "color_columns") else None
+        columns = self._shards.color_columns() if self._shards is not None else None
+        first_seen = {}  # (fabric_sku, color_sku) -> (record id or fabric data, fabric data)
+        product_keys = {}
+        for product_sku in fabric_map_by_product:
+            keys = product_keys.setdefault(product_sku, [])
+            if columns is not None:
+                # Just the indexed fields (what the record has of them), not the record
+                entries = ((record_id, {field: values[record_id] for field, values in columns.items()
+                                        if field != "products" and values[record_id] is not None})
+                           for record_id in columns["products"][product_sku])
+            else:
+                entries = ((fabric_data, fabric_data) for fabric_data in fabric_map_by_product[product_sku].values())
+            for source, fabric_data in entries:
+                if not isinstance(fabric_data, Mapping):
+                    continue  # Mattress tensions have no colour
+                key = (fabric_data.get('fabric_sku'), fabric_data.get('color_sku'))
+                if key not in first_seen:
+                    first_seen[key] = (source, fabric_data)
+                keys.append(key)
+
+        # Stable sort keeps first-seen order for ties, like the old per-call sort
+        all_keys = list(first_seen)
+        fabrics = [fabric_data for _, fabric_data in first_seen.values()]
+        order = sorted(range(len(fabrics)), key=lambda i: (
+            TIER_ORDER.get(fabrics[i].get("tier", "Unknown"), 99),
+            fabrics[i].get("fabric_name", "Unknown"), fabrics[i].get("color_name", "")
+        ))
+        sources = list(first_seen.values())
+        self._sources = [sources[i][0] for i in order]  # Record id (shards) or the fabric data itself
+        fabrics = [fabrics[i] for i in order]
+        position = {all_keys[i]: rank for rank, i in enumerate(order)}
+
+        self._names = [sys.intern(fabric_data.get("color_name", "").lower()) for fabric_data in fabrics]
+        self._postings = {}  # token -> sorted record numbers
+        for record_id, name in enumerate(self._names):
+            for token in set(_WORD_RUN.findall(name)):
+                self._postings.setdefault(token, []).append(record_id)
+        containing = {}  # substring -> tokens containing it
+        for token in self._postings:
+            for start in range(len(token)):
+                for end in range(start + 1, len(token) + 1):
+                    containing.setdefault(token[start:end], set()).add(token)
+        self._containing = {substring: tuple(tokens) for substring, tokens in containing.items()}
+
+        self._families = {}  # family -> frozenset of record numbers
+        for record_id, fabric_data in enumerate(fabrics):
+            families = fabric_data.get("color_families")
+            if families is None:
+                families = color_families(fabric_data.get("color_name", ""))
+            for family in families:
+                self._families.setdefault(family, set()).add(record_id)
+        self._families = {family: frozenset(ids) for family, ids in self._families.items()}
+        self._products = {sku: frozenset(position[key] for key in keys) for sku, keys in product_keys.items()}
+        self.size = len(self._sources)
+
+    @staticmethod
+    def _record(fabric_data):
+        """Search result for one fabric/colour (fields the chat tool returns)."""
+        desc = fabric_data.get("desc", "")
+        return {
+            "fabric_name": fabric_data.get("fabric_name", "Unknown"),
+            "color_name": fabric_data.get("color_name", ""),
+            "tier": fabric_data.get("tier", "Unknown"),
+            "collection": fabric_data.get("collection", ""),
+            "description": desc[:200] + "..." if len(desc) > 200 else desc,
+            "swatch_url": fabric_data.get("swatch_url", ""),
+            "fabric_sku": fabric_data.get("fabric_sku"),
+            "color_sku": fabric_data.get("color_sku")
+        }
+
+    def search(self, color, product_sku=None):
+        """
+        Finds fabric/colour records whose colour name contains `color`, plus
+        the whole colour family when `color` names one.
+
+        Args:
+            color (str): Lowercase colour text (e.g. 'blue', 'dark grey')
+            product_sku (str): Only fabrics offered for this product (optional)
+
+        Returns:
+            list: Matching records (fresh dicts) in tier/fabric/colour order
+        """
+        family_ids = self._families.get(color_family(color), frozenset())
+        tokens = _WORD_RUN.findall(color)
+        if tokens:
+            longest = max(tokens, key=len)
+            candidates = set()
+            for token in self._containing.get(longest, ()):
+                candidates.update(self._postings[token])
+        else:
+            candidates = set(range(self.size))
+
+        candidates = {i for i in candidates if color in self._names[i]} | family_ids
+
+        if product_sku is not None:
+            candidates &= self._products.get(product_sku, frozenset())
+
+        if self._shards is not None:
+            return [self._record(self._shards.record(self._sources[i])) for i in sorted(candidates)]
+        return [self._record(self._sources[i]) for i in sorted(candidates)]
+
+
+# ============================================================================
+# PRODUCT PRICE INDEX (BUDGET SEARCH)
+# ============================================================================
+
+class ProductPriceIndex:
+    """
+    Columnar, price-sorted index of PRODUCT_SKU_MAP for budget searches.
+
+    Built once: every keyword entry becomes a row with its parsed base price,
+    type and lowercase keyword/full name. Rows are sorted by price (mapping
+    order for ties, like the old stable sort), with one sorted price array
+    for the whole catalogue and one per product type. A search bisects to
+    the budget cut-off and walks rows from the cheapest until it has enough
+    results - O(log N + k) instead of a parse, filter and sort of the whole
+    map per call. With a keyword filter smaller than the cut-off, only those
+    keywords' rows are looked at (row numbers are in price order, so sorting
+    them gives the cheapest first).
+
+    Entries whose price isn't an integer string are left out (they used to
+    fail the whole search).
+
+    Args:
+        product_map (dict): keyword -> product data (PRODUCT_SKU_MAP)
+    """
+    def __init__(self, product_map):
+        rows = []
+        for position, (keyword, product_data) in enumerate(product_map.items()):
+            try:
+                base_price = int(product_data.get("price", 999999))
+            except (TypeError, ValueError):
+                continue
+            rows.append((base_price, position, keyword, product_data))
+        rows.sort(key=lambda row: (row[0], row[1]))
+
+        self.results = []     # Prebuilt search result per row
+        self._keywords = []   # Mapping keyword per row
+        types = []
+        for base_price, _, keyword, product_data in rows:
+            self.results.append({
+                "name": product_data.get("full_name", keyword),
+                "base_price": base_price,
+                "price_display": product_data.get("price_display", f"£{base_price:,}"),
+                "type": product_data.get("type", "unknown"),
+                "sku": product_data.get("sku")
+            })
+            self._keywords.append(keyword)
+            types.append(product_data.get("type"))
+        self._row_of = {keyword: i for i, keyword in enumerate(self._keywords)}
+        self._types = types
+
+        # Partitions: (sorted prices, row numbers) for all rows and per type
+        self._partitions = {"all": (array('q', (r["base_price"] for r in self.results)), array('l', range(len(rows))))}
+        for product_type in set(types):
+            row_ids = [i for i, t in enumerate(types) if t == product_type]
+            self._partitions[product_type] = (
+                array('q', (self.results[i]["base_price"] for i in row_ids)), array('l', row_ids)
+            )
+        self.size = len(rows)
+
+    def search(self, max_price, product_type="all", keywords=None, limit=20):
+        """
+        Cheapest rows at or under max_price.
+
+        Args:
+            max_price (float): Budget (inclusive)
+            product_type (str): Product type or 'all'
+            keywords (set): Only rows for these mapping keywords (e.g. from
+                ProductNameIndex.keywords); None for no name filter
+            limit (int): Maximum results
+
+        Returns:
+            tuple: (results, truncated) - fresh dicts, cheapest first;
+                   truncated is True if more rows matched than limit
+        """
+        partition = self._partitions.get(product_type)
+        if partition is None:
+            return [], False
+        prices, row_ids = partition
+        cutoff = bisect_right(prices, max_price)
+
+        if keywords is not None and len(keywords) < cutoff:
+            # Walk the keywords' own rows instead of everything under the cut-off
+            candidates = sorted(self._row_of[keyword] for keyword in keywords if keyword in self._row_of)
+            candidates = (i for i in candidates if self.results[i]["base_price"] <= max_price
+                          and (product_type == "all" or self._types[i] == product_type))
+            keywords = None
+        else:
+            candidates = (row_ids[position] for position in range(cutoff))
+
+        matches = []
+        for i in candidates:
+            if keywords is not None and self._keywords[i] not in keywords:
+                continue
+            matches.append(dict(self.results[i]))
+            if len(matches) > limit:
+                return matches[:limit], True
+        return matches, False
+
+
+# ============================================================================
+# PRODUCT NAME INDEX (TOOL HANDLERS)
+# ============================================================================
+
+class _PrefixTrie:
+    """Character trie: word prefix -> ids of entries with a word starting with it."""
+
+    def __init__(self):
+        self._root = {}
+
+    def add(self, word, entry_id):
+        node = self._root
+        for ch in word:
+            node = node.setdefault(ch, {})
+            node.setdefault(None, set()).add(entry_id)  # None key holds the ids
+
+    def ids(self, prefix):
+        node = self._root
+        for ch in prefix:
+            node = node.get(ch)
+            if node is None:
+                return set()
+        return node.get(None, set())
+
+
+class ProductNameIndex:
+    """
+    Resolves a product name from a chat tool ('Alwinton', 'rye', 'sudbury 3')
+    to ranked PRODUCT_SKU_MAP entries.
+
+    Keywords and full names are split into words and loaded into prefix
+    tries. Every word of the name has to start a word of the keyword or full
+    name. Ranking, ties in mapping order:
+    - 300: the name is the keyword
+    - 200: every word matched the keyword
+    - 100: matched using the full name
+    If nothing matches, the product FuzzyIndex catches typos ('alwintn'),
+    scored by Levenshtein ratio (below 100).
+
+    Args:
+        product_map (dict): keyword -> product data (PRODUCT_SKU_MAP)
+        fuzziness (int): Minimum ratio for the typo fallback (default: 85)
+    """
+    EXACT, KEYWORD, FULL_NAME = 300, 200, 100
+
+    def __init__(self, product_map, fuzziness=85):
+        self.mapping = product_map
+        self.fuzziness = fuzziness
+        self._entries = list(product_map.items())
+        self._order = {keyword: i for i, (keyword, _) in enumerate(self._entries)}
+        self._keyword_trie = _PrefixTrie()
+        self._name_trie = _PrefixTrie()
+        for entry_id, (keyword, product_data) in enumerate(self._entries):
+            for word in set(_WORD_RUN.findall(keyword.lower())):
+                self._keyword_trie.add(word, entry_id)
+            for word in set(_WORD_RUN.findall(product_data.get("full_name", "").lower())):
+                self._name_trie.add(word, entry_id)
+        self.size = len(self._entries)
+
+    def match(self, name):
+        """
+        Ranked entries for a product name.
+
+        Args:
+            name (str): Product name as the customer/LLM wrote it
+
+        Returns:
+            list: (keyword, product_data, score) tuples, best first
+        """
+        lowered = " ".join((name or "").lower().split())
+        words = _WORD_RUN.findall(lowered)
+        if not words:
+            return []
+
+        keyword_ids = any_ids = None
+        for word in words:
+            in_keyword = self._keyword_trie.ids(word)
+            in_any = in_keyword | self._name_trie.ids(word)
+            keyword_ids = in_keyword if keyword_ids is None else keyword_ids & in_keyword
+            any_ids = in_any if any_ids is None else any_ids & in_any
+            if not any_ids:
+                break
+
+        if any_ids:
+            ranked = []
+            for entry_id in sorted(any_ids):
+                keyword, product_data = self._entries[entry_id]
+                if keyword.lower() == lowered:
+                    score = self.EXACT
+                elif entry_id in keyword_ids:
+                    score = self.KEYWORD
+                else:
+                    score = self.FULL_NAME
+                ranked.append((score, entry_id, keyword, product_data))
+            ranked.sort(key=lambda item: (-item[0], item[1]))
+            return [(keyword, product_data, score) for score, _, keyword, product_data in ranked]
+
+        # Typo fallback - the same trigram index get_price uses for products
+        return get_fuzzy_index(self.mapping).match(lowered, fuzziness=self.fuzziness)
+
+    def best(self, name):
+        """
+        Top-ranked entry for a product name.
+
+        Returns:
+            tuple: (keyword, product_data), or (None, None) if nothing matches
+        """
+        matches = self.match(name)
+        if not matches:
+            return None, None
+        return matches[0][0], matches[0][1]
+
+    def keywords(self, name):
+        """Every matching mapping keyword (for filtering listings by product name)."""
+        return {keyword for keyword, _, _ in self.match(name)}
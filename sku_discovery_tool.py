@@ -1,12 +1,16 @@
 import requests
 import json
+import os
 import time
 import re
+import argparse
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 from fuzzywuzzy import process # For cleaning up keywords
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry # (Critique #1) Correct import
+from matching import color_families # Shared colour-family synonym table
+from catalog import build_snapshot, SNAPSHOT_FILE # Prebuilt catalog for fast cold starts
 
 # --- Color Codes for Beautiful Logging ---
 class Colors:
@@ -56,11 +60,22 @@ retry_strategy = Retry(
 )
 adapter = HTTPAdapter(max_retries=retry_strategy)
 session.mount("https://", adapter)
+session.mount("http://", adapter)  # Local stand-ins of the S&S endpoints (--base-url)
 
 # --- Config ---
 BASE_URL = "https://sofasandstuff.com"
 # API endpoints we discovered
 FABRIC_API_URL = "https://sofasandstuff.com/ProductExtend/GetPDPFabrics"
+# Price endpoints (same ones main.py calls live)
+SOFA_API_PATH = "/ProductExtend/ChangeProductSize"
+BED_API_PATH = "/Category/ProductPrice"
+SOFA_PRICE_TYPES = ["sofa", "chair", "footstool", "dog_bed", "sofa_bed", "snuggler"]
+# Price matrix crawl (Phase 4)
+PRICE_TABLE_FILE = "prices.json"
+PRICE_TABLE_VERSION = 2        # 2: per-entry crawled_at
+PRICE_CRAWL_DELAY = 0.5       # Seconds between price calls (be polite)
+PRICE_CHECKPOINT_EVERY = 25   # Save progress after this many priced combinations
+PRICE_MAX_AGE = 7 * 86400     # Re-crawl entries older than this (main.py ignores them too)
 # Headers to make us look like a real browser
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36',
@@ -335,6 +350,7 @@ def discover_fabrics_via_api(product_sku, size_sku, cover_sku):
                 "full_image_url": fabric.get('FullImageUrl', ''),
                 "fabric_id": fabric.get('FabricID', ''),
                 "color_id": fabric.get('ColourID', ''),
+                "color_families": color_families(fabric.get('ColourName', '')),  # e.g. Navy -> ["blue"]
             }
             
             # Add mapping for the color (lowercase keyword)
@@ -403,9 +419,203 @@ def discover_fabrics_from_modal(product_soup):
     
     return fabric_map
 
+# --- Price Matrix Crawl (Phase 4) ---
+# Prices depend on product, size, cover and fabric tier - not on the colour -
+# so one call per (product, size, cover, tier) prices the whole catalogue.
+# The result (prices.json) lets main.py answer /getPrice from memory.
+
+def price_table_key(product_sku, size_sku, cover_sku, tier):
+    """Key of one price table entry (same format main.py looks up)."""
+    return f"{product_sku}|{size_sku}|{cover_sku}|{tier}".lower()
+
+def tier_representatives(fabric_map):
+    """
+    Picks one fabric/colour per tier to price.
+
+    Returns:
+        dict: tier -> fabric data dict (first entry seen for that tier)
+    """
+    representatives = {}
+    for fabric in fabric_map.values():
+        if not isinstance(fabric, dict) or not fabric.get('fabric_sku') or not fabric.get('color_sku'):
+            continue  # Mattress tensions are plain SKU strings
+        representatives.setdefault(fabric.get('tier', 'Unknown'), fabric)
+    return representatives
+
+def fetch_price_record(base_url, product, size_sku, cover_sku, fabric):
+    """
+    Prices one configuration through the S&S price endpoints.
+
+    Mirrors the routing in main.fetch_price_from_upstream: beds use the
+    ProductPrice endpoint, everything else ChangeProductSize.
+
+    Returns:
+        dict or None: ProductSkuRecord-style record, None if not priced
+    """
+    product_sku = product["sku"]
+    headers = dict(HEADERS, Referer=urljoin(base_url, product.get("url", "")))
+    if product["type"] == "bed":
+        url = urljoin(base_url, BED_API_PATH)
+        payload = {
+            'productsku': product_sku,
+            'sizesku': size_sku,
+            'coversku': cover_sku,
+            'fabricSku': fabric['fabric_sku'],
+            'colourSku': fabric['color_sku']
+        }
+    elif product["type"] in SOFA_PRICE_TYPES:
+        url = urljoin(base_url, SOFA_API_PATH)
+        payload = {
+            'sku': product_sku,
+            'querySku': f"{product_sku}{size_sku}{cover_sku}{fabric['fabric_sku']}{fabric['color_sku']}"
+        }
+    else:
+        return None
+
+    response = session.post(url, data=payload, headers=headers, timeout=10)
+    response.raise_for_status()
+    data = response.json()
+    if product["type"] == "bed":
+        return data or None
+    if not data.get("success"):
+        return None
+    return data.get("result", {}).get("ProductSkuRecord") or None
+
+def load_price_table(path):
+    """Loads an existing (possibly partial) price table so a crawl can resume."""
+    if not os.path.exists(path):
+        return {"version": PRICE_TABLE_VERSION, "generated_at": None, "complete": False, "prices": {}}
+    with open(path, "r", encoding='utf-8') as f:
+        table = json.load(f)
+    if table.get("version") != PRICE_TABLE_VERSION:
+        log_warning(f"{path} has version {table.get('version')}, starting a fresh crawl")
+        return {"version": PRICE_TABLE_VERSION, "generated_at": None, "complete": False, "prices": {}}
+    return table
+
+def save_price_table(table, path):
+    """
+    Writes the price table atomically (temp file + rename) so a crash never corrupts it.
+
+    generated_at is the oldest entry's crawled_at, so a resumed crawl doesn't
+    make old prices look new.
+    """
+    crawl_times = [entry["crawled_at"] for entry in table["prices"].values() if entry.get("crawled_at")]
+    table["generated_at"] = min(crawl_times) if crawl_times else None
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding='utf-8') as f:
+        json.dump(table, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+def crawl_price_matrix(all_products, all_sizes, all_covers, all_fabrics,
+                       output_file=PRICE_TABLE_FILE, base_url=BASE_URL, delay=PRICE_CRAWL_DELAY):
+    """
+    Prices every product x size x cover x fabric-tier combination.
+
+    Rate-limited (one call per `delay` seconds) and resumable: entries
+    already in output_file are skipped unless older than PRICE_MAX_AGE, and
+    progress is checkpointed every PRICE_CHECKPOINT_EVERY calls. Failed
+    combinations are retried next run.
+
+    Returns:
+        dict: Crawl statistics
+    """
+    table = load_price_table(output_file)
+    prices = table["prices"]
+    stats = {'combinations': 0, 'already_priced': 0, 'priced': 0, 'failed': 0}
+    recrawl_before = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() - PRICE_MAX_AGE))
+
+    # Build the work list
+    work = []
+    for keyword, product in all_products.items():
+        product_sku = product.get("sku")
+        if not product_sku or product.get("type") == "mattress":
+            continue
+        sizes = sorted(set(all_sizes.get(product_sku, {}).values()))
+        covers = sorted(set(all_covers.get(product_sku, {}).values())) or ["fit"]
+        representatives = tier_representatives(all_fabrics.get(product_sku, {}))
+        for size_sku in sizes:
+            for cover_sku in covers:
+                for tier, fabric in representatives.items():
+                    key = price_table_key(product_sku, size_sku, cover_sku, tier)
+                    stats['combinations'] += 1
+                    if key in prices and prices[key].get("crawled_at", "") >= recrawl_before:
+                        stats['already_priced'] += 1
+                        continue
+                    work.append((key, product, size_sku, cover_sku, fabric))
+
+    log_info(f"{stats['combinations']} combinations, {stats['already_priced']} already priced, {len(work)} to crawl")
+    log_info(f"Estimated time: {len(work) * delay / 60:.1f} minutes at {delay}s per call")
+
+    last_call = 0.0
+    since_checkpoint = 0
+    for i, (key, product, size_sku, cover_sku, fabric) in enumerate(work):
+        # Rate limit
+        wait_for = delay - (time.time() - last_call)
+        if wait_for > 0:
+            time.sleep(wait_for)
+        last_call = time.time()
+
+        try:
+            record = fetch_price_record(base_url, product, size_sku, cover_sku, fabric)
+        except (requests.RequestException, ValueError) as e:
+            record = None
+            log_warning(f"[{i+1}/{len(work)}] {key}: {e}")
+
+        if not record or not record.get('PriceText'):
+            stats['failed'] += 1
+            continue
+
+        prices[key] = {
+            "price": record.get('PriceText'),
+            "old_price": record.get('OldPriceText'),
+            "product_name": record.get('ProductName', ''),
+            "size_name": record.get('SizeName', ''),
+            "specs": record.get('ProductSizeAttributes', []),
+            "sampled": f"{fabric['fabric_sku']}{fabric['color_sku']}",
+            "crawled_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        }
+        stats['priced'] += 1
+        since_checkpoint += 1
+        if since_checkpoint >= PRICE_CHECKPOINT_EVERY:
+            save_price_table(table, output_file)
+            since_checkpoint = 0
+            log_info(f"Checkpoint: {len(prices)} prices saved ({i+1}/{len(work)})")
+
+    table["complete"] = stats['failed'] == 0
+    save_price_table(table, output_file)
+    log_success(f"Saved {output_file} ({len(prices)} prices)")
+    return stats
+
+def save_catalog_snapshot():
+    """Writes fabrics.shards and catalog.snapshot (dictionaries + prebuilt indexes) from the JSON files just saved."""
+    try:
+        catalog, size = build_snapshot(".")
+        log_success(f"Saved {SNAPSHOT_FILE} (catalog {catalog.version}, {size / 1024:.0f} KB)")
+    except Exception as e:
+        # main.py falls back to the JSON files, so this isn't fatal
+        log_warning(f"Could not write {SNAPSHOT_FILE}: {e}")
+
+def run_price_crawl(output_file=PRICE_TABLE_FILE, base_url=BASE_URL, delay=PRICE_CRAWL_DELAY):
+    """Runs Phase 4 on its own, from the JSON files written by Phases 1-3."""
+    log_header("PHASE 4: PRICE MATRIX")
+    try:
+        catalog = []
+        for filename in ("products.json", "sizes.json", "covers.json", "fabrics.json"):
+            with open(filename, "r", encoding='utf-8') as f:
+                catalog.append(json.load(f))
+    except (OSError, json.JSONDecodeError) as e:
+        log_error(f"Could not load catalog files ({e}). Run the full scraper first.")
+        return
+
+    stats = crawl_price_matrix(*catalog, output_file=output_file, base_url=base_url, delay=delay)
+    for label, value in stats.items():
+        log_data(label.replace('_', ' ').capitalize(), value)
+    if stats['failed']:
+        log_warning(f"{stats['failed']} combinations failed - run again to retry them")
+
 
 # --- Main Scraper Logic ---
-def main():
+def main(with_prices=True, output_file=PRICE_TABLE_FILE, base_url=BASE_URL, delay=PRICE_CRAWL_DELAY):
     log_header("SOFAS & STUFF COMPLETE SCRAPER")
     log_info(f"Started: {time.strftime('%Y-%m-%d %H:%M:%S')}")
     log_info("This will scrape ALL products with complete data")
@@ -657,6 +867,8 @@ def main():
         with open("fabrics.json", "w", encoding='utf-8') as f:
             json.dump(all_fabrics, f, indent=4)
         log_success("Saved fabrics.json")
+
+        save_catalog_snapshot()
         
         # Print final statistics
         log_header("FINAL STATISTICS")
@@ -675,6 +887,29 @@ def main():
         
     except Exception as e:
         log_error(f"Failed to write JSON files: {e}")
+        return
+
+    # --- Phase 4: Price every product x size x cover x fabric tier ---
+    if with_prices:
+        run_price_crawl(output_file=output_file, base_url=base_url, delay=delay)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scrape the Sofas & Stuff catalogue and price matrix")
+    parser.add_argument("--prices-only", action="store_true",
+                        help="Only run Phase 4 (price matrix) from existing JSON files; resumes prices.json")
+    parser.add_argument("--skip-prices", action="store_true", help="Skip Phase 4")
+    parser.add_argument("--snapshot-only", action="store_true",
+                        help=f"Only rebuild {SNAPSHOT_FILE} from the existing JSON files")
+    parser.add_argument("--base-url", default=BASE_URL,
+                        help="Price endpoint host, e.g. a local stand-in (default: %(default)s)")
+    parser.add_argument("--delay", type=float, default=PRICE_CRAWL_DELAY,
+                        help="Seconds between price calls (default: %(default)s)")
+    parser.add_argument("--output", default=PRICE_TABLE_FILE, help="Price table file (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.snapshot_only:
+        save_catalog_snapshot()
+    elif args.prices_only:
+        run_price_crawl(output_file=args.output, base_url=args.base_url, delay=args.delay)
+    else:
+        main(with_prices=not args.skip_prices, output_file=args.output, base_url=args.base_url, delay=args.delay)
\ No newline at end of file
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Tests for the /getPrices batch (main.get_prices_logic): upstream lookups
+count against the session rate limit and one batch can't fill
+price_fetch_executor. The S&S call itself is replaced by a slow fake.
+Run with:
+    python -m pytest test_batch_pricing.py    (or: python -m unittest test_batch_pricing)
+"""
+
+import os
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+os.environ.setdefault("CACHE_WARMUP_ON_START", "0")
+
+import main
+
+SESSION = "batch-test"
+QUERIES = [f"alwinton {size} {colour}" for colour in ("pacific", "navy")
+           for size in ("snuggler", "2 seater", "3 seater", "4 seater")]
+
+
+class SlowUpstream:
+    """Stand-in for fetch_price_from_upstream (caches what it returns) that records its peak concurrency."""
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.calls = []
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, resolution, cache_key, query, user_agent='Mozilla/5.0', deadline=None):
+        with self._lock:
+            self.calls.append(cache_key)
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(self.delay)
+        with self._lock:
+            self.running -= 1
+        response = {"price": "£1,000", "stale": False}
+        main.set_to_cache(cache_key, response)
+        return response, 200
+
+
+class BatchPricingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.upstream = SlowUpstream()
+        self.limiter = main.RateLimiter(per_session_limit=5, global_limit=100)
+        for patcher in (mock.patch.object(main, "fetch_price_from_upstream", self.upstream),
+                        mock.patch.object(main, "rate_limiter", self.limiter),
+                        mock.patch.object(main, "price_from_tier", lambda resolution: None),
+                        mock.patch.object(main, "price_store", None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        main.response_cache.clear()
+        self.addCleanup(main.response_cache.clear)
+
+    def post(self, queries):
+        """Runs a batch the way main() does: the request itself is charged first."""
+        self.assertTrue(self.limiter.is_allowed(SESSION)[0])
+        request = SimpleNamespace(path="/getPrices", headers={},
+                                  get_json=lambda: {"queries": queries, "session_id": SESSION})
+        return main.get_prices_logic(request)
+
+    def charged(self):
+        return len(self.limiter.session_requests[SESSION])
+
+    def test_each_upstream_lookup_is_charged(self):
+        response, status = self.post(QUERIES[:3])
+        self.assertEqual(status, 200)
+        self.assertEqual(len(self.upstream.calls), 3)
+        self.assertEqual(self.charged(), 3)
+
+        response, status = self.post(QUERIES[3:6])
+        self.assertEqual((status, response["error_code"]), (429, "E1007"))
+        self.assertEqual(response["details"]["limit_type"], "session")
+        self.assertEqual(len(self.upstream.calls), 3)  # Rejected before any lookup
+        self.assertEqual(self.charged(), 4)
+
+    def test_cached_and_repeated_combinations_are_free(self):
+        self.post(QUERIES[:2])
+        self.upstream.calls.clear()
+        response, status = self.post(QUERIES[:2] * 3)
+        self.assertEqual(status, 200)
+        self.assertEqual(self.upstream.calls, [])
+        self.assertEqual(self.charged(), 3)
+        self.assertEqual([result["status"] for result in response["results"]], [200] * 6)
+
+    def test_batch_concurrency_is_capped(self):
+        self.limiter.per_session_limit = 100
+        response, status = self.post(QUERIES)
+        self.assertEqual(status, 200)
+        self.assertEqual(response["unique_configurations"], len(QUERIES))
+        self.assertEqual(len(self.upstream.calls), len(QUERIES))
+        self.assertLessEqual(self.upstream.peak, main.BATCH_MAX_CONCURRENCY)
+
+
+if __name__ == "__main__":
+    unittest.main()
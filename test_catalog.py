@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Tests for catalog.py fabric storage: fabrics.shards must read back exactly
+what fabrics.json holds, without keeping every record in memory. Run with:
+    python -m pytest test_catalog.py    (or: python -m unittest test_catalog)
+"""
+
+import gc
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from catalog import (FabricShards, SHARDS_FILE, compact_fabrics, file_digests, load_catalog_from_json,
+                     write_fabric_shards)
+from matching import ColorIndex, QueryParser
+
+COLOURS = ["Navy", "Pacific", "Charcoal", "Dove Grey", "Ivory", "Oatmeal", "Sage", "Teal", "Rust", "Blush"]
+FABRICS = ["Sussex Plain", "Kendal Velvet", "Linen Weave", "Herringbone", "Boucle"]
+TIERS = ["Essentials", "Premium", "Luxury"]
+
+
+def fabrics_json(product_count=30, seed=3):
+    """A fabrics.json-shaped dict: shared records, one per-product colour override and a mattress tension."""
+    rng = random.Random(seed)
+    fabrics = {}
+    for product_index in range(product_count):
+        fabric_map = {}
+        for fabric_index, fabric in enumerate(rng.sample(FABRICS, 3)):
+            for colour_index, colour in enumerate(rng.sample(COLOURS, 6)):
+                data = {
+                    "fabric_sku": f"f{FABRICS.index(fabric)}", "color_sku": f"c{COLOURS.index(colour)}",
+                    "fabric_name": fabric, "color_name": colour, "tier": TIERS[FABRICS.index(fabric) % 3],
+                    "desc": f"{fabric} in {colour}. " * 20, "swatch_url": f"https://example.com/{fabric}/{colour}.jpg",
+                    "color_families": [colour.split()[-1].lower()]
+                }
+                fabric_map[f"{fabric} {colour}".lower()] = data
+                fabric_map.setdefault(colour.lower(), data)
+        fabric_map[FABRICS[0].lower()] = dict(next(iter(fabric_map.values())), desc="Only on this product")
+        fabrics[f"p{product_index}"] = fabric_map
+    fabrics["mattress"] = {"soft": "sft", "firm": "frm"}
+    return fabrics
+
+
+class FabricShardsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.fabrics = fabrics_json()
+        cls.path = os.path.join(cls.directory, "fabrics.shards")
+        write_fabric_shards(cls.fabrics, cls.path, "digest")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def setUp(self):
+        self.shards = FabricShards(self.path, max_resident=4)
+
+    def test_reads_back_fabrics_json(self):
+        self.assertEqual(list(self.shards), list(self.fabrics))
+        self.assertEqual(self.shards.source, "digest")
+        for product_sku, fabric_map in self.fabrics.items():
+            loaded = self.shards[product_sku]
+            self.assertEqual(list(loaded), list(fabric_map))
+            for keyword, data in fabric_map.items():
+                expected = data if isinstance(data, str) else {
+                    field: tuple(value) if isinstance(value, list) else value for field, value in data.items()}
+                self.assertEqual(loaded[keyword] if isinstance(data, str) else dict(loaded[keyword]), expected)
+        with self.assertRaises(KeyError):
+            self.shards["missing"]
+
+    def test_records_are_shared_and_loaded_on_demand(self):
+        self.assertEqual(self.shards.stats()["records_in_use"], 0)
+        first, second = self.shards["p0"], self.shards["p1"]
+        shared = set(first) & set(second)
+        self.assertTrue(shared)
+        for keyword in shared:
+            if first[keyword] == second[keyword]:
+                self.assertIs(first[keyword], second[keyword])
+        in_use = self.shards.stats()["records_in_use"]
+        self.assertLess(in_use, self.shards.stats()["records"])
+
+        del first, second
+        self.shards.release()
+        gc.collect()
+        self.assertEqual(self.shards.stats()["records_in_use"], 0)
+
+    def test_color_columns_and_keywords_dont_load_products(self):
+        columns = self.shards.color_columns()
+        record_ids = columns["products"]["p2"]
+        self.assertEqual(columns["products"]["mattress"], [])
+        self.assertEqual(set(self.shards.keywords()), {k for m in self.fabrics.values() for k in m})
+        self.assertEqual(self.shards.stats()["resident"], 0)
+
+        records = {id(data): data for data in self.shards["p2"].values()}
+        self.assertEqual(len(record_ids), len(records))
+        for record_id in record_ids:
+            record = self.shards.record(record_id)
+            self.assertIn(id(record), records)
+            for field in ("fabric_sku", "color_sku", "fabric_name", "color_name", "tier"):
+                self.assertEqual(columns[field][record_id], record.get(field))
+            self.assertEqual(columns["color_families"][record_id], list(record["color_families"]))
+        with self.assertRaises(KeyError):
+            self.shards.record(self.shards.stats()["records"])
+
+    def test_color_index_matches_in_memory_fabrics(self):
+        in_memory = ColorIndex(compact_fabrics(self.fabrics))
+        sharded = ColorIndex(self.shards)
+        self.assertEqual(sharded.size, in_memory.size)
+        for color in ("navy", "grey", "blue", "a", "e g", "zz", ""):
+            for product_sku in (None, "p0", "p7", "mattress"):
+                self.assertEqual(sharded.search(color, product_sku), in_memory.search(color, product_sku))
+        self.assertEqual(self.shards.stats()["resident"], 0)
+
+    def test_query_parser_matches_in_memory_fabrics(self):
+        products = {f"product{i}": {"sku": f"p{i}", "type": "sofa", "full_name": f"Product{i}"} for i in range(30)}
+        sizes = {f"p{i}": {"3 seater": "3se"} for i in range(30)}
+        in_memory = QueryParser(products, sizes, {}, compact_fabrics(self.fabrics))
+        sharded = QueryParser(products, sizes, {}, self.shards)
+        self.assertEqual(sharded.stop_words, in_memory.stop_words)
+        rng = random.Random(5)
+        for _ in range(200):
+            product = rng.randrange(30)
+            fabric_words = rng.choice([["navy"], ["sussex", "plain", "teal"], ["dove", "grey"], ["velvet"], ["gre"]])
+            query = " ".join([f"product{product}", "3", "seater", "in"] + fabric_words)
+            expected, actual = in_memory.parse(query), sharded.parse(query)
+            self.assertEqual((actual.ok, actual.error_code), (expected.ok, expected.error_code), query)
+            if expected.ok:
+                self.assertEqual(actual.sku_tuple(), expected.sku_tuple(), query)
+
+
+class ShardedCatalogLoadTest(unittest.TestCase):
+    """load_catalog_from_json over fabrics.shards reads no fabric record or product shard."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        fabrics = fabrics_json()
+        catalog_files = {
+            "products.json": {f"product{i}": {"sku": f"p{i}", "type": "sofa", "full_name": f"Product{i}",
+                                              "price": "1000"} for i in range(30)},
+            "sizes.json": {f"p{i}": {"3 seater": "3se"} for i in range(30)},
+            "covers.json": {},
+            "fabrics.json": fabrics,
+        }
+        for filename, data in catalog_files.items():
+            with open(os.path.join(self.directory, filename), "w", encoding="utf-8") as f:
+                json.dump(data, f)
+        write_fabric_shards(fabrics, os.path.join(self.directory, SHARDS_FILE),
+                            file_digests(self.directory)["fabrics.json"])
+
+    def test_cold_start_parses_no_records(self):
+        with mock.patch.object(FabricShards, "_record", autospec=True, side_effect=FabricShards._record) as record, \
+                mock.patch.object(FabricShards, "_shard", autospec=True, side_effect=FabricShards._shard) as shard:
+            catalog = load_catalog_from_json(self.directory)
+            self.assertIsInstance(catalog.fabrics, FabricShards)
+            self.assertEqual((record.call_count, shard.call_count), (0, 0))
+            self.assertGreater(catalog.color_index.size, 0)
+
+            results = catalog.color_index.search("navy", "p3")
+            self.assertTrue(results)
+            self.assertEqual(record.call_count, len(results))  # Only the matched records, per search
+        self.assertEqual(catalog.fabrics.stats()["resident"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Tests for matching.py
+
+Checks the compiled matchers against the reference implementations they
+replace. Run with:
+    python -m pytest test_matching.py    (or: python -m unittest test_matching)
+"""
+
+import json
+import os
+import random
+import time
+import unittest
+
+from fuzzywuzzy import fuzz
+
+from matching import ColorIndex, FuzzyIndex, KeywordMatcher, ProductPriceIndex, regex_find_matches
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def reference_matches(query, mapping):
+    """Baseline find_best_matches exact/prefix step: regex scan, sorted by confidence."""
+    matches = regex_find_matches(query, mapping)
+    matches.sort(key=lambda x: x[2], reverse=True)
+    return matches
+
+
+def brute_force_fuzzy(query, mapping, fuzziness=85, leading_words=False):
+    """
+    FuzzyIndex.match without the index: fuzz.ratio of every query window
+    against every keyword (and leading-words text), with the same rules -
+    equal digits, MIN_LENGTH, and a trigram Dice overlap of MIN_OVERLAP.
+    """
+    digits = lambda text: ''.join(ch for ch in text if ch.isdigit())
+    trigrams = lambda text: {f" {text} "[i:i + 3] for i in range(len(text))}
+    full_texts = {keyword.lower() for keyword in mapping}
+    entries = []
+    for order, keyword in enumerate(mapping):
+        words = keyword.lower().split()
+        texts = [keyword.lower()]
+        if leading_words:
+            texts += [' '.join(words[:count]) for count in range(1, len(words))
+                      if ' '.join(words[:count]) not in full_texts]
+        entries += [(order, text) for text in texts if len(text) >= FuzzyIndex.MIN_LENGTH]
+
+    words = query.lower().split()
+    counts = {len(text.split()) for _, text in entries}
+    windows = [' '.join(words[start:start + count]) for count in counts
+               for start in range(len(words) - count + 1)]
+    best = {}
+    for window in windows:
+        if len(window) < FuzzyIndex.MIN_LENGTH:
+            continue
+        for order, text in entries:
+            if digits(text) != digits(window):
+                continue
+            window_grams, text_grams = trigrams(window), trigrams(text)
+            if 2 * len(window_grams & text_grams) / (len(window_grams) + len(text_grams)) < FuzzyIndex.MIN_OVERLAP:
+                continue
+            score = fuzz.ratio(window, text)
+            if score >= fuzziness and score > best.get(order, -1):
+                best[order] = score
+    keywords = list(mapping)
+    matches = [(keywords[order], mapping[keywords[order]], best[order]) for order in sorted(best)]
+    matches.sort(key=lambda x: x[2], reverse=True)
+    return matches
+
+
+def typo(text, rng):
+    """One random edit: deletion, insertion, substitution or transposition."""
+    i = rng.randrange(len(text))
+    letter = rng.choice("abcdefghijklmnopqrstuvwxyz")
+    edit = rng.randrange(4)
+    if edit == 0:
+        return text[:i] + text[i + 1:]
+    if edit == 1:
+        return text[:i] + letter + text[i:]
+    if edit == 2:
+        return text[:i] + letter + text[i + 1:]
+    return text[:i] + text[i + 1:i + 2] + text[i:i + 1] + text[i + 2:]
+
+
+def fabric_map(fabric_count=40, colour_count=15):
+    """A fabric keyword map the size of a real product's (fabric, colour and 'fabric colour' keywords)."""
+    rng = random.Random(5)
+    syllables = ["sus", "sex", "ken", "dal", "lin", "en", "vel", "vet", "her", "ring", "bone", "mar", "lo", "wool",
+                 "chen", "ille", "bou", "cle", "tweed", "brush", "cot", "ton", "plain", "weave"]
+    colours = ["navy", "pacific", "charcoal", "dove grey", "ivory", "oatmeal", "sage", "ochre", "rust", "teal",
+               "denim", "slate", "blush", "mustard", "forest"]
+    mapping = {}
+    for fabric_index in range(fabric_count):
+        fabric = "".join(rng.sample(syllables, 2)) + " " + "".join(rng.sample(syllables, 2))
+        mapping[fabric] = {"fabric_sku": f"f{fabric_index}"}
+        for colour in colours[:colour_count]:
+            mapping[f"{fabric} {colour}"] = {"fabric_sku": f"f{fabric_index}", "color_sku": colour}
+            mapping.setdefault(colour, {"color_sku": colour})
+    return mapping
+
+
+class KeywordMatcherTest(unittest.TestCase):
+    """KeywordMatcher must score exactly like the per-keyword regex scan."""
+
+    MAPPING = {
+        "alwinton": "alw",
+        "alwinton snuggler": "alw-snu",
+        "snug": "snu",
+        "snuggler": "snu",
+        "3 seater": "3se",
+        "3 seater sofa": "3so",
+        "3.5 seater": "35s",
+        "super king": "sk",
+        "king": "k",
+        "a-b": "ab",
+        "co.": "co",
+        "o'neill": "on",
+        "_under": "u",
+        "x": "x",
+        "café": "caf",
+        "İstanbul": "ist",  # Lowercases to a longer string: regex fallback path
+    }
+
+    def assert_same(self, query, mapping):
+        expected = reference_matches(query, mapping)
+        self.assertEqual(KeywordMatcher(mapping).match(query), expected, f"query {query!r}")
+
+    def test_overlapping_keywords(self):
+        for query in ("alwinton snuggler", "alwinton snug", "snuggler alwinton", "alwintonsnuggler",
+                      "super king", "kingsize", "super kings", "3 seater sofa", "3 seaters", "3.5 seater"):
+            self.assert_same(query, self.MAPPING)
+
+    def test_punctuation_and_boundaries(self):
+        for query in ("a-b", "a-bc", "xa-b", "co.", "co.uk", "co", "o'neill's", "(alwinton)", "alwinton,",
+                      "3.5", "3-seater", "_under", "x_under", "__under", "x", "x-x", "café", "cafés",
+                      "", " ", "-", "istanbul", "İstanbul", "ISTANBUL"):
+            self.assert_same(query, self.MAPPING)
+
+    def test_case_insensitive(self):
+        for query in ("ALWINTON Snuggler", "Super KING", "CAFÉ", "Co."):
+            self.assert_same(query, self.MAPPING)
+
+    def test_random_queries(self):
+        rng = random.Random(7)
+        keywords = list(self.MAPPING)
+        glue = [" ", "", "-", ".", ",", "'", "_", "  ", "/"]
+        for _ in range(3000):
+            parts = []
+            for _ in range(rng.randint(1, 4)):
+                keyword = rng.choice(keywords)
+                if rng.random() < 0.3:
+                    keyword = keyword[:rng.randint(1, len(keyword))]
+                if rng.random() < 0.2:
+                    keyword = keyword.upper()
+                parts.append(keyword)
+            query = "".join(part + rng.choice(glue) for part in parts)
+            self.assert_same(query, self.MAPPING)
+
+    def test_catalog_products(self):
+        with open(os.path.join(HERE, "products.json"), "r", encoding="utf-8") as f:
+            products = json.load(f)
+        rng = random.Random(11)
+        keywords = list(products)
+        for _ in range(300):
+            words = " ".join(rng.choice(keywords) for _ in range(rng.randint(1, 3))).split()
+            if rng.random() < 0.5:
+                words = words[rng.randint(0, len(words) - 1):]
+            self.assert_same(" ".join(words), products)
+
+
+class FuzzyIndexTest(unittest.TestCase):
+    """FuzzyIndex must find what scoring every eligible keyword with fuzz.ratio finds."""
+
+    @classmethod
+    def setUpClass(cls):
+        with open(os.path.join(HERE, "products.json"), "r", encoding="utf-8") as f:
+            cls.products = json.load(f)
+        with open(os.path.join(HERE, "sizes.json"), "r", encoding="utf-8") as f:
+            cls.sizes = json.load(f)
+        cls.fabrics = fabric_map()
+
+    def assert_brute_force(self, mapping, queries, leading_words=False):
+        index = FuzzyIndex(mapping, leading_words=leading_words)
+        for query in queries:
+            self.assertEqual(index.match(query), brute_force_fuzzy(query, mapping, leading_words=leading_words),
+                             f"query {query!r}")
+
+    def typo_queries(self, mapping, count, seed):
+        rng = random.Random(seed)
+        keywords = [keyword for keyword in mapping if len(keyword) >= FuzzyIndex.MIN_LENGTH]
+        return [typo(rng.choice(keywords), rng) for _ in range(count)]
+
+    def test_products_match_brute_force(self):
+        self.assert_brute_force(self.products, self.typo_queries(self.products, 400, 1))
+
+    def test_sizes_match_brute_force(self):
+        for product_sku in list(self.sizes)[:40]:
+            self.assert_brute_force(self.sizes[product_sku], self.typo_queries(self.sizes[product_sku], 10, 2),
+                                    leading_words=True)
+
+    def test_fabrics_match_brute_force(self):
+        self.assert_brute_force(self.fabrics, self.typo_queries(self.fabrics, 150, 3), leading_words=True)
+
+    def test_digits_must_match(self):
+        sizes = {"3 seater sofa": "3se", "4 seater sofa": "4se", "2.5 seater": "25s"}
+        index = FuzzyIndex(sizes, leading_words=True)
+        self.assertEqual([m[1] for m in index.match("3 seeter sofa")], ["3se"])
+        self.assertEqual(index.match("5 seater sofa"), [])
+        self.assertEqual(index.match("4 seeter"), [("4 seater sofa", "4se", 88)])
+
+    def test_digit_variants_dont_crowd_out_the_match(self):
+        # 20 keywords closer to the query's spelling than the right one, but
+        # with other digits - more than max_candidates
+        sizes = {f"chesterfeld {number} seeter": number for number in range(10, 30)}
+        sizes["chesterfield 3 seater"] = 3
+        index = FuzzyIndex(sizes)
+        self.assertEqual(index.match("chesterfeld 3 seeter"), [("chesterfield 3 seater", 3, 93)])
+
+    def test_thresholds(self):
+        index = FuzzyIndex({"alwinton": "alw", "sofa": "sof"})
+        self.assertEqual(index.match("alwintn"), [("alwinton", "alw", 93)])
+        self.assertEqual(index.match("alwintn", fuzziness=95), [])
+        self.assertEqual(index.match("sfa"), [])  # Shorter than MIN_LENGTH
+        self.assertEqual(index.match("xyzw"), [])
+
+    def test_benchmark_under_1ms_per_query(self):
+        index = FuzzyIndex(self.fabrics, leading_words=True)
+        queries = self.typo_queries(self.fabrics, 500, 4)
+        started = time.perf_counter()
+        for query in queries:
+            index.match(query)
+        per_query_ms = (time.perf_counter() - started) / len(queries) * 1000
+        print(f"\nFuzzyIndex: {per_query_ms:.3f} ms/query on {len(self.fabrics)} fabric keywords")
+        self.assertLess(per_query_ms, 1.0)
+
+
+class ColorIndexTest(unittest.TestCase):
+    """ColorIndex.search must find every colour name containing the query (the old linear scan)."""
+
+    def test_substrings_match_linear_scan(self):
+        fabrics = {keyword: {**data, "color_name": data["color_sku"].title()}
+                   for keyword, data in fabric_map().items() if "fabric_sku" in data and "color_sku" in data}
+        offered = {"alw": fabrics, "rye": dict(list(fabrics.items())[:100])}
+        index = ColorIndex(offered)
+        names = sorted({data["color_sku"] for data in fabrics.values()})
+        rng = random.Random(9)
+        queries = ["", "a", "navy", "dove grey", "ove gr", "zzz", "e g"]
+        for _ in range(200):
+            name = rng.choice(names)
+            start = rng.randrange(len(name))
+            queries.append(name[start:rng.randint(start + 1, len(name))])
+        for query in queries:
+            for product_sku in ("alw", "rye"):
+                # Drop colour-family matches ("navy" also returns teal, denim, ...)
+                found = {(record["fabric_sku"], record["color_sku"]) for record in index.search(query, product_sku)
+                         if query in record["color_name"].lower()}
+                expected = {(data["fabric_sku"], data["color_sku"]) for data in offered[product_sku].values()
+                            if query in data["color_name"].lower()}
+                self.assertEqual(found, expected, f"query {query!r}")
+
+
+class ProductPriceIndexTest(unittest.TestCase):
+    """Keyword-filtered searches must return what filtering the whole price-sorted list returns."""
+
+    def test_keyword_filter_matches_linear_filter(self):
+        with open(os.path.join(HERE, "products.json"), "r", encoding="utf-8") as f:
+            products = json.load(f)
+        index = ProductPriceIndex(products)
+        rows = []  # (price, keyword) in the index's order: price, then mapping order
+        for keyword, product_data in products.items():
+            try:
+                rows.append((int(product_data.get("price", 999999)), keyword))
+            except (TypeError, ValueError):
+                continue
+        rows.sort(key=lambda row: row[0])
+        keywords = list(products)
+        rng = random.Random(13)
+        for _ in range(300):
+            chosen = set(rng.sample(keywords, rng.choice((1, 3, 20, 200)))) | {"no such keyword"}
+            product_type = rng.choice(("all", "sofa", "chair", "bed"))
+            max_price = rng.choice((500, 1500, 3000, 10 ** 9))
+            limit = rng.choice((1, 5, 20))
+            expected = [keyword for price, keyword in rows if keyword in chosen and price <= max_price
+                        and product_type in ("all", products[keyword].get("type"))]
+            results, truncated = index.search(max_price, product_type, keywords=chosen, limit=limit)
+            self.assertEqual([result["sku"] for result in results], [products[k].get("sku") for k in expected[:limit]])
+            self.assertEqual([result["base_price"] for result in results],
+                             [int(products[k]["price"]) for k in expected[:limit]])
+            self.assertEqual(truncated, len(expected) > limit)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Tests for the offline price matrix crawl (sku_discovery_tool Phase 4) and
+how main.PriceTable reads its output. The S&S price endpoints are replaced
+by a local HTTP server. Run with:
+    python -m pytest test_price_crawl.py    (or: python -m unittest test_price_crawl)
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs
+
+os.environ.setdefault("CACHE_WARMUP_ON_START", "0")
+
+import sku_discovery_tool as tool
+from main import PriceTable
+
+PRODUCTS = {
+    "alwinton": {"sku": "alw", "type": "sofa", "url": "/alwinton"},
+    "rye": {"sku": "rye", "type": "chair", "url": "/rye"},
+    "dream": {"sku": "drm", "type": "mattress", "url": "/dream"},  # Never priced
+}
+SIZES = {"alw": {"snuggler": "snu", "3 seater": "3se"}, "rye": {"chair": "chr"}}
+COVERS = {"alw": {"fitted": "fit", "loose": "lse"}}  # rye has none: priced as "fit"
+FABRICS = {
+    product_sku: {
+        "pacific": {"fabric_sku": "sus", "color_sku": "pac", "tier": "1"},
+        "navy": {"fabric_sku": "sus", "color_sku": "nav", "tier": "1"},
+        "mink": {"fabric_sku": "vel", "color_sku": "mnk", "tier": "2"},
+    }
+    for product_sku in ("alw", "rye")
+}
+# alw: 2 sizes x 2 covers x 2 tiers, rye: 1 x 1 x 2
+COMBINATIONS = 10
+
+
+def timestamp(seconds_ago=0):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() - seconds_ago))
+
+
+class PriceServer(ThreadingHTTPServer):
+    """Stand-in for /ProductExtend/ChangeProductSize. Query SKUs in `failing` get a 404."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), PriceHandler)
+        self.calls = []
+        self.failing = set()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+
+class PriceHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        query_sku = form["querySku"][0]
+        self.server.calls.append(query_sku)
+        if self.path != tool.SOFA_API_PATH or query_sku in self.server.failing:
+            self.send_response(404)
+            self.end_headers()
+            return
+        record = {"PriceText": f"£{len(query_sku) * 100}", "OldPriceText": None,
+                  "ProductName": form["sku"][0], "SizeName": query_sku, "ProductSizeAttributes": []}
+        body = json.dumps({"success": True, "result": {"ProductSkuRecord": record}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CrawlPriceMatrixTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output = os.path.join(self.directory, "prices.json")
+        self.server = PriceServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def crawl(self):
+        return tool.crawl_price_matrix(PRODUCTS, SIZES, COVERS, FABRICS, output_file=self.output,
+                                       base_url=self.server.base_url, delay=0)
+
+    def saved(self):
+        with open(self.output, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def test_full_crawl(self):
+        stats = self.crawl()
+        self.assertEqual(stats, {"combinations": COMBINATIONS, "already_priced": 0, "priced": COMBINATIONS, "failed": 0})
+        table = self.saved()
+        self.assertTrue(table["complete"])
+        self.assertEqual(table["version"], tool.PRICE_TABLE_VERSION)
+        entry = table["prices"]["alw|3se|lse|2"]
+        self.assertEqual(entry["sampled"], "velmnk")
+        self.assertEqual(entry["size_name"], "alw3selsevelmnk")
+        self.assertEqual(table["prices"]["rye|chr|fit|1"]["sampled"], "suspac")
+        self.assertEqual(table["generated_at"], min(e["crawled_at"] for e in table["prices"].values()))
+
+    def test_resume_retries_only_failures(self):
+        self.server.failing = {"alwsnufitsuspac", "ryechrfitvelmnk"}
+        stats = self.crawl()
+        self.assertEqual((stats["priced"], stats["failed"]), (COMBINATIONS - 2, 2))
+        self.assertFalse(self.saved()["complete"])
+
+        self.server.failing = set()
+        self.server.calls.clear()
+        stats = self.crawl()
+        self.assertEqual(sorted(self.server.calls), ["alwsnufitsuspac", "ryechrfitvelmnk"])
+        self.assertEqual((stats["already_priced"], stats["priced"], stats["failed"]), (COMBINATIONS - 2, 2, 0))
+        self.assertTrue(self.saved()["complete"])
+
+    def test_checkpoint_survives_a_crash(self):
+        real_fetch = tool.fetch_price_record
+        calls = []
+
+        def crash_after_five(*args):
+            if len(calls) == 5:
+                raise KeyboardInterrupt
+            calls.append(args)
+            return real_fetch(*args)
+
+        with mock.patch.object(tool, "PRICE_CHECKPOINT_EVERY", 2), \
+                mock.patch.object(tool, "fetch_price_record", crash_after_five):
+            with self.assertRaises(KeyboardInterrupt):
+                self.crawl()
+        self.assertEqual(len(self.saved()["prices"]), 4)  # Last checkpoint, not the 5th price
+        self.assertFalse(os.path.exists(f"{self.output}.tmp"))
+
+        self.server.calls.clear()
+        stats = self.crawl()
+        self.assertEqual((stats["already_priced"], stats["priced"]), (4, COMBINATIONS - 4))
+        self.assertEqual(len(self.server.calls), COMBINATIONS - 4)
+
+    def test_resume_recrawls_expired_entries_and_keeps_oldest_time(self):
+        self.crawl()
+        table = self.saved()
+        old = timestamp(tool.PRICE_MAX_AGE + 60)
+        kept = timestamp(3600)
+        table["prices"]["alw|snu|fit|1"]["crawled_at"] = old
+        table["prices"]["rye|chr|fit|2"]["crawled_at"] = kept
+        with open(self.output, "w", encoding="utf-8") as f:
+            json.dump(table, f)
+
+        self.server.calls.clear()
+        self.crawl()
+        self.assertEqual(self.server.calls, ["alwsnufitsuspac"])
+        table = self.saved()
+        self.assertGreater(table["prices"]["alw|snu|fit|1"]["crawled_at"], old)
+        self.assertEqual(table["generated_at"], kept)  # Not the time of the resumed run
+
+    def test_old_version_starts_fresh(self):
+        with open(self.output, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "generated_at": timestamp(), "prices": {"alw|snu|fit|1": {"price": "£1"}}}, f)
+        stats = self.crawl()
+        self.assertEqual((stats["already_priced"], stats["priced"]), (0, COMBINATIONS))
+
+
+class PriceTableTest(unittest.TestCase):
+    """main.PriceTable checks age per entry."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "prices.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write(self, table):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(table, f)
+
+    def test_expired_entries_are_skipped(self):
+        self.write({"version": 2, "generated_at": timestamp(10 * 86400), "complete": True, "prices": {
+            "alw|snu|fit|1": {"price": "£1", "crawled_at": timestamp(10 * 86400)},
+            "alw|snu|fit|2": {"price": "£2", "crawled_at": timestamp(60)},
+        }})
+        table = PriceTable(self.path, max_age=7 * 86400)
+        self.assertEqual(list(table.prices), ["alw|snu|fit|2"])
+        self.assertFalse(table.complete)
+        self.assertGreater(table.age(), 9 * 86400)
+        self.assertEqual(PriceTable(self.path).prices.keys(), {"alw|snu|fit|1", "alw|snu|fit|2"})
+
+    def test_entries_without_crawl_time_use_generated_at(self):
+        self.write({"version": 1, "generated_at": timestamp(10 * 86400), "prices": {"alw|snu|fit|1": {"price": "£1"}}})
+        self.assertEqual(len(PriceTable(self.path, max_age=7 * 86400)), 0)
+        self.write({"version": 1, "generated_at": timestamp(60), "prices": {"alw|snu|fit|1": {"price": "£1"}}})
+        self.assertEqual(len(PriceTable(self.path, max_age=7 * 86400)), 1)
+
+    def test_missing_file(self):
+        table = PriceTable(os.path.join(self.directory, "missing.json"), max_age=60)
+        self.assertEqual((len(table), table.age()), (0, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Tests for the SQLite L2 price cache (main.PriceStore) and how
+get_from_cache reads through it. Each test uses its own temp directory.
+Run with:
+    python -m pytest test_price_store.py    (or: python -m unittest test_price_store)
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+os.environ.setdefault("CACHE_WARMUP_ON_START", "0")
+
+import main
+from main import PriceStore
+
+
+class PriceStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "prices.sqlite3")
+        self.store = PriceStore(self.path, ttl=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def age(self, key, seconds):
+        """Backdates a stored entry."""
+        self.store._conn.execute("UPDATE prices SET stored_at = ? WHERE cache_key = ?",
+                                 (time.time() - seconds, key))
+        self.store._conn.commit()
+
+    def test_round_trip(self):
+        self.store.set("k", {"price": "£1,299", "sku": "alw"})
+        value, age = self.store.get("k")
+        self.assertEqual(value, {"price": "£1,299", "sku": "alw"})
+        self.assertLess(age, 5)
+        self.assertEqual(self.store.get("missing"), (None, None))
+        self.assertEqual((self.store.hits, self.store.misses, self.store.writes), (1, 1, 1))
+
+    def test_set_replaces(self):
+        self.store.set("k", {"price": 1})
+        self.store.set("k", {"price": 2})
+        self.assertEqual(self.store.get("k")[0], {"price": 2})
+        self.assertEqual(self.store.stats()["entries"], 1)
+
+    def test_survives_reopen(self):
+        self.store.set("k", {"price": 1})
+        reopened = PriceStore(self.path, ttl=60)
+        self.assertEqual(reopened.get("k")[0], {"price": 1})
+
+    def test_expired_entries(self):
+        self.store.set("old", {"price": 1})
+        self.store.set("new", {"price": 2})
+        self.age("old", 61)
+        self.assertEqual(self.store.get("old"), (None, None))
+        self.assertEqual(self.store.purge_expired(), 1)
+        self.assertEqual(self.store.stats()["entries"], 1)
+
+    def test_clear(self):
+        for key in ("a", "b", "c"):
+            self.store.set(key, {"price": key})
+        self.assertEqual(self.store.clear(), 3)
+        self.assertEqual(self.store.get("a"), (None, None))
+
+    def test_unserializable_value_is_not_raised(self):
+        self.store.set("k", {"price": object()})
+        self.assertEqual(self.store.errors, 1)
+        self.assertEqual(self.store.get("k"), (None, None))
+
+
+class GetFromCacheL2Test(unittest.TestCase):
+    """get_from_cache with an L2 store and an empty L1."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = PriceStore(os.path.join(self.directory, "prices.sqlite3"), ttl=main.CACHE_HARD_TTL)
+        patcher = mock.patch.object(main, "price_store", self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        main.response_cache.clear()
+        self.addCleanup(main.response_cache.clear)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def store_aged(self, key, value, seconds):
+        self.store.set(key, value)
+        self.store._conn.execute("UPDATE prices SET stored_at = ? WHERE cache_key = ?",
+                                 (time.time() - seconds, key))
+        self.store._conn.commit()
+
+    def test_fresh_hit_is_promoted_to_l1(self):
+        self.store_aged("k", {"price": 1}, 10)
+        self.assertEqual(main.get_from_cache("k"), {"price": 1})
+        self.assertEqual(main.response_cache.get("k"), {"price": 1})
+
+    def test_stale_hit_only_when_allowed(self):
+        self.store_aged("k", {"price": 1}, main.CACHE_TTL + 10)
+        self.assertIsNone(main.get_from_cache("k"))
+        self.assertEqual(main.get_from_cache("k", allow_stale=True), {"price": 1, "stale": True})
+        self.assertIsNone(main.response_cache.get("k"))
+
+    def test_never_served_past_hard_ttl(self):
+        self.store.ttl = 86400  # A longer PRICE_CACHE_DB_TTL still doesn't serve it
+        self.store_aged("k", {"price": 1}, main.CACHE_HARD_TTL + 10)
+        self.assertIsNone(main.get_from_cache("k", allow_stale=True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Tests for how main.fetch_price_from_upstream treats upstream timeouts: one
+caused by a short client deadline must not count against the circuit
+breaker or be negative-cached for everyone else. The S&S price API is
+replaced by a slow local HTTP server. Also covers main.HedgePool. Run with:
+    python -m pytest test_upstream_deadline.py    (or: python -m unittest test_upstream_deadline)
+"""
+
+import os
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+
+os.environ.setdefault("CACHE_WARMUP_ON_START", "0")
+
+import main
+
+RESOLUTION = SimpleNamespace(
+    product={"url": "alwinton"}, product_sku="alw", product_type="sofa", size_sku="snu", cover_sku="fit",
+    fabric={"fabric_sku": "sus", "color_sku": "pac", "tier": "1"},
+)
+CACHE_KEY = "alw|snu|fit|sus|pac"
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    """Answers every POST after server.delay seconds."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(self.server.delay)
+        body = b'{"success": false}'
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            pass  # The client gave up
+
+    def log_message(self, format, *args):
+        pass
+
+
+class UpstreamDeadlineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+        self.server.delay = 2
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        url = f"http://127.0.0.1:{self.server.server_address[1]}/ProductExtend/ChangeProductSize"
+        self.breaker = main.CircuitBreaker("test_api", failure_threshold=1)
+        for patcher in (mock.patch.object(main, "SOFA_API_URL", url),
+                        mock.patch.object(main, "upstream_breakers", {url: self.breaker}),
+                        mock.patch.object(main, "HEDGE_ENABLED", False)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        main.response_cache.clear()
+        main.negative_cache.clear()
+        self.addCleanup(main.negative_cache.clear)
+
+    def fetch(self, deadline):
+        return main.fetch_price_from_upstream(RESOLUTION, CACHE_KEY, "alwinton snuggler pacific", deadline=deadline)
+
+    def test_short_header_deadline_leaves_shared_state_alone(self):
+        request = SimpleNamespace(path="/getPrice", headers={main.DEADLINE_HEADER: "1000"})
+        deadline = main.get_request_deadline(request)
+        response, status = self.fetch(deadline)
+        self.assertEqual((status, response["error_code"]), (504, "E1009"))
+        self.assertEqual((self.breaker.state, self.breaker.consecutive_failures), (main.CircuitBreaker.CLOSED, 0))
+        self.assertFalse(self.breaker.probe_in_flight)
+        self.assertIsNone(main.negative_cache.get(main.negative_sku_key(CACHE_KEY)))
+
+    def test_breaker_timeout_still_counts(self):
+        with mock.patch.object(self.breaker, "timeout", return_value=0.5):
+            response, status = self.fetch(None)
+        self.assertEqual(status, 504)
+        self.assertEqual(self.breaker.state, main.CircuitBreaker.OPEN)
+        self.assertEqual(main.negative_cache.get(main.negative_sku_key(CACHE_KEY)), (response, 504))
+
+
+class HedgePoolTest(unittest.TestCase):
+    """A full hedge pool never queues: post_upstream then calls directly."""
+
+    def test_full_pool_refuses_work(self):
+        pool = main.HedgePool(max_workers=1)
+        release = threading.Event()
+        first = pool.try_submit(release.wait, 5)
+        self.assertIsNotNone(first)
+        self.assertIsNone(pool.try_submit(time.sleep, 0))
+        self.assertEqual(pool.saturated, 1)
+        release.set()
+        first.result(timeout=5)
+        time.sleep(0.05)  # Done callbacks free the slot
+        self.assertIsNotNone(pool.try_submit(time.sleep, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()